@@ -13,9 +13,15 @@ Contacto: https://github.com/Cristian-Soto
 ===============================================
 """
 
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from .routers import upload, chat
+from .services.readiness import service_readiness
+from .services.llm_service import local_llm_service
+from .services.vector_store import vector_db
+from .services.pdf_processing import shutdown_extraction_pool
 
 app = FastAPI(
     title="Copiloto Conversacional API",
@@ -36,6 +42,24 @@ app.add_middleware(
 app.include_router(upload.router, prefix="", tags=["upload"])
 app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
 
+@app.on_event("startup")
+async def start_warmup():
+    # Los modelos y clientes se cargan de forma perezosa; el warm-up los prepara en segundo plano
+    if os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true":
+        service_readiness.start_background_warmup()
+    # Ping periódico que mantiene el modelo de Ollama residente en los periodos de inactividad
+    local_llm_service.start_keep_warm()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    local_llm_service.stop_keep_warm()
+    # Cerrar el pool de conexiones keep-alive con Ollama
+    await local_llm_service.ollama_client.aclose()
+    # Guardar vectores e índice HNSW pendientes del backend local
+    vector_db.close()
+    # Detener los procesos de extracción de PDF
+    shutdown_extraction_pool()
+
 @app.get("/")
 async def root():
     return {"message": "Copiloto Conversacional API está funcionando"}
@@ -43,3 +67,9 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 cuando el modelo de embeddings y ChromaDB están listos, 503 si no."""
+    readiness = service_readiness.get_readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
@@ -1,22 +1,52 @@
 # chat.py
-# Router para endpoints de chat con documentos usando LangChain
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+# Router para endpoints de chat con documentos usando Ollama
+from fastapi import APIRouter, HTTPException, Header, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
+from datetime import datetime
+import asyncio
+import json
+import os
+import time
 from ..services.embeddings import document_embedding_manager
-from ..services.vector_store import vector_db
-from ..services.retrieval import contextual_retriever
+from ..services.vector_store import vector_db, DEFAULT_FRAGMENT_FIELDS
+from ..services.retrieval import contextual_retriever, RETRIEVAL_MODES
+from ..services.lexical_index import lexical_index
+from ..services.reranker import cross_encoder_reranker
+from ..services.document_catalog import document_catalog
+from ..services.deletion_jobs import deletion_job_manager
+from ..services.query_batcher import query_embedding_batcher
 from ..services.llm_service import local_llm_service
+from ..services.context_packer import context_packer
+from ..services.conversation_memory import conversation_memory
+from ..services.answer_cache import answer_cache
 from ..services.summarizer import document_summarizer
 from ..services.topic_classifier import topic_classifier
 
 router = APIRouter()
 
+# A partir de cuántos IDs un borrado de fragmentos se ejecuta en segundo plano
+FRAGMENT_DELETE_BACKGROUND_THRESHOLD = int(os.getenv("FRAGMENT_DELETE_BACKGROUND_THRESHOLD", "5000"))
+
+class SearchFilters(BaseModel):
+    filenames: Optional[List[str]] = None
+    document_ids: Optional[List[str]] = None  # document_hash de los documentos
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+
 class ChatRequest(BaseModel):
     question: str
     max_results: int = 5
     similarity_threshold: float = 0.5
+    session_id: Optional[str] = None  # Memoria de conversación por sesión
+    retrieval_mode: Optional[str] = None  # vector, hybrid o lexical (por defecto RETRIEVAL_MODE)
+    filters: Optional[SearchFilters] = None  # Acota la búsqueda a documentos, páginas o fechas
+    rerank: Optional[bool] = None  # Reordenar con cross-encoder (por defecto RERANK_ENABLED)
+    diversify: Optional[bool] = None  # MMR y fusión de fragmentos contiguos (por defecto DIVERSIFY_RESULTS)
 
 class ChatResponse(BaseModel):
     question: str
@@ -25,6 +55,8 @@ class ChatResponse(BaseModel):
     confidence_score: float
     llm_used: str
     method: str
+    session_id: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
 
 class SummaryRequest(BaseModel):
     document_id: Optional[str] = None
@@ -50,15 +82,63 @@ class ComparisonRequest(BaseModel):
     doc2_query: str
     max_results: int = 3
 
+def build_relevant_documents(context_fragments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Información resumida de los fragmentos usados como contexto."""
+    relevant_docs = []
+    for fragment in context_fragments:
+        doc_info = {
+            "filename": fragment.get("metadata", {}).get("filename", "documento_desconocido"),
+            "similarity_score": fragment.get("similarity_score", 0.0),
+            "content_preview": fragment.get("content", "")[:200] + "..." if len(fragment.get("content", "")) > 200 else fragment.get("content", ""),
+            "page": fragment.get("metadata", {}).get("page", fragment.get("metadata", {}).get("page_start"))
+        }
+        relevant_docs.append(doc_info)
+    return relevant_docs
+
+def build_search_filters(filters: Optional[SearchFilters]) -> Optional[Dict[str, Any]]:
+    """Convierte los filtros de la petición en argumentos de build_metadata_filter."""
+    if filters is None:
+        return None
+    return {
+        "filenames": filters.filenames,
+        "document_ids": filters.document_ids,
+        "page_from": filters.page_from,
+        "page_to": filters.page_to,
+        "uploaded_after": filters.uploaded_after.timestamp() if filters.uploaded_after else None,
+        "uploaded_before": filters.uploaded_before.timestamp() if filters.uploaded_before else None
+    }
+
+def compute_confidence_score(context_fragments: List[Dict[str, Any]]) -> float:
+    """Confidence score basado en la similaridad promedio de los fragmentos."""
+    if not context_fragments:
+        return 0.0
+    avg_similarity = sum(f.get("similarity_score", 0) for f in context_fragments) / len(context_fragments)
+    return min(avg_similarity * 1.2, 1.0)  # Boost ligeramente
+
+async def load_conversation_history(session_id: Optional[str]) -> str:
+    """Historial acotado de la sesión ("" si la petición no usa sesión)."""
+    if not session_id:
+        return ""
+    return await run_in_threadpool(conversation_memory.get_history_text, session_id)
+
+async def remember_conversation_turn(session_id: Optional[str], question: str, answer: str):
+    """Registra el turno en la memoria de la sesión, si la hay."""
+    if session_id and answer:
+        await run_in_threadpool(conversation_memory.add_turn, session_id, question, answer)
+
+def format_sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Serializa un evento server-sent events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @router.get("/status")
 async def chat_status():
     """Verifica el estado del sistema de chat."""
     try:
         # Verificar estado de LLM 
-        llm_status = local_llm_service.get_llm_status()
+        llm_status = await local_llm_service.aget_llm_status()
         
         # Verificar base de datos vectorial
-        vector_status = vector_db.get_database_info()
+        vector_status = await run_in_threadpool(vector_db.get_database_info)
         
         return JSONResponse(
             status_code=200,
@@ -66,15 +146,31 @@ async def chat_status():
                 "status": "operational",
                 "llm_service": llm_status,
                 "vector_database": vector_status,
+                "query_batching": query_embedding_batcher.get_metrics(),
+                "conversation_memory": conversation_memory.get_stats(),
+                "answer_cache": answer_cache.get_stats() if answer_cache else {"enabled": False},
+                "retrieval": {
+                    "default_mode": contextual_retriever.default_mode,
+                    "modes": list(RETRIEVAL_MODES),
+                    "lexical_index": lexical_index.get_stats(),
+                    "rerank": cross_encoder_reranker.get_stats(),
+                    "diversification": {
+                        "default": contextual_retriever.diversify,
+                        "mmr_lambda": contextual_retriever.mmr_lambda,
+                        "candidate_multiplier": contextual_retriever.mmr_candidate_multiplier,
+                        "merge_adjacent": contextual_retriever.merge_adjacent
+                    }
+                },
+                "document_catalog": document_catalog.get_stats(),
+                "context_packing": context_packer.get_stats(),
                 "chat_features": {
                     "contextual_search": True,
-                    "langchain_integration": llm_status.get("langchain_available", False),
                     "document_summarization": True,
                     "advanced_summarization": True,
                     "comparative_analysis": True,
                     "topic_classification": True,
                     "conversation_memory": True,
-                    "document_comparison": llm_status.get("langchain_available", False),
+                    "document_comparison": True,
                     "summary_types": ["comprehensive", "executive", "technical", "bullet_points"],
                     "classification_methods": ["llm_local", "keyword_fallback", "huggingface_future"]
                 }
@@ -86,59 +182,76 @@ async def chat_status():
             content={"error": f"Error verificando estado del chat: {str(e)}"}
         )
 
+@router.get("/collection/version")
+async def get_collection_version(since: int = 0):
+    """
+    Generación de la colección, versión por documento y cambios desde `since`.
+    
+    Permite a cachés externas comprobar de forma barata si el corpus cambió.
+    """
+    return vector_db.get_change_feed(since_generation=since)
+
+@router.post("/collection/migrate")
+async def migrate_collection_from_http(source_host: Optional[str] = None, source_port: Optional[int] = None):
+    """
+    Copia la colección de un servidor ChromaDB al backend en proceso configurado
+    (chromadb_embedded o local). Se puede repetir: los fragmentos se insertan con upsert.
+    """
+    result = await run_in_threadpool(vector_db.migrate_from_http, source_host, source_port)
+    return JSONResponse(status_code=200 if result.get("success") else 500, content=result)
+
+# Última lista de documentos calculada y la versión (generación-revisión del catálogo) a la que corresponde
+documents_listing_cache: Dict[str, Any] = {"generation": None, "content": None}
+
 @router.get("/documents")
-async def list_documents():
-    """Obtiene la lista de documentos procesados en el sistema."""
+async def list_documents(if_none_match: Optional[str] = Header(None)):
+    """
+    Obtiene la lista de documentos procesados en el sistema.
+    
+    La respuesta se reutiliza mientras no cambien la generación de la colección
+    ni el catálogo, y se etiqueta con un ETag para que los clientes puedan
+    revalidar con 304.
+    """
     try:
-        # Obtener todos los documentos de muestra (aumentamos el límite)
-        all_docs_sample = vector_db.get_all_documents_sample(limit=200)
+        generation = vector_db.get_collection_generation()
+        await run_in_threadpool(document_catalog.ensure_synchronized)
+        version = f"{generation}-{document_catalog.revision}"
+        etag = f'W/"documents-{version}"'
+        if documents_listing_cache["generation"] == version:
+            if if_none_match == etag:
+                return Response(status_code=304, headers={"ETag": etag})
+            return JSONResponse(status_code=200, content=documents_listing_cache["content"], headers={"ETag": etag})
         
-        # Obtener estadísticas generales
-        db_status = vector_db.get_database_status()
+        # Catálogo de documentos: una fila por documento, sin recorrer los fragmentos
+        catalog_documents = await run_in_threadpool(document_catalog.list_documents)
+        db_status = await run_in_threadpool(vector_db.get_database_status)
         
-        # Procesar documentos únicos y calcular estadísticas
-        unique_docs = {}
-        fragment_counts = {}
-        
-        for doc in all_docs_sample:
-            metadata = doc.get("metadata", {})
-            filename = metadata.get("filename", "unknown")
-            
-            # Contar fragmentos
-            fragment_counts[filename] = fragment_counts.get(filename, 0) + 1
-            
-            # Mantener solo un documento único por filename
-            if filename not in unique_docs:
-                unique_docs[filename] = {
-                    "filename": filename,
-                    "upload_date": metadata.get("upload_date", "Fecha no disponible"),
-                    "file_size": metadata.get("file_size", 0),
-                    "total_pages": metadata.get("total_pages", 0),
-                    "content_preview": doc.get("content", "")[:200] + "..." if len(doc.get("content", "")) > 200 else doc.get("content", ""),
-                    "fragment_count": 0  # Se actualizará después
-                }
-        
-        # Actualizar conteos de fragmentos
-        for filename, doc_info in unique_docs.items():
-            doc_info["fragment_count"] = fragment_counts.get(filename, 0)
+        processed_docs = [
+            {
+                "filename": document["filename"],
+                "document_id": document["document_hash"],
+                "upload_date": document["upload_date"] or "Fecha no disponible",
+                "file_size": document["file_size"] or 0,
+                "total_pages": document["total_pages"] or 0,
+                "title": document["title"] or "",
+                "author": document["author"] or "",
+                "content_preview": document["content_preview"] or "",
+                "fragment_count": document["fragment_count"]
+            }
+            for document in catalog_documents
+        ]
         
-        # Convertir a lista y ordenar por fecha
-        processed_docs = list(unique_docs.values())
-        try:
-            processed_docs.sort(key=lambda x: x.get('upload_date', ''), reverse=True)
-        except:
-            pass  # Si hay error en el ordenamiento, continúa sin ordenar
+        content = {
+            "success": True,
+            "documents": processed_docs,
+            "total_documents": len(processed_docs),
+            "total_fragments": db_status.get("total_chunks", 0),
+            "database_status": db_status,
+            "collection_generation": generation
+        }
+        documents_listing_cache.update(generation=version, content=content)
         
-        return JSONResponse(
-            status_code=200,
-            content={
-                "success": True,
-                "documents": processed_docs,
-                "total_documents": len(processed_docs),
-                "total_fragments": db_status.get("total_chunks", 0),
-                "database_status": db_status
-            }
-        )
+        return JSONResponse(status_code=200, content=content, headers={"ETag": etag})
         
     except Exception as e:
         return JSONResponse(
@@ -157,7 +270,7 @@ async def delete_document(document_name: str):
     """Elimina un documento específico y todos sus fragmentos."""
     try:
         # Intentar eliminar el documento
-        success = vector_db.remove_document_by_name(document_name)
+        success = await run_in_threadpool(vector_db.remove_document_by_name, document_name)
         
         if success:
             return JSONResponse(
@@ -190,7 +303,7 @@ async def delete_document(document_name: str):
 async def clear_all_documents():
     """Elimina todos los documentos de la base de datos."""
     try:
-        result = vector_db.clear_all_documents()
+        result = await run_in_threadpool(vector_db.clear_all_documents)
         
         if result.get("success", False):
             return JSONResponse(
@@ -213,10 +326,22 @@ async def clear_all_documents():
         )
 
 @router.get("/documents/{document_name}/fragments")
-async def get_document_fragments(document_name: str):
-    """Obtiene información detallada de fragmentos de un documento específico."""
+async def get_document_fragments(document_name: str, limit: int = 50, cursor: Optional[str] = None,
+                                 fields: str = ",".join(DEFAULT_FRAGMENT_FIELDS)):
+    """
+    Obtiene una página de fragmentos de un documento, en orden de lectura.
+    
+    `fields` es una lista separada por comas (preview, content, metadata,
+    embedding); para la página siguiente se envía el `next_cursor` recibido.
+    """
     try:
-        result = vector_db.get_document_fragments_info(document_name)
+        selected_fields = [field.strip() for field in fields.split(",") if field.strip()]
+        try:
+            result = await run_in_threadpool(
+                vector_db.get_document_fragments_info, document_name, limit, cursor, selected_fields
+            )
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"success": False, "error": str(e)})
         
         if result.get("success", False):
             return JSONResponse(
@@ -238,9 +363,37 @@ async def get_document_fragments(document_name: str):
             }
         )
 
+@router.get("/documents/{document_name}/search")
+async def search_document(document_name: str, query: Optional[str] = None, max_results: int = 10,
+                          page_from: Optional[int] = None, page_to: Optional[int] = None):
+    """
+    Busca dentro de un documento: con `query`, los fragmentos más relevantes del
+    documento; sin ella, sus fragmentos en orden de lectura.
+    """
+    try:
+        result = await run_in_threadpool(
+            contextual_retriever.search_by_document,
+            document_name, max_results, query, page_from, page_to
+        )
+        return JSONResponse(status_code=200 if result["total_fragments"] else 404, content=result)
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={
+                "success": False,
+                "error": str(e)
+            }
+        )
+
 @router.delete("/fragments")
 async def delete_fragments(fragment_ids: List[str]):
-    """Elimina fragmentos específicos por sus IDs."""
+    """
+    Elimina fragmentos específicos por sus IDs.
+    
+    Las listas grandes (FRAGMENT_DELETE_BACKGROUND_THRESHOLD IDs o más) se
+    eliminan por lotes en segundo plano: la respuesta es 202 con el trabajo,
+    cuyo progreso se consulta en /fragments/deletion-jobs/{job_id}.
+    """
     try:
         if not fragment_ids:
             return JSONResponse(
@@ -251,7 +404,19 @@ async def delete_fragments(fragment_ids: List[str]):
                 }
             )
         
-        result = vector_db.delete_fragments_by_ids(fragment_ids)
+        if len(fragment_ids) >= FRAGMENT_DELETE_BACKGROUND_THRESHOLD:
+            job = deletion_job_manager.submit(fragment_ids)
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "success": True,
+                    "message": f"Borrado de {len(job.fragment_ids)} fragmentos encolado",
+                    "job": job.to_dict(),
+                    "status_url": f"/api/chat/fragments/deletion-jobs/{job.job_id}"
+                }
+            )
+        
+        result = await run_in_threadpool(vector_db.delete_fragments_by_ids, fragment_ids)
         
         if result.get("success", False):
             return JSONResponse(
@@ -273,23 +438,137 @@ async def delete_fragments(fragment_ids: List[str]):
             }
         )
 
+@router.get("/fragments/deletion-jobs")
+async def list_deletion_jobs():
+    """Lista los borrados de fragmentos en segundo plano."""
+    return {"jobs": deletion_job_manager.list_jobs()}
+
+@router.get("/fragments/deletion-jobs/{job_id}")
+async def get_deletion_job(job_id: str):
+    """Consulta el progreso de un borrado de fragmentos en segundo plano."""
+    job = deletion_job_manager.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo de borrado '{job_id}' no encontrado")
+    return job.to_dict()
+
+async def retrieve_with_answer_cache(request: ChatRequest, conversation_history: str) -> Dict[str, Any]:
+    """
+    Recupera contexto consultando antes la caché semántica de respuestas.
+    
+    Con la colección sin cambios un acierto evita la búsqueda y la generación;
+    si cambió, la entrada solo se reutiliza si se recuperan los mismos fragmentos.
+    Las preguntas con historial de sesión no usan la caché (la respuesta depende
+    de la conversación).
+    
+    Returns:
+        Dict[str, Any]: cached_entry (o None), search_result y datos para guardar la respuesta
+    """
+    retrieval_mode = request.retrieval_mode or contextual_retriever.default_mode
+    rerank = cross_encoder_reranker.enabled if request.rerank is None else request.rerank
+    diversify = contextual_retriever.diversify if request.diversify is None else request.diversify
+    search_filters = build_search_filters(request.filters)
+    filters_scope = json.dumps(search_filters, sort_keys=True) if search_filters else ""
+    lookup = {"cached_entry": None, "search_result": None, "query_vector": None,
+              "scope": f"{request.max_results}:{request.similarity_threshold}:{retrieval_mode}:{filters_scope}:{rerank}:{diversify}",
+              "collection_version": vector_db.get_collection_generation()}
+    # El modo léxico no calcula embeddings, que la caché necesita para comparar preguntas
+    use_cache = answer_cache is not None and not conversation_history and retrieval_mode != "lexical"
+    
+    if use_cache:
+        lookup["query_vector"] = await run_in_threadpool(query_embedding_batcher.embed, request.question)
+        lookup["cached_entry"] = answer_cache.lookup(
+            lookup["query_vector"], lookup["scope"], lookup["collection_version"]
+        )
+        if lookup["cached_entry"]:
+            return lookup
+    
+    lookup["search_result"] = await run_in_threadpool(
+        contextual_retriever.search_relevant_context,
+        query=request.question,
+        max_results=request.max_results,
+        similarity_threshold=request.similarity_threshold,
+        query_embedding=lookup["query_vector"],
+        retrieval_mode=retrieval_mode,
+        filters=search_filters,
+        rerank=rerank,
+        diversify=diversify
+    )
+    
+    if use_cache and lookup["search_result"]["success"]:
+        fragment_ids = get_source_fragment_ids(lookup["search_result"]["relevant_fragments"])
+        lookup["cached_entry"] = answer_cache.lookup(
+            lookup["query_vector"], lookup["scope"], lookup["collection_version"], fragment_ids
+        )
+        if not lookup["cached_entry"]:
+            answer_cache.record_miss()
+    return lookup
+
+def build_answer_cache_metadata(cached_entry: Optional[Dict[str, Any]] = None,
+                                saved_seconds: float = 0.0) -> Dict[str, Any]:
+    """Metadatos de la caché de respuestas para la respuesta del chat."""
+    if answer_cache is None:
+        return {"enabled": False}
+    stats = answer_cache.get_stats()
+    return {
+        "enabled": True,
+        "hit": cached_entry is not None,
+        "similarity": cached_entry.get("similarity") if cached_entry else None,
+        "saved_latency_seconds": round(saved_seconds, 3),
+        "hit_rate": stats["hit_rate"],
+        "saved_seconds_total": stats["saved_seconds_total"]
+    }
+
+def get_source_fragment_ids(fragments: List[Dict[str, Any]]) -> List[str]:
+    """IDs almacenados detrás de los fragmentos de contexto (todos los de un grupo fusionado)."""
+    return [
+        fragment_id
+        for fragment in fragments
+        for fragment_id in fragment.get("merged_fragment_ids") or [fragment.get("fragment_id")]
+    ]
+
+def store_answer_in_cache(lookup: Dict[str, Any], context_fragments: List[Dict[str, Any]],
+                          response: Dict[str, Any], latency_seconds: float):
+    """Guarda una respuesta generada por el LLM en la caché semántica."""
+    if answer_cache is None or lookup["query_vector"] is None:
+        return
+    answer_cache.store(
+        lookup["query_vector"],
+        lookup["scope"],
+        lookup["collection_version"],
+        get_source_fragment_ids(context_fragments),
+        response,
+        latency_seconds
+    )
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_with_documents(request: ChatRequest):
     """
-    Endpoint principal para chat con documentos usando LangChain.
+    Endpoint principal para chat con documentos con el LLM local (Ollama).
     Busca documentos relevantes y genera respuesta con contexto.
     """
     try:
+        started = time.perf_counter()
         print(f"🔍 Chat request recibido: {request.question}")
         
-        # Buscar contexto relevante
+        # Buscar contexto relevante (o una respuesta ya generada para una pregunta equivalente)
         print("📚 Buscando contexto relevante...")
-        search_result = contextual_retriever.search_relevant_context(
-            query=request.question,
-            max_results=request.max_results,
-            similarity_threshold=request.similarity_threshold
-        )
+        conversation_history = await load_conversation_history(request.session_id)
+        lookup = await retrieve_with_answer_cache(request, conversation_history)
+        
+        cached_entry = lookup["cached_entry"]
+        if cached_entry:
+            cached_response = cached_entry["response"]
+            saved_seconds = answer_cache.record_hit(cached_entry, time.perf_counter() - started)
+            print(f"⚡ Respuesta servida desde caché (similitud {cached_entry['similarity']})")
+            await remember_conversation_turn(request.session_id, request.question, cached_response["answer"])
+            return ChatResponse(
+                question=request.question,
+                **cached_response,
+                session_id=request.session_id,
+                metadata={"answer_cache": build_answer_cache_metadata(cached_entry, saved_seconds)}
+            )
         
+        search_result = lookup["search_result"]
         print(f"🔎 Resultado de búsqueda: {search_result.get('success', False)}")
         
         if not search_result["success"]:
@@ -310,42 +589,43 @@ async def chat_with_documents(request: ChatRequest):
                 method="no_context_found"
             )
         
-        # Generar respuesta con LLM (LangChain o Ollama directo)
+        # Generar respuesta con LLM (Ollama)
         print("🤖 Generando respuesta con LLM...")
-        llm_response = local_llm_service.generate_contextual_response(
+        llm_response = await local_llm_service.agenerate_contextual_response(
             question=request.question,
-            context_fragments=context_fragments
+            context_fragments=context_fragments,
+            conversation_history=conversation_history
         )
         
         print(f"✅ Respuesta LLM generada: {llm_response.get('method', 'unknown')}")
         
-        # Preparar información de documentos relevantes
-        relevant_docs = []
-        for fragment in context_fragments:
-            doc_info = {
-                "filename": fragment.get("metadata", {}).get("filename", "documento_desconocido"),
-                "similarity_score": fragment.get("similarity_score", 0.0),
-                "content_preview": fragment.get("content", "")[:200] + "..." if len(fragment.get("content", "")) > 200 else fragment.get("content", ""),
-                "page": fragment.get("metadata", {}).get("page", None)
-            }
-            relevant_docs.append(doc_info)
+        answer = llm_response.get("response", "No se pudo generar respuesta")
+        await remember_conversation_turn(request.session_id, request.question, answer)
         
-        # Calcular confidence score basado en similaridad promedio
-        if context_fragments:
-            avg_similarity = sum(f.get("similarity_score", 0) for f in context_fragments) / len(context_fragments)
-            confidence_score = min(avg_similarity * 1.2, 1.0)  # Boost ligeramente
-        else:
-            confidence_score = 0.0
+        response_data = {
+            "answer": answer,
+            "relevant_documents": build_relevant_documents(context_fragments),
+            "confidence_score": compute_confidence_score(context_fragments),
+            "llm_used": llm_response.get("model_used", "unknown"),
+            "method": llm_response.get("method", "unknown")
+        }
+        # Solo se cachean respuestas del LLM, no las de respaldo
+        if llm_response.get("success"):
+            store_answer_in_cache(lookup, context_fragments, response_data, time.perf_counter() - started)
         
         return ChatResponse(
             question=request.question,
-            answer=llm_response.get("response", "No se pudo generar respuesta"),
-            relevant_documents=relevant_docs,
-            confidence_score=confidence_score,
-            llm_used=llm_response.get("model_used", "unknown"),
-            method=llm_response.get("method", "unknown")
+            **response_data,
+            session_id=request.session_id,
+            metadata={
+                "answer_cache": build_answer_cache_metadata(),
+                "retrieval": search_result.get("search_metadata", {}),
+                "context_packing": llm_response.get("context_packing")
+            }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"💥 Error en chat: {str(e)}")
         print(f"🔍 Tipo de error: {type(e).__name__}")
@@ -353,6 +633,103 @@ async def chat_with_documents(request: ChatRequest):
         print(f"📋 Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Error en chat: {str(e)}")
 
+@router.post("/chat/stream")
+async def stream_chat_with_documents(request: ChatRequest):
+    """
+    Variante en streaming del chat (server-sent events).
+    
+    Emite un evento "sources" con los fragmentos recuperados, eventos "token"
+    a medida que Ollama genera la respuesta y un evento "done" con tiempos y
+    conteo de tokens. Los errores se notifican con un evento "error".
+    """
+    async def event_stream():
+        started = time.perf_counter()
+        try:
+            conversation_history = await load_conversation_history(request.session_id)
+            lookup = await retrieve_with_answer_cache(request, conversation_history)
+            retrieval_seconds = time.perf_counter() - started
+            
+            cached_entry = lookup["cached_entry"]
+            if cached_entry:
+                cached_response = cached_entry["response"]
+                saved_seconds = answer_cache.record_hit(cached_entry, retrieval_seconds)
+                yield format_sse_event("sources", {
+                    "question": request.question,
+                    "relevant_documents": cached_response["relevant_documents"],
+                    "confidence_score": cached_response["confidence_score"],
+                    "retrieval_seconds": round(retrieval_seconds, 3)
+                })
+                yield format_sse_event("token", {"content": cached_response["answer"]})
+                await remember_conversation_turn(request.session_id, request.question, cached_response["answer"])
+                yield format_sse_event("done", {
+                    "method": cached_response["method"],
+                    "llm_used": cached_response["llm_used"],
+                    "retrieval_seconds": round(retrieval_seconds, 3),
+                    "total_seconds": round(time.perf_counter() - started, 3),
+                    "answer_cache": build_answer_cache_metadata(cached_entry, saved_seconds)
+                })
+                return
+            
+            search_result = lookup["search_result"]
+            if not search_result["success"]:
+                yield format_sse_event("error", {"error": search_result.get("error", "Error en búsqueda")})
+                return
+            
+            context_fragments = search_result.get("relevant_fragments", [])
+            relevant_documents = build_relevant_documents(context_fragments)
+            confidence_score = compute_confidence_score(context_fragments)
+            yield format_sse_event("sources", {
+                "question": request.question,
+                "relevant_documents": relevant_documents,
+                "confidence_score": confidence_score,
+                "retrieval_seconds": round(retrieval_seconds, 3)
+            })
+            
+            if not context_fragments:
+                yield format_sse_event("token", {"content": "No encontré información relevante en los documentos cargados para responder tu pregunta."})
+                yield format_sse_event("done", {
+                    "method": "no_context_found",
+                    "llm_used": "none",
+                    "retrieval_seconds": round(retrieval_seconds, 3),
+                    "total_seconds": round(time.perf_counter() - started, 3)
+                })
+                return
+            
+            answer_parts = []
+            async for event in local_llm_service.astream_contextual_response(
+                request.question, context_fragments, conversation_history
+            ):
+                if event["type"] == "token":
+                    answer_parts.append(event["content"])
+                    yield format_sse_event("token", {"content": event["content"]})
+                else:
+                    answer = "".join(answer_parts)
+                    await remember_conversation_turn(request.session_id, request.question, answer)
+                    if event.get("method") != "fallback":
+                        store_answer_in_cache(lookup, context_fragments, {
+                            "answer": answer,
+                            "relevant_documents": relevant_documents,
+                            "confidence_score": confidence_score,
+                            "llm_used": event.get("model_used") or "none",
+                            "method": event.get("method", "unknown")
+                        }, time.perf_counter() - started)
+                    stats = {key: value for key, value in event.items() if key not in ("type", "model_used")}
+                    yield format_sse_event("done", {
+                        **stats,
+                        "llm_used": event.get("model_used") or "none",
+                        "retrieval_seconds": round(retrieval_seconds, 3),
+                        "total_seconds": round(time.perf_counter() - started, 3),
+                        "answer_cache": build_answer_cache_metadata()
+                    })
+        except Exception as e:
+            yield format_sse_event("error", {"error": f"Error en chat: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/chat/simple")
 async def simple_chat(request: ChatRequest):
     """
@@ -361,10 +738,15 @@ async def simple_chat(request: ChatRequest):
     """
     try:
         # Buscar contexto
-        search_result = contextual_retriever.search_relevant_context(
+        search_result = await run_in_threadpool(
+            contextual_retriever.search_relevant_context,
             query=request.question,
             max_results=request.max_results,
-            similarity_threshold=request.similarity_threshold
+            similarity_threshold=request.similarity_threshold,
+            retrieval_mode=request.retrieval_mode,
+            filters=build_search_filters(request.filters),
+            rerank=request.rerank,
+            diversify=request.diversify
         )
         
         if not search_result["success"] or not search_result.get("relevant_fragments"):
@@ -375,16 +757,17 @@ async def simple_chat(request: ChatRequest):
             }
         
         # Generar respuesta
-        llm_response = local_llm_service.generate_contextual_response(
+        llm_response = await local_llm_service.agenerate_contextual_response(
             question=request.question,
-            context_fragments=search_result["relevant_fragments"]
+            context_fragments=search_result["relevant_fragments"],
+            conversation_history=await load_conversation_history(request.session_id)
         )
+        await remember_conversation_turn(request.session_id, request.question, llm_response.get("response", ""))
         
         return {
             "response": llm_response.get("response", "Error generando respuesta"),
             "relevant_documents": len(search_result["relevant_fragments"]),
-            "method": llm_response.get("method", "unknown"),
-            "langchain_used": llm_response.get("method", "").startswith("langchain")
+            "method": llm_response.get("method", "unknown")
         }
         
     except Exception as e:
@@ -403,7 +786,7 @@ async def summarize_document(request: SummaryRequest):
         else:
             # Resumir colección completa
             # Obtener muestra de documentos
-            all_docs = vector_db.get_all_documents_sample(limit=10)
+            all_docs = await run_in_threadpool(vector_db.get_all_documents_sample, limit=10)
             
             if not all_docs:
                 return {"error": "No hay documentos para resumir"}
@@ -412,7 +795,7 @@ async def summarize_document(request: SummaryRequest):
             combined_content = "\n\n".join([doc.get("content", "") for doc in all_docs])
             
             # Generar resumen con LLM
-            summary_result = local_llm_service.generate_document_summary(combined_content)
+            summary_result = await local_llm_service.agenerate_document_summary(combined_content)
             
             return {
                 "summary": summary_result.get("summary", "No se pudo generar resumen"),
@@ -430,18 +813,20 @@ async def compare_documents(request: ComparisonRequest):
     Compara dos conjuntos de documentos basándose en consultas.
     """
     try:
-        # Buscar documentos para la primera consulta
-        search1 = contextual_retriever.search_relevant_context(
-            query=request.doc1_query,
-            max_results=request.max_results,
-            similarity_threshold=0.5
-        )
-        
-        # Buscar documentos para la segunda consulta
-        search2 = contextual_retriever.search_relevant_context(
-            query=request.doc2_query,
-            max_results=request.max_results,
-            similarity_threshold=0.5
+        # Buscar documentos para ambas consultas en paralelo (sus embeddings se agrupan en un lote)
+        search1, search2 = await asyncio.gather(
+            run_in_threadpool(
+                contextual_retriever.search_relevant_context,
+                query=request.doc1_query,
+                max_results=request.max_results,
+                similarity_threshold=0.5
+            ),
+            run_in_threadpool(
+                contextual_retriever.search_relevant_context,
+                query=request.doc2_query,
+                max_results=request.max_results,
+                similarity_threshold=0.5
+            )
         )
         
         if not search1["success"] or not search2["success"]:
@@ -462,7 +847,7 @@ async def compare_documents(request: ComparisonRequest):
             return {"error": "No se encontró suficiente contenido para comparar"}
         
         # Generar comparación usando LLM
-        comparison_result = local_llm_service.compare_documents(content1, content2)
+        comparison_result = await local_llm_service.acompare_documents(content1, content2)
         
         return {
             "comparison": comparison_result.get("comparison", "No se pudo generar comparación"),
@@ -488,13 +873,15 @@ async def advanced_document_summary(request: AdvancedSummaryRequest):
     try:
         if request.document_ids:
             # Resumen de documentos específicos
-            result = document_summarizer.generate_multi_document_summary(
+            result = await run_in_threadpool(
+                document_summarizer.generate_multi_document_summary,
                 document_ids=request.document_ids,
                 summary_type=request.summary_type
             )
         else:
             # Resumen de toda la colección
-            result = document_summarizer.generate_multi_document_summary(
+            result = await run_in_threadpool(
+                document_summarizer.generate_multi_document_summary,
                 document_ids=None,
                 summary_type=request.summary_type
             )
@@ -507,6 +894,7 @@ async def advanced_document_summary(request: AdvancedSummaryRequest):
             "documents_processed": result.get("documents_processed", 0),
             "model_used": result.get("model_used", "unknown"),
             "tokens_used": result.get("tokens_used", 0),
+            "context_packing": result.get("context_packing"),
             "error": result.get("error", None)
         }
         
@@ -523,17 +911,20 @@ async def comparative_document_summary(request: ComparativeSummaryRequest):
     Genera resumen comparativo entre dos conjuntos de documentos.
     """
     try:
-        # Buscar documentos para cada consulta
-        search1 = contextual_retriever.search_relevant_context(
-            query=request.doc1_query,
-            max_results=request.max_results,
-            similarity_threshold=0.5
-        )
-        
-        search2 = contextual_retriever.search_relevant_context(
-            query=request.doc2_query,
-            max_results=request.max_results,
-            similarity_threshold=0.5
+        # Buscar documentos para cada consulta en paralelo (sus embeddings se agrupan en un lote)
+        search1, search2 = await asyncio.gather(
+            run_in_threadpool(
+                contextual_retriever.search_relevant_context,
+                query=request.doc1_query,
+                max_results=request.max_results,
+                similarity_threshold=0.5
+            ),
+            run_in_threadpool(
+                contextual_retriever.search_relevant_context,
+                query=request.doc2_query,
+                max_results=request.max_results,
+                similarity_threshold=0.5
+            )
         )
         
         if not search1["success"] or not search2["success"]:
@@ -558,7 +949,7 @@ async def comparative_document_summary(request: ComparativeSummaryRequest):
             }
         
         # Generar resumen comparativo
-        result = document_summarizer.generate_comparative_summary(content1, content2)
+        result = await run_in_threadpool(document_summarizer.generate_comparative_summary, content1, content2)
         
         return {
             "success": result.get("success", False),
@@ -622,7 +1013,8 @@ async def classify_document_topics(request: TopicClassificationRequest):
     Clasifica documentos por temas usando zero-shot classification.
     """
     try:
-        result = topic_classifier.classify_document_collection(
+        result = await run_in_threadpool(
+            topic_classifier.classify_document_collection,
             document_ids=request.document_ids,
             custom_labels=request.custom_labels
         )
@@ -695,7 +1087,8 @@ async def classify_single_document(
                 "error": "Contenido vacío para clasificar"
             }
         
-        result = topic_classifier.classify_document(
+        result = await run_in_threadpool(
+            topic_classifier.classify_document,
             content=content,
             custom_labels=custom_labels,
             confidence_threshold=confidence_threshold
@@ -720,21 +1113,31 @@ async def classify_single_document(
         }
 
 @router.delete("/conversation/clear")
-async def clear_conversation():
-    """Limpia la memoria de conversación de LangChain."""
+async def clear_conversation(session_id: Optional[str] = None):
+    """Limpia la memoria de conversación de una sesión (session_id obligatorio)."""
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id es obligatorio")
     try:
-        local_llm_service.clear_conversation_memory()
-        return {"message": "Memoria de conversación limpiada exitosamente"}
+        await run_in_threadpool(local_llm_service.clear_conversation_memory, session_id)
+        return {"message": "Memoria de conversación limpiada exitosamente", "session_id": session_id}
     except Exception as e:
         return {"error": f"Error limpiando conversación: {str(e)}"}
 
+@router.delete("/admin/conversations/clear-all")
+async def clear_all_conversations():
+    """Administración: limpia la memoria de conversación de todas las sesiones."""
+    try:
+        sessions_cleared = await run_in_threadpool(local_llm_service.clear_all_conversation_memory)
+        return {"message": "Memoria de todas las conversaciones limpiada", "sessions_cleared": sessions_cleared}
+    except Exception as e:
+        return {"error": f"Error limpiando conversaciones: {str(e)}"}
+
 @router.get("/health")
 async def health_check():
     """Health check específico para el servicio de chat."""
     return {
         "status": "healthy",
         "service": "chat_router",
-        "langchain_available": local_llm_service.langchain_available,
         "summarizer_available": True,
         "topic_classifier_available": True,
         "endpoints": [
@@ -749,6 +1152,7 @@ async def health_check():
             "/classify/single",
             "/compare",
             "/conversation/clear",
+            "/admin/conversations/clear-all",
             "/status",
             "/health"
         ]
@@ -0,0 +1,219 @@
+# answer_cache.py
+# Caché semántica de respuestas para preguntas repetidas o casi idénticas
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .vector_store import vector_db
+
+
+class SemanticAnswerCache:
+    def __init__(self, similarity_threshold: float = 0.95, max_entries: int = 1000,
+                 ttl_seconds: float = 86400):
+        """
+        Inicializa la caché semántica de respuestas.
+
+        Las entradas se indexan por el embedding normalizado de la pregunta y
+        guardan los IDs de los fragmentos recuperados y la versión de la colección
+        con la que se generó la respuesta. Si la colección cambió, la entrada solo
+        se reutiliza cuando la nueva recuperación devuelve exactamente los mismos
+        fragmentos.
+
+        Args:
+            similarity_threshold (float): Similitud coseno mínima para considerar la misma pregunta
+            max_entries (int): Número máximo de respuestas guardadas (LRU)
+            ttl_seconds (float): Antigüedad máxima de una entrada
+        """
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated_hits = 0
+        self.saved_seconds = 0.0
+
+    def lookup(self, query_vector: np.ndarray, scope: str, collection_version: int,
+               fragment_ids: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Busca una respuesta cacheada para una pregunta equivalente.
+
+        Args:
+            query_vector (np.ndarray): Embedding de la pregunta
+            scope (str): Parámetros de búsqueda que deben coincidir (p. ej. max_results)
+            collection_version (int): Generación actual de la colección
+            fragment_ids (List[str]): IDs recuperados ahora; permiten reutilizar una
+                entrada de una versión anterior si el contexto no cambió
+
+        Returns:
+            Optional[Dict[str, Any]]: Entrada válida (con "similarity") o None
+        """
+        with self._lock:
+            slot, similarity = self._best_match(query_vector, scope)
+            if slot is None:
+                return None
+
+            entry = self._entries[slot]
+            if entry["collection_version"] != collection_version:
+                if fragment_ids is None:
+                    return None
+                if fragment_ids != entry["fragment_ids"]:
+                    # El contexto recuperado cambió: la respuesta ya no es válida
+                    self._entries[slot] = None
+                    return None
+                entry["collection_version"] = collection_version
+                self.revalidated_hits += 1
+
+            self._last_used[slot] = time.monotonic()
+            return {**entry, "similarity": round(similarity, 4)}
+
+    def store(self, query_vector: np.ndarray, scope: str, collection_version: int,
+              fragment_ids: List[str], response: Dict[str, Any], latency_seconds: float):
+        """
+        Guarda una respuesta generada.
+
+        Args:
+            query_vector (np.ndarray): Embedding de la pregunta
+            scope (str): Parámetros de búsqueda asociados
+            collection_version (int): Generación de la colección usada
+            fragment_ids (List[str]): IDs de los fragmentos usados como contexto (en los
+                fusionados, todos los de origen, para que borrar cualquiera invalide la entrada)
+            response (Dict[str, Any]): Datos de la respuesta a reutilizar
+            latency_seconds (float): Coste de generar la respuesta (recuperación + LLM)
+        """
+        vector = self._normalize(query_vector)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._entries = [None] * self.max_entries
+
+            slot, similarity = self._best_match(vector, scope)
+            if slot is None or similarity < 0.9999:
+                free_slots = [i for i, entry in enumerate(self._entries) if entry is None]
+                slot = free_slots[0] if free_slots else int(np.argmin(self._last_used))
+
+            self._vectors[slot] = vector
+            self._entries[slot] = {
+                "scope": scope,
+                "collection_version": collection_version,
+                "fragment_ids": list(fragment_ids),
+                "response": response,
+                "latency_seconds": latency_seconds,
+                "created_at": time.time()
+            }
+            self._last_used[slot] = time.monotonic()
+
+    def record_hit(self, entry: Dict[str, Any], hit_latency_seconds: float) -> float:
+        """
+        Registra un acierto y devuelve la latencia ahorrada.
+
+        Args:
+            entry (Dict[str, Any]): Entrada devuelta por lookup
+            hit_latency_seconds (float): Tiempo empleado en servir el acierto
+
+        Returns:
+            float: Segundos ahorrados respecto a generar la respuesta
+        """
+        saved = max(0.0, entry["latency_seconds"] - hit_latency_seconds)
+        with self._lock:
+            self.hits += 1
+            self.saved_seconds += saved
+        return saved
+
+    def record_miss(self):
+        """Registra un fallo de caché."""
+        with self._lock:
+            self.misses += 1
+
+    def handle_collection_change(self, change: Dict[str, Any]):
+        """
+        Invalida las entradas afectadas por un cambio de la colección.
+
+        Las entradas que usaban fragmentos eliminados se descartan de inmediato;
+        las altas solo cambian la generación y se revalidan en el siguiente lookup.
+
+        Args:
+            change (Dict[str, Any]): Evento de cambio emitido por VectorDatabase
+        """
+        if change["operation"] == "clear":
+            self.clear()
+            return
+        if change["operation"] == "store":
+            return
+        removed_ids = set(change.get("fragment_ids", []))
+        with self._lock:
+            for slot, entry in enumerate(self._entries):
+                if entry is not None and removed_ids.intersection(entry["fragment_ids"]):
+                    self._entries[slot] = None
+
+    def clear(self):
+        """Elimina todas las entradas."""
+        with self._lock:
+            self._entries = [None] * self.max_entries
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene estadísticas de la caché.
+
+        Returns:
+            Dict[str, Any]: Aciertos, fallos, tasa de acierto y latencia ahorrada
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": sum(1 for entry in self._entries if entry is not None),
+                "max_entries": self.max_entries,
+                "similarity_threshold": self.similarity_threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated_hits": self.revalidated_hits,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "saved_seconds_total": round(self.saved_seconds, 3)
+            }
+
+    def _best_match(self, query_vector: np.ndarray, scope: str):
+        """Slot más similar del mismo scope y no expirado (requiere el lock)."""
+        if self._vectors is None:
+            return None, 0.0
+        vector = self._normalize(query_vector)
+        if vector.shape[0] != self._vectors.shape[1]:
+            return None, 0.0
+
+        similarities = self._vectors @ vector
+        expired_before = time.time() - self.ttl_seconds
+        for slot in np.argsort(-similarities):
+            similarity = float(similarities[slot])
+            if similarity < self.similarity_threshold:
+                break
+            entry = self._entries[slot]
+            if entry is None:
+                continue
+            if entry["created_at"] < expired_before:
+                self._entries[slot] = None
+                continue
+            if entry["scope"] == scope:
+                return int(slot), similarity
+        return None, 0.0
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+# Instancia global de la caché de respuestas
+answer_cache = None
+if os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true":
+    answer_cache = SemanticAnswerCache(
+        similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+        ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+    )
+    vector_db.subscribe(answer_cache.handle_collection_change)
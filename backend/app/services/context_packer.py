@@ -0,0 +1,253 @@
+# context_packer.py
+# Empaquetado de contexto para prompts del LLM con presupuesto de tokens por tarea
+import math
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+# Tokenizador exacto opcional (mismo vocabulario que el modelo de Ollama)
+try:
+    from transformers import AutoTokenizer
+    TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    TRANSFORMERS_AVAILABLE = False
+
+# Presupuestos de tokens de contexto por tarea (sin contar instrucciones ni pregunta)
+DEFAULT_TASK_BUDGETS = {
+    "qa": 1024,
+    "summary": 1500,
+    "multi_summary": 2000,
+    "comparison": 1200,
+    "classification": 400
+}
+
+
+class TokenCounter:
+    def __init__(self, model_name: str, tokenizer_name: Optional[str] = None, chars_per_token: float = 4.0):
+        """
+        Cuenta tokens para el modelo configurado en Ollama.
+
+        Ollama no expone su tokenizador; si se indica un tokenizador de Hugging
+        Face equivalente (LLM_TOKENIZER) el recuento es exacto. Si no, se estima
+        con una razón caracteres/token que se calibra con el prompt_eval_count
+        que Ollama devuelve en cada generación.
+
+        Args:
+            model_name (str): Modelo de Ollama
+            tokenizer_name (str): Tokenizador de Hugging Face equivalente (opcional)
+            chars_per_token (float): Razón inicial caracteres/token de la estimación
+        """
+        self.model_name = model_name
+        self.tokenizer_name = tokenizer_name
+        self.chars_per_token = chars_per_token
+        self.calibration_samples = 0
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+        if tokenizer_name and TRANSFORMERS_AVAILABLE:
+            try:
+                self._tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+            except Exception as e:
+                print(f"⚠️ Tokenizador {tokenizer_name} no disponible, se estimarán los tokens: {str(e)}")
+
+    @property
+    def exact(self) -> bool:
+        """Indica si el recuento usa el tokenizador del modelo."""
+        return self._tokenizer is not None
+
+    def count(self, text: str) -> int:
+        """
+        Cuenta (o estima) los tokens de un texto.
+
+        Args:
+            text (str): Texto a medir
+
+        Returns:
+            int: Número de tokens
+        """
+        if not text:
+            return 0
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False))
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Recorta un texto a un máximo de tokens.
+
+        Args:
+            text (str): Texto a recortar
+            max_tokens (int): Tokens máximos
+
+        Returns:
+            str: Texto recortado (sin cambios si ya cabe)
+        """
+        if max_tokens <= 0:
+            return ""
+        if self._tokenizer is not None:
+            token_ids = self._tokenizer.encode(text, add_special_tokens=False)
+            if len(token_ids) <= max_tokens:
+                return text
+            return self._tokenizer.decode(token_ids[:max_tokens])
+        return text[:int(max_tokens * self.chars_per_token)]
+
+    def observe(self, prompt: str, prompt_eval_count: int, uncached: bool = False):
+        """
+        Calibra la estimación con los tokens reales que Ollama evaluó para un prompt.
+
+        Ollama no cuenta en prompt_eval_count el prefijo servido desde su caché
+        KV, así que una muestra en caliente puede infravalorar los tokens del
+        prompt y sobrestimar la razón caracteres/token. Por eso solo las
+        evaluaciones sin caché (el modelo se acaba de cargar) pueden subir la
+        razón; las demás solo la bajan, lo que nunca hace que el empaquetador
+        se pase del presupuesto. Las razones imposibles se descartan.
+
+        Args:
+            prompt (str): Prompt enviado
+            prompt_eval_count (int): Tokens de prompt evaluados según Ollama
+            uncached (bool): La evaluación cubrió el prompt completo (caché KV vacía)
+        """
+        if self._tokenizer is not None or not prompt or not prompt_eval_count:
+            return
+        ratio = len(prompt) / prompt_eval_count
+        if not 1.5 <= ratio <= 8.0:
+            return
+        if not uncached and ratio > self.chars_per_token:
+            return
+        with self._lock:
+            self.calibration_samples += 1
+            # Media móvil: sigue cambios de modelo sin oscilar por un prompt atípico
+            weight = max(0.1, 1.0 / self.calibration_samples)
+            self.chars_per_token += weight * (ratio - self.chars_per_token)
+
+
+class ContextPacker:
+    def __init__(self, token_counter: TokenCounter, task_budgets: Optional[Dict[str, int]] = None,
+                 min_fragment_tokens: int = 48):
+        """
+        Empaqueta fragmentos en un presupuesto de tokens por tarea.
+
+        Args:
+            token_counter (TokenCounter): Contador de tokens del modelo
+            task_budgets (Dict[str, int]): Tokens de contexto por tarea (qa, summary...)
+            min_fragment_tokens (int): Espacio mínimo para incluir un fragmento recortado
+        """
+        self.token_counter = token_counter
+        self.task_budgets = {**DEFAULT_TASK_BUDGETS, **(task_budgets or {})}
+        self.min_fragment_tokens = min_fragment_tokens
+
+    def get_budget(self, task: str) -> int:
+        """Presupuesto de tokens de una tarea (el de qa si no está configurada)."""
+        return self.task_budgets.get(task, self.task_budgets["qa"])
+
+    def count_tokens(self, text: str) -> int:
+        """Tokens de un texto para el modelo configurado."""
+        return self.token_counter.count(text)
+
+    def pack(self, fragments: List[Dict[str, Any]], task: str = "qa",
+             budget_tokens: Optional[int] = None,
+             formatter: Optional[Callable[[int, Dict[str, Any], str], str]] = None,
+             separator: str = "\n") -> Dict[str, Any]:
+        """
+        Añade fragmentos, en orden de valor, mientras quepan en el presupuesto.
+
+        Un fragmento que no cabe entero se recorta si queda al menos
+        min_fragment_tokens de espacio; si no, se omite y se prueba con los
+        siguientes (más cortos) hasta agotar el presupuesto.
+
+        Args:
+            fragments (List[Dict]): Fragmentos ordenados de más a menos relevante
+            task (str): Tarea cuyo presupuesto se usa
+            budget_tokens (int): Presupuesto explícito (sustituye al de la tarea)
+            formatter (Callable): (posición, fragmento, contenido) -> bloque de texto
+            separator (str): Separador entre bloques
+
+        Returns:
+            Dict[str, Any]: text, tokens_used, budget_tokens, fragments_used,
+                fragments_truncated y fragments_skipped
+        """
+        budget = self.get_budget(task) if budget_tokens is None else budget_tokens
+        formatter = formatter or (lambda position, fragment, content: content)
+        separator_tokens = self.count_tokens(separator)
+        blocks: List[str] = []
+        used = 0
+        truncated = 0
+        skipped = 0
+
+        for position, fragment in enumerate(fragments):
+            content = fragment.get("content", "")
+            cost = separator_tokens if blocks else 0
+            block = formatter(position, fragment, content)
+            block_tokens = self.count_tokens(block)
+            remaining = budget - used - cost
+            if block_tokens > remaining:
+                frame_tokens = block_tokens - self.count_tokens(content)
+                content_room = remaining - frame_tokens
+                if content_room < min(self.min_fragment_tokens, self.count_tokens(content)):
+                    skipped += 1
+                    continue
+                content = self.token_counter.truncate(content, content_room - self.count_tokens("...")) + "..."
+                block = formatter(position, fragment, content)
+                block_tokens = self.count_tokens(block)
+                if block_tokens > remaining:
+                    skipped += 1
+                    continue
+                truncated += 1
+            blocks.append(block)
+            used += cost + block_tokens
+
+        return {
+            "text": separator.join(blocks),
+            "tokens_used": used,
+            "budget_tokens": budget,
+            "fragments_used": len(blocks),
+            "fragments_truncated": truncated,
+            "fragments_skipped": skipped
+        }
+
+    def fit_text(self, text: str, task: str, budget_tokens: Optional[int] = None) -> tuple:
+        """
+        Recorta un texto al presupuesto de una tarea.
+
+        Args:
+            text (str): Texto completo (p. ej. contenido de un documento)
+            task (str): Tarea cuyo presupuesto se usa
+            budget_tokens (int): Presupuesto explícito (sustituye al de la tarea)
+
+        Returns:
+            tuple: (texto recortado, truncado)
+        """
+        budget = self.get_budget(task) if budget_tokens is None else budget_tokens
+        if self.count_tokens(text) <= budget:
+            return text, False
+        return self.token_counter.truncate(text, budget - self.count_tokens("...")) + "...", True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene la configuración del empaquetador.
+
+        Returns:
+            Dict[str, Any]: Presupuestos por tarea y estado del contador de tokens
+        """
+        return {
+            "task_budgets": dict(self.task_budgets),
+            "model": self.token_counter.model_name,
+            "exact_tokenizer": self.token_counter.exact,
+            "tokenizer": self.token_counter.tokenizer_name,
+            "chars_per_token": round(self.token_counter.chars_per_token, 3),
+            "calibration_samples": self.token_counter.calibration_samples
+        }
+
+
+# Instancia global del empaquetador de contexto
+context_packer = ContextPacker(
+    TokenCounter(
+        model_name=os.getenv("OLLAMA_MODEL", "llama3.2:3b"),
+        tokenizer_name=os.getenv("LLM_TOKENIZER") or None,
+        chars_per_token=float(os.getenv("LLM_CHARS_PER_TOKEN", "4.0"))
+    ),
+    task_budgets={
+        task: int(os.getenv(f"CONTEXT_BUDGET_{task.upper()}", str(budget)))
+        for task, budget in DEFAULT_TASK_BUDGETS.items()
+    }
+)
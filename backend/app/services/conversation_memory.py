@@ -0,0 +1,337 @@
+# conversation_memory.py
+# Memoria de conversación por sesión con presupuesto de tokens y resumen progresivo
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estima el número de tokens de un texto (~4 caracteres por token).
+
+    Args:
+        text (str): Texto a medir
+
+    Returns:
+        int: Número aproximado de tokens
+    """
+    return (len(text) + 3) // 4 if text else 0
+
+
+class InMemoryConversationBackend:
+    def __init__(self):
+        """Backend en el propio proceso: un LRU de sesiones en memoria."""
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            return {"summary": state["summary"], "turns": list(state["turns"]), "updated_at": state["updated_at"]}
+
+    def save(self, session_id: str, state: Dict[str, Any]):
+        with self._lock:
+            self._sessions[session_id] = state
+            self._sessions.move_to_end(session_id)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def clear(self) -> int:
+        with self._lock:
+            removed = len(self._sessions)
+            self._sessions.clear()
+            return removed
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def evict(self, ttl_seconds: float, max_sessions: int) -> int:
+        """Elimina sesiones inactivas más allá del TTL y las menos usadas por encima del límite."""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            # El orden LRU coincide con el de última actividad
+            while self._sessions:
+                session_id, state = next(iter(self._sessions.items()))
+                if now - state["updated_at"] <= ttl_seconds and len(self._sessions) <= max_sessions:
+                    break
+                self._sessions.popitem(last=False)
+                removed += 1
+        return removed
+
+
+class SQLiteConversationBackend:
+    def __init__(self, db_path: str):
+        """
+        Backend en un archivo SQLite local, compartido por varios workers.
+
+        Args:
+            db_path (str): Ruta del archivo SQLite
+        """
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS conversation_sessions (
+                session_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                turns TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_conversation_updated_at ON conversation_sessions (updated_at)"
+        )
+        self._connection.commit()
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT summary, turns, updated_at FROM conversation_sessions WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"summary": row[0], "turns": json.loads(row[1]), "updated_at": row[2]}
+
+    def save(self, session_id: str, state: Dict[str, Any]):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO conversation_sessions (session_id, summary, turns, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (session_id, state["summary"], json.dumps(state["turns"], ensure_ascii=False), state["updated_at"])
+            )
+            self._connection.commit()
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM conversation_sessions WHERE session_id = ?", (session_id,)
+            )
+            self._connection.commit()
+            return cursor.rowcount > 0
+
+    def clear(self) -> int:
+        with self._lock:
+            cursor = self._connection.execute("DELETE FROM conversation_sessions")
+            self._connection.commit()
+            return cursor.rowcount
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM conversation_sessions").fetchone()[0]
+
+    def evict(self, ttl_seconds: float, max_sessions: int) -> int:
+        """Elimina sesiones inactivas más allá del TTL y las más antiguas por encima del límite."""
+        with self._lock:
+            removed = self._connection.execute(
+                "DELETE FROM conversation_sessions WHERE updated_at < ?", (time.time() - ttl_seconds,)
+            ).rowcount
+            removed += self._connection.execute(
+                """DELETE FROM conversation_sessions WHERE session_id IN (
+                    SELECT session_id FROM conversation_sessions
+                    ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (max_sessions,)
+            ).rowcount
+            self._connection.commit()
+        return removed
+
+
+class ConversationMemoryStore:
+    def __init__(self, backend=None, max_tokens_per_session: int = 1024, summary_max_tokens: int = 256,
+                 ttl_seconds: float = 3600, max_sessions: int = 1000, eviction_interval_seconds: float = 60,
+                 summarizer: Optional[Callable[[str, List[Dict[str, str]]], str]] = None):
+        """
+        Inicializa el almacén de memoria de conversación.
+
+        Cada sesión guarda un resumen de los turnos antiguos y los turnos recientes
+        literales. Cuando los turnos superan el presupuesto de tokens, los más
+        antiguos se pliegan en el resumen, que a su vez está acotado.
+
+        Args:
+            backend: Backend de almacenamiento (en memoria por defecto)
+            max_tokens_per_session (int): Presupuesto de tokens del historial de una sesión
+            summary_max_tokens (int): Tokens máximos del resumen de turnos antiguos
+            ttl_seconds (float): Inactividad tras la que se descarta una sesión
+            max_sessions (int): Número máximo de sesiones conservadas
+            eviction_interval_seconds (float): Intervalo mínimo entre barridos de expiración
+            summarizer (Callable): Función (resumen_previo, turnos) -> nuevo resumen
+        """
+        self.backend = backend or InMemoryConversationBackend()
+        self.max_tokens_per_session = max_tokens_per_session
+        self.summary_max_tokens = min(summary_max_tokens, max_tokens_per_session // 2)
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.eviction_interval_seconds = eviction_interval_seconds
+        self.summarizer = summarizer or self._extractive_summary
+        self._lock = threading.Lock()
+        self._last_eviction = 0.0
+        self.sessions_evicted = 0
+        self.turns_summarized = 0
+
+    def get_history_text(self, session_id: str) -> str:
+        """
+        Obtiene el historial de la sesión listo para incluir en el prompt.
+
+        Args:
+            session_id (str): Identificador de la sesión
+
+        Returns:
+            str: Resumen de turnos antiguos seguido de los turnos recientes
+        """
+        self._maybe_evict()
+        state = self.backend.load(session_id)
+        if state is None or state["updated_at"] < time.time() - self.ttl_seconds:
+            return ""
+
+        parts = []
+        if state["summary"]:
+            parts.append(f"Resumen de la conversación previa:\n{state['summary']}")
+        for turn in state["turns"]:
+            parts.append(f"Usuario: {turn['question']}\nAsistente: {turn['answer']}")
+        return "\n\n".join(parts)
+
+    def add_turn(self, session_id: str, question: str, answer: str):
+        """
+        Registra un turno y mantiene la sesión dentro de su presupuesto de tokens.
+
+        Args:
+            session_id (str): Identificador de la sesión
+            question (str): Pregunta del usuario
+            answer (str): Respuesta generada
+        """
+        with self._lock:
+            state = self.backend.load(session_id)
+            if state is None or state["updated_at"] < time.time() - self.ttl_seconds:
+                state = {"summary": "", "turns": []}
+
+            turn_budget = self.max_tokens_per_session - self.summary_max_tokens
+            state["turns"].append({
+                "question": self._truncate(question, turn_budget // 2),
+                "answer": self._truncate(answer, turn_budget // 2)
+            })
+
+            # Plegar los turnos más antiguos en el resumen hasta caber en el presupuesto
+            folded = []
+            while len(state["turns"]) > 1 and self._turns_tokens(state["turns"]) > turn_budget:
+                folded.append(state["turns"].pop(0))
+            if folded:
+                state["summary"] = self._truncate_head(
+                    self.summarizer(state["summary"], folded), self.summary_max_tokens
+                )
+                self.turns_summarized += len(folded)
+
+            state["updated_at"] = time.time()
+            self.backend.save(session_id, state)
+        self._maybe_evict()
+
+    def clear_session(self, session_id: str) -> bool:
+        """Elimina la memoria de una sesión."""
+        return self.backend.delete(session_id)
+
+    def clear_all(self) -> int:
+        """Elimina la memoria de todas las sesiones."""
+        return self.backend.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene estadísticas del almacén de memoria.
+
+        Returns:
+            Dict[str, Any]: Sesiones activas, límites y contadores
+        """
+        return {
+            "backend": type(self.backend).__name__,
+            "active_sessions": self.backend.count(),
+            "max_sessions": self.max_sessions,
+            "max_tokens_per_session": self.max_tokens_per_session,
+            "summary_max_tokens": self.summary_max_tokens,
+            "ttl_seconds": self.ttl_seconds,
+            "sessions_evicted": self.sessions_evicted,
+            "turns_summarized": self.turns_summarized
+        }
+
+    def _maybe_evict(self):
+        """Barre las sesiones expiradas como mucho una vez por intervalo."""
+        now = time.monotonic()
+        if now - self._last_eviction < self.eviction_interval_seconds:
+            return
+        self._last_eviction = now
+        self.sessions_evicted += self.backend.evict(self.ttl_seconds, self.max_sessions)
+
+    @staticmethod
+    def _turns_tokens(turns: List[Dict[str, str]]) -> int:
+        return sum(estimate_tokens(turn["question"]) + estimate_tokens(turn["answer"]) for turn in turns)
+
+    @staticmethod
+    def _truncate(text: str, max_tokens: int) -> str:
+        """Recorta un texto por el final para que quepa en max_tokens."""
+        max_chars = max_tokens * 4
+        return text if len(text) <= max_chars else text[:max_chars - 3] + "..."
+
+    @staticmethod
+    def _truncate_head(text: str, max_tokens: int) -> str:
+        """Recorta un texto por el principio, conservando lo más reciente."""
+        max_chars = max_tokens * 4
+        if len(text) <= max_chars:
+            return text
+        text = text[-max_chars:]
+        newline = text.find("\n")
+        return text[newline + 1:] if newline != -1 else text
+
+    @staticmethod
+    def _extractive_summary(previous_summary: str, turns: List[Dict[str, str]]) -> str:
+        """Resumen extractivo: pregunta y primera oración de la respuesta de cada turno."""
+        lines = [previous_summary] if previous_summary else []
+        for turn in turns:
+            first_sentence = re.split(r"(?<=[.!?])\s", turn["answer"].strip(), maxsplit=1)[0]
+            lines.append(f"- {turn['question'][:160]} → {first_sentence[:240]}")
+        return "\n".join(lines)
+
+
+def create_conversation_backend(backend_name: str, db_path: str):
+    """
+    Crea el backend de memoria configurado.
+
+    Args:
+        backend_name (str): "memory" (en proceso) o "sqlite" (archivo compartido)
+        db_path (str): Ruta del archivo SQLite
+
+    Returns:
+        Backend de memoria de conversación
+    """
+    if backend_name == "sqlite":
+        try:
+            return SQLiteConversationBackend(db_path)
+        except Exception as e:
+            print(f"⚠️ Memoria de conversación SQLite no disponible, usando memoria local: {str(e)}")
+    return InMemoryConversationBackend()
+
+
+# Instancia global de la memoria de conversación
+conversation_memory = ConversationMemoryStore(
+    backend=create_conversation_backend(
+        os.getenv("CONVERSATION_MEMORY_BACKEND", "memory").lower(),
+        os.getenv("CONVERSATION_MEMORY_PATH", "data/conversations.sqlite3")
+    ),
+    max_tokens_per_session=int(os.getenv("CONVERSATION_MAX_TOKENS", "1024")),
+    summary_max_tokens=int(os.getenv("CONVERSATION_SUMMARY_MAX_TOKENS", "256")),
+    ttl_seconds=float(os.getenv("CONVERSATION_SESSION_TTL", "3600")),
+    max_sessions=int(os.getenv("CONVERSATION_MAX_SESSIONS", "1000"))
+)
@@ -0,0 +1,141 @@
+# deletion_jobs.py
+# Borrados masivos de fragmentos ejecutados en segundo plano con progreso consultable
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .vector_store import vector_db
+
+
+class DeletionJob:
+    def __init__(self, fragment_ids: List[str]):
+        """
+        Representa un borrado de fragmentos por lotes.
+
+        Args:
+            fragment_ids (List[str]): IDs a eliminar
+        """
+        self.job_id = str(uuid.uuid4())
+        self.fragment_ids = list(dict.fromkeys(fragment_ids))
+        self.status = "queued"
+        self.processed = 0
+        self.deleted = 0
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def mark_running(self):
+        """Marca el trabajo como en ejecución."""
+        with self._lock:
+            self.status = "running"
+            self.started_at = datetime.now().isoformat()
+
+    def mark_finished(self, error: Optional[str] = None):
+        """Marca el trabajo como completado, o como fallido si se indica un error."""
+        with self._lock:
+            self.status = "failed" if error else "completed"
+            self.error = error
+            self.finished_at = datetime.now().isoformat()
+
+    def update_progress(self, processed: int, deleted: int):
+        """Registra los IDs procesados y los fragmentos eliminados hasta ahora."""
+        with self._lock:
+            self.processed = processed
+            self.deleted = deleted
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Representación serializable del estado del trabajo."""
+        with self._lock:
+            total = len(self.fragment_ids)
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "total_ids": total,
+                "processed_ids": self.processed,
+                "fragments_deleted": self.deleted,
+                "progress": round(self.processed / total, 4) if total else 1.0,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "error": self.error
+            }
+
+
+class DeletionJobManager:
+    def __init__(self, batch_size: int = 1000, max_retained_jobs: int = 50):
+        """
+        Inicializa el gestor de borrados en segundo plano.
+
+        Los trabajos se ejecutan de uno en uno, para que un borrado masivo no
+        compita consigo mismo por la base vectorial.
+
+        Args:
+            batch_size (int): IDs eliminados por lote
+            max_retained_jobs (int): Máximo de trabajos finalizados que se conservan para consulta
+        """
+        self.batch_size = batch_size
+        self.max_retained_jobs = max_retained_jobs
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="deletion")
+        self.jobs: "OrderedDict[str, DeletionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, fragment_ids: List[str]) -> DeletionJob:
+        """
+        Encola el borrado de una lista de fragmentos.
+
+        Args:
+            fragment_ids (List[str]): IDs a eliminar
+
+        Returns:
+            DeletionJob: Trabajo creado
+        """
+        job = DeletionJob(fragment_ids)
+        with self._lock:
+            self.jobs[job.job_id] = job
+            self._prune_finished_jobs()
+        self.executor.submit(self._run_job, job)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[DeletionJob]:
+        """Obtiene un trabajo por su identificador."""
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """Lista el estado de todos los trabajos conservados."""
+        with self._lock:
+            jobs = list(self.jobs.values())
+        return [job.to_dict() for job in jobs]
+
+    def _run_job(self, job: DeletionJob):
+        """Ejecuta un trabajo en el worker."""
+        job.mark_running()
+        try:
+            vector_db.delete_fragments_in_batches(
+                job.fragment_ids, batch_size=self.batch_size, progress_callback=job.update_progress
+            )
+            job.mark_finished()
+        except Exception as e:
+            job.mark_finished(f"Error eliminando fragmentos: {str(e)}")
+
+    def _prune_finished_jobs(self):
+        """Descarta los trabajos finalizados más antiguos por encima del límite."""
+        if len(self.jobs) <= self.max_retained_jobs:
+            return
+        for job_id in list(self.jobs.keys()):
+            if len(self.jobs) <= self.max_retained_jobs:
+                break
+            if self.jobs[job_id].status in ("completed", "failed"):
+                del self.jobs[job_id]
+
+
+# Instancia global del gestor de borrados en segundo plano
+deletion_job_manager = DeletionJobManager(
+    batch_size=int(os.getenv("FRAGMENT_DELETE_BATCH_SIZE", "1000"))
+)
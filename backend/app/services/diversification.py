@@ -0,0 +1,123 @@
+# diversification.py
+# Diversificación de resultados (MMR) y fusión de fragmentos contiguos del mismo documento
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+def mmr_select(relevance: np.ndarray, embeddings: np.ndarray, k: int, lambda_weight: float = 0.7) -> List[int]:
+    """
+    Selecciona k candidatos con Maximal Marginal Relevance.
+
+    En cada paso elige el candidato que maximiza
+    lambda * relevancia - (1 - lambda) * similitud máxima con los ya elegidos,
+    de modo que fragmentos casi idénticos (p. ej. vecinos con texto solapado)
+    no ocupan varias posiciones del contexto. La similitud entre candidatos se
+    calcula una sola vez como producto matricial.
+
+    Args:
+        relevance (np.ndarray): Relevancia de cada candidato (n,), normalizada a [0, 1]
+        embeddings (np.ndarray): Embeddings de los candidatos (n, dim)
+        k (int): Número de candidatos a elegir
+        lambda_weight (float): 1.0 = solo relevancia, 0.0 = solo diversidad
+
+    Returns:
+        List[int]: Posiciones elegidas, en orden de selección
+    """
+    count = len(relevance)
+    if count == 0 or k <= 0:
+        return []
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1.0, norms)
+    similarities = vectors @ vectors.T
+
+    relevance = np.asarray(relevance, dtype=np.float32)
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarities[selected[0]].copy()
+    available = np.ones(count, dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < min(k, count):
+        scores = lambda_weight * relevance - (1 - lambda_weight) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarities[best], out=max_similarity)
+    return selected
+
+
+def merge_overlapping_text(first: str, second: str, max_overlap: int = 500) -> str:
+    """
+    Une dos fragmentos consecutivos eliminando el texto que comparten.
+
+    Args:
+        first (str): Fragmento anterior
+        second (str): Fragmento siguiente
+        max_overlap (int): Máximo de caracteres de solapamiento a buscar
+
+    Returns:
+        str: Texto unido sin la parte repetida
+    """
+    for size in range(min(len(first), len(second), max_overlap), 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+def merge_adjacent_fragments(fragments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Fusiona fragmentos seleccionados que son contiguos en el mismo documento.
+
+    Los fragmentos consecutivos (fragment_index n y n+1) comparten el texto
+    solapado del troceado; al unirlos ese texto aparece una sola vez. Cada grupo
+    ocupa la posición de su fragmento mejor clasificado y conserva su puntuación.
+
+    Args:
+        fragments (List[Dict]): Fragmentos en orden de relevancia
+
+    Returns:
+        List[Dict]: Fragmentos (fusionados cuando procede) en orden de relevancia,
+            con merged_fragment_ids en los grupos
+    """
+    by_document: Dict[str, List[int]] = {}
+    for position, fragment in enumerate(fragments):
+        by_document.setdefault(fragment["metadata"].get("filename", ""), []).append(position)
+
+    group_of = list(range(len(fragments)))
+    for positions in by_document.values():
+        positions = sorted(positions, key=lambda position: fragments[position]["metadata"].get("fragment_index", 0))
+        for previous, current in zip(positions, positions[1:]):
+            previous_index = fragments[previous]["metadata"].get("fragment_index", 0)
+            if fragments[current]["metadata"].get("fragment_index", 0) == previous_index + 1:
+                group_of[current] = group_of[previous]
+
+    groups: Dict[int, List[int]] = {}
+    for position in range(len(fragments)):
+        groups.setdefault(group_of[position], []).append(position)
+
+    merged = []
+    for members in sorted(groups.values(), key=min):
+        if len(members) == 1:
+            merged.append(fragments[members[0]])
+            continue
+        ordered = sorted(members, key=lambda position: fragments[position]["metadata"].get("fragment_index", 0))
+        content = fragments[ordered[0]]["content"]
+        for position in ordered[1:]:
+            content = merge_overlapping_text(content, fragments[position]["content"])
+        best = fragments[min(members)]
+        page_starts = [fragments[p]["metadata"].get("page_start") for p in ordered if fragments[p]["metadata"].get("page_start") is not None]
+        page_ends = [fragments[p]["metadata"].get("page_end") for p in ordered if fragments[p]["metadata"].get("page_end") is not None]
+        merged.append({
+            **best,
+            "content": content,
+            "merged_fragment_ids": [fragments[position]["fragment_id"] for position in ordered],
+            "metadata": {
+                **best["metadata"],
+                "fragment_index": fragments[ordered[0]]["metadata"].get("fragment_index", 0),
+                "fragment_length": len(content),
+                "page_start": min(page_starts) if page_starts else None,
+                "page_end": max(page_ends) if page_ends else None
+            }
+        })
+    return merged
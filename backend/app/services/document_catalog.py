@@ -0,0 +1,298 @@
+# document_catalog.py
+# Catálogo normalizado de documentos (SQLite) mantenido en la ingesta y en los borrados
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .vector_store import vector_db
+
+# Columnas por documento; los fragmentos solo guardan la clave (filename) y sus datos propios
+CATALOG_FIELDS = (
+    "filename", "document_hash", "title", "author", "subject", "total_pages", "file_size",
+    "text_length", "fragment_count", "upload_timestamp", "upload_date", "content_preview", "updated_at"
+)
+
+
+def build_content_preview(content: str) -> str:
+    """Vista previa de un documento (primeros 200 caracteres)."""
+    content = content or ""
+    return content[:200] + "..." if len(content) > 200 else content
+
+
+class DocumentCatalog:
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Inicializa el catálogo de documentos.
+
+        Guarda una fila por documento con sus metadatos (título, autor, páginas...)
+        y su número de fragmentos, de modo que listar documentos es O(documentos)
+        en lugar de recorrer los metadatos de todos los fragmentos. Las filas se
+        mantienen en memoria y se persisten en SQLite.
+
+        Si el catálogo no coincide con la colección (primer arranque con datos
+        previos, migración o fallo a mitad de una ingesta), se reconstruye una vez
+        recorriendo la colección.
+
+        Args:
+            db_path (str): Ruta del archivo SQLite (None = solo memoria)
+        """
+        self.db_path = db_path
+        self._documents: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self._synchronized = False
+        self._rebuild_required = False
+        # Aumenta con cada modificación (p. ej. para invalidar listados cacheados)
+        self.revision = 0
+
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                filename TEXT PRIMARY KEY,
+                document_hash TEXT,
+                title TEXT,
+                author TEXT,
+                subject TEXT,
+                total_pages INTEGER,
+                file_size INTEGER,
+                text_length INTEGER,
+                fragment_count INTEGER NOT NULL DEFAULT 0,
+                upload_timestamp REAL,
+                upload_date TEXT,
+                content_preview TEXT,
+                updated_at REAL
+            )"""
+        )
+        self._connection.commit()
+        for row in self._connection.execute("SELECT * FROM documents"):
+            self._documents[row["filename"]] = dict(row)
+
+    def upsert_document(self, filename: str, **fields):
+        """
+        Crea o actualiza la fila de un documento.
+
+        Args:
+            filename (str): Clave del documento
+            **fields: Columnas a actualizar (ver CATALOG_FIELDS)
+        """
+        with self._lock:
+            document = {field: None for field in CATALOG_FIELDS}
+            document.update(self._documents.get(filename, {}))
+            document.update({field: value for field, value in fields.items() if field in CATALOG_FIELDS})
+            document.update(filename=filename, updated_at=time.time())
+            document["fragment_count"] = document["fragment_count"] or 0
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO documents ({', '.join(CATALOG_FIELDS)}) "
+                f"VALUES ({', '.join('?' * len(CATALOG_FIELDS))})",
+                [document[field] for field in CATALOG_FIELDS]
+            )
+            self._connection.commit()
+            self._documents[filename] = document
+            self.revision += 1
+
+    def remove_documents(self, filenames: List[str]):
+        """Elimina documentos del catálogo."""
+        with self._lock:
+            self._connection.executemany("DELETE FROM documents WHERE filename = ?", [(name,) for name in filenames])
+            self._connection.commit()
+            for filename in filenames:
+                self._documents.pop(filename, None)
+            self.revision += 1
+
+    def clear(self):
+        """Vacía el catálogo."""
+        with self._lock:
+            self._connection.execute("DELETE FROM documents")
+            self._connection.commit()
+            self._documents = {}
+            self.revision += 1
+
+    def get_document(self, filename: str) -> Optional[Dict[str, Any]]:
+        """Fila de un documento (solo memoria, sin acceder a la colección)."""
+        document = self._documents.get(filename)
+        return dict(document) if document else None
+
+    def find_document(self, filename: str, document_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca un documento almacenado con el mismo nombre y hash de archivo.
+
+        Args:
+            filename (str): Nombre del documento
+            document_hash (str): Hash SHA-256 del archivo
+
+        Returns:
+            Optional[Dict[str, Any]]: Fila del documento o None
+        """
+        self.ensure_synchronized()
+        document = self.get_document(filename)
+        if document and document["document_hash"] == document_hash and document["fragment_count"]:
+            return document
+        return None
+
+    def list_documents(self) -> List[Dict[str, Any]]:
+        """
+        Lista los documentos, del más reciente al más antiguo.
+
+        Returns:
+            List[Dict[str, Any]]: Filas del catálogo
+        """
+        self.ensure_synchronized()
+        with self._lock:
+            documents = [dict(document) for document in self._documents.values()]
+        documents.sort(key=lambda document: document.get("upload_timestamp") or 0, reverse=True)
+        return documents
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene totales del catálogo.
+
+        Returns:
+            Dict[str, Any]: Documentos y fragmentos registrados
+        """
+        with self._lock:
+            return {
+                "synchronized": self._synchronized,
+                "documents": len(self._documents),
+                "fragments": sum(document["fragment_count"] or 0 for document in self._documents.values())
+            }
+
+    def invalidate(self):
+        """
+        Marca el catálogo para reconstruirse en la próxima lectura.
+
+        Se usa cuando los eventos de cambio no reflejan el estado real, p. ej. al
+        deshacer una ingesta fallida: el borrado de sus fragmentos nuevos se
+        descontaría de la versión previa del documento, que sigue almacenada.
+        """
+        with self._lock:
+            self._rebuild_required = True
+            self._synchronized = False
+
+    def ensure_synchronized(self):
+        """Reconstruye el catálogo desde la colección si sus totales no coinciden."""
+        if self._synchronized:
+            return
+        with self._lock:
+            if self._synchronized:
+                return
+            if vector_db.is_available() and (
+                self._rebuild_required or vector_db.doc_collection.count() != self.get_stats()["fragments"]
+            ):
+                self.rebuild_from_collection()
+                self._rebuild_required = False
+            self._synchronized = True
+
+    def rebuild_from_collection(self):
+        """Recorre la colección una vez y regenera las filas de todos los documentos."""
+        started = time.perf_counter()
+        documents: Dict[str, Dict[str, Any]] = {}
+        first_fragment_index: Dict[str, int] = {}
+        for page in vector_db.iter_fragment_pages():
+            for content, metadata in zip(page["documents"], page["metadatas"]):
+                metadata = metadata or {}
+                filename = metadata.get("filename", "unknown")
+                fragment_index = metadata.get("fragment_index", 0)
+                if filename not in documents:
+                    documents[filename] = self._document_from_fragment(metadata, content)
+                    first_fragment_index[filename] = fragment_index
+                elif fragment_index < first_fragment_index[filename]:
+                    # La vista previa del documento es la de su primer fragmento
+                    documents[filename]["content_preview"] = build_content_preview(content)
+                    first_fragment_index[filename] = fragment_index
+                documents[filename]["fragment_count"] += 1
+
+        with self._lock:
+            previous = self._documents
+            self.clear()
+            for filename, document in documents.items():
+                # Conservar datos que solo conoce la ingesta (tamaño, longitud de texto)
+                kept = {field: value for field, value in previous.get(filename, {}).items()
+                        if value is not None and field != "filename"}
+                self.upsert_document(filename, **{**kept, **{k: v for k, v in document.items() if v is not None}})
+        print(f"📚 Catálogo de documentos reconstruido: {len(documents)} documentos "
+              f"en {time.perf_counter() - started:.2f}s")
+
+    def handle_collection_change(self, change: Dict[str, Any]):
+        """
+        Aplica un cambio de la colección al catálogo.
+
+        Args:
+            change (Dict[str, Any]): Evento de cambio emitido por VectorDatabase
+        """
+        operation = change["operation"]
+        if operation == "clear":
+            self.clear()
+        elif operation == "remove_document":
+            self.remove_documents(change["documents"])
+        elif operation == "delete_fragments":
+            fragments = change.get("fragments")
+            if fragments is None:
+                # Borrado sin detalle por fragmento: resincronizar en la próxima lectura
+                self._synchronized = False
+                return
+            # Se descuentan los fragmentos eliminados de cada documento (sin releer la colección)
+            deleted_by_document = Counter((metadata or {}).get("filename", "") for metadata in fragments["metadatas"])
+            for filename, deleted in deleted_by_document.items():
+                document = self._documents.get(filename)
+                if document is None:
+                    continue
+                fragment_count = (document.get("fragment_count") or 0) - deleted
+                if fragment_count > 0:
+                    self.upsert_document(filename, fragment_count=fragment_count)
+                else:
+                    self.remove_documents([filename])
+        elif operation == "store":
+            fragments = change.get("fragments")
+            if fragments is None:
+                # Alta sin detalle (p. ej. migración): resincronizar en la próxima lectura
+                self._synchronized = False
+                return
+            # Fila provisional para documentos nuevos, contada con los fragmentos del
+            # propio evento (sin consultar la colección); la ingesta fija después sus totales
+            new_documents: Dict[str, Dict[str, Any]] = {}
+            for content, metadata in zip(fragments["documents"], fragments["metadatas"]):
+                filename = (metadata or {}).get("filename", "unknown")
+                if filename in self._documents:
+                    continue
+                if filename not in new_documents:
+                    new_documents[filename] = self._document_from_fragment(metadata or {}, content)
+                new_documents[filename]["fragment_count"] += 1
+            for filename, document in new_documents.items():
+                self.upsert_document(filename, **document)
+
+    def _document_from_fragment(self, metadata: Dict[str, Any], content: str) -> Dict[str, Any]:
+        """Fila inicial a partir de un fragmento (admite los metadatos por fragmento anteriores)."""
+        upload_timestamp = metadata.get("upload_timestamp")
+        upload_date = metadata.get("processing_timestamp")
+        if upload_timestamp is None and upload_date:
+            try:
+                upload_timestamp = datetime.fromisoformat(upload_date).timestamp()
+            except ValueError:
+                upload_timestamp = None
+        if upload_date is None and upload_timestamp is not None:
+            upload_date = datetime.fromtimestamp(upload_timestamp).isoformat()
+        return {
+            "document_hash": metadata.get("document_hash"),
+            "title": metadata.get("document_title"),
+            "author": metadata.get("document_author"),
+            "subject": metadata.get("document_subject"),
+            "total_pages": metadata.get("total_pages"),
+            "upload_timestamp": upload_timestamp,
+            "upload_date": upload_date,
+            "content_preview": build_content_preview(content),
+            "fragment_count": 0
+        }
+
+
+# Instancia global del catálogo de documentos
+document_catalog = DocumentCatalog(os.getenv("DOCUMENT_CATALOG_PATH", "data/document_catalog.sqlite3"))
+vector_db.subscribe(document_catalog.handle_collection_change)
@@ -0,0 +1,249 @@
+# embedding_cache.py
+# Caché de embeddings en dos niveles: LRU en memoria delante de un almacén SQLite local
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .hashing import hash_text
+
+
+class EmbeddingCache:
+    def __init__(self, db_path: Optional[str] = None, max_memory_entries: int = 10000,
+                 max_disk_entries: int = 500000):
+        """
+        Inicializa la caché de embeddings.
+
+        Las claves combinan el nombre del modelo y el hash del texto, de modo que
+        cambiar de modelo invalida automáticamente las entradas previas. El
+        almacén SQLite también está acotado: al superar max_disk_entries se
+        eliminan las entradas usadas hace más tiempo (last_used). Los aciertos
+        en memoria no escriben en SQLite: su last_used se acumula y se vuelca
+        solo antes de expulsar entradas del disco.
+
+        Args:
+            db_path (str): Ruta del archivo SQLite persistente (None = solo memoria)
+            max_memory_entries (int): Máximo de vectores en el LRU en memoria
+            max_disk_entries (int): Máximo de vectores en SQLite (0 = sin límite)
+        """
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._disk_entries = 0
+        self.disk_evictions = 0
+        self._memory: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._pending_touches: "OrderedDict[tuple, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            try:
+                directory = os.path.dirname(db_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._connection = sqlite3.connect(db_path, check_same_thread=False)
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute(
+                    """CREATE TABLE IF NOT EXISTS embeddings (
+                        model_name TEXT NOT NULL,
+                        text_hash TEXT NOT NULL,
+                        dimension INTEGER NOT NULL,
+                        vector BLOB NOT NULL,
+                        last_used REAL NOT NULL DEFAULT 0,
+                        PRIMARY KEY (model_name, text_hash)
+                    )"""
+                )
+                columns = {row[1] for row in self._connection.execute("PRAGMA table_info(embeddings)")}
+                if "last_used" not in columns:
+                    # Cachés creadas antes del límite en disco
+                    self._connection.execute("ALTER TABLE embeddings ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+                self._connection.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+                self._connection.commit()
+                # Recuento mantenido en memoria; get_stats no recorre la tabla
+                self._disk_entries = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            except Exception as e:
+                self._connection = None
+                print(f"⚠️ Caché persistente de embeddings no disponible: {str(e)}")
+
+    def get_many(self, model_name: str, texts: List[str]) -> Dict[int, np.ndarray]:
+        """
+        Busca embeddings cacheados para una lista de textos.
+
+        Args:
+            model_name (str): Modelo que generó los embeddings
+            texts (List[str]): Textos a buscar
+
+        Returns:
+            Dict[int, np.ndarray]: Vector float32 por posición de los textos encontrados
+        """
+        found: Dict[int, np.ndarray] = {}
+        disk_lookups: Dict[str, List[int]] = {}
+        disk_hashes: List[str] = []
+        now = time.time()
+
+        with self._lock:
+            for position, text in enumerate(texts):
+                key = (model_name, hash_text(text))
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[position] = vector
+                    self._defer_touch(key, now)
+                    self.memory_hits += 1
+                else:
+                    disk_lookups.setdefault(key[1], []).append(position)
+
+            if disk_lookups and self._connection is not None:
+                hashes = list(disk_lookups.keys())
+                # SQLite limita el número de parámetros por consulta
+                for offset in range(0, len(hashes), 500):
+                    hash_slice = hashes[offset:offset + 500]
+                    placeholders = ",".join("?" * len(hash_slice))
+                    rows = self._connection.execute(
+                        f"SELECT text_hash, vector FROM embeddings "
+                        f"WHERE model_name = ? AND text_hash IN ({placeholders})",
+                        [model_name, *hash_slice]
+                    ).fetchall()
+                    for text_hash, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        self._remember((model_name, text_hash), vector)
+                        disk_hashes.append(text_hash)
+                        for position in disk_lookups.pop(text_hash):
+                            found[position] = vector
+                            self.disk_hits += 1
+
+            self.misses += sum(len(positions) for positions in disk_lookups.values())
+            self._touch(model_name, disk_hashes)
+
+        return found
+
+    def put_many(self, model_name: str, texts: List[str], vectors) -> None:
+        """
+        Guarda embeddings en memoria y en el almacén persistente.
+
+        Args:
+            model_name (str): Modelo que generó los embeddings
+            texts (List[str]): Textos originales
+            vectors: Matriz (n, dim) o lista de vectores correspondientes
+        """
+        rows = {}
+        now = time.time()
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                vector = np.ascontiguousarray(vector, dtype=np.float32)
+                text_hash = hash_text(text)
+                self._remember((model_name, text_hash), vector)
+                rows[text_hash] = (model_name, text_hash, int(vector.shape[0]), vector.tobytes(), now)
+
+            if rows and self._connection is not None:
+                try:
+                    existing = len(self._find_stored_hashes(model_name, list(rows.keys())))
+                    self._connection.executemany(
+                        "INSERT OR REPLACE INTO embeddings (model_name, text_hash, dimension, vector, last_used) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        list(rows.values())
+                    )
+                    self._disk_entries += len(rows) - existing
+                    self._evict_disk_entries()
+                    self._connection.commit()
+                except Exception as e:
+                    print(f"⚠️ Error guardando embeddings en caché: {str(e)}")
+
+    def get_stats(self) -> dict:
+        """
+        Obtiene contadores de aciertos/fallos y ocupación de la caché.
+
+        Returns:
+            dict: Estadísticas de la caché
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "enabled": True,
+                "persistent": self._connection is not None,
+                "db_path": self.db_path,
+                "memory_entries": len(self._memory),
+                "max_memory_entries": self.max_memory_entries,
+                "disk_entries": self._disk_entries,
+                "max_disk_entries": self.max_disk_entries,
+                "disk_evictions": self.disk_evictions,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+            }
+
+    def _find_stored_hashes(self, model_name: str, text_hashes: List[str]) -> set:
+        """Hashes de la lista que ya están en el almacén SQLite."""
+        stored = set()
+        # SQLite limita el número de parámetros por consulta
+        for offset in range(0, len(text_hashes), 500):
+            hash_slice = text_hashes[offset:offset + 500]
+            placeholders = ",".join("?" * len(hash_slice))
+            stored.update(row[0] for row in self._connection.execute(
+                f"SELECT text_hash FROM embeddings WHERE model_name = ? AND text_hash IN ({placeholders})",
+                [model_name, *hash_slice]
+            ))
+        return stored
+
+    def _defer_touch(self, key: tuple, used_at: float):
+        """Anota el uso de una entrada servida desde memoria para volcarlo más tarde."""
+        if self._connection is None or not self.max_disk_entries:
+            return
+        self._pending_touches[key] = used_at
+        self._pending_touches.move_to_end(key)
+        while len(self._pending_touches) > self.max_memory_entries:
+            self._pending_touches.popitem(last=False)
+
+    def _flush_touches(self):
+        """Vuelca a SQLite el last_used acumulado de los aciertos en memoria."""
+        if not self._pending_touches:
+            return
+        self._connection.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE model_name = ? AND text_hash = ?",
+            [(used_at, model_name, text_hash) for (model_name, text_hash), used_at in self._pending_touches.items()]
+        )
+        self._pending_touches.clear()
+
+    def _touch(self, model_name: str, text_hashes: List[str]):
+        """Actualiza last_used de las entradas leídas de disco (orden LRU del almacén)."""
+        if not text_hashes or self._connection is None:
+            return
+        try:
+            now = time.time()
+            self._connection.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model_name = ? AND text_hash = ?",
+                [(now, model_name, text_hash) for text_hash in dict.fromkeys(text_hashes)]
+            )
+            self._connection.commit()
+        except Exception as e:
+            print(f"⚠️ Error actualizando uso de la caché de embeddings: {str(e)}")
+
+    def _evict_disk_entries(self):
+        """Elimina las entradas usadas hace más tiempo por encima de max_disk_entries."""
+        if not self.max_disk_entries or self._disk_entries <= self.max_disk_entries:
+            return
+        self._flush_touches()
+        # Se libera un 10% extra para no expulsar en cada inserción
+        excess = self._disk_entries - self.max_disk_entries + self.max_disk_entries // 10
+        deleted = self._connection.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,)
+        ).rowcount
+        self._disk_entries -= deleted
+        self.disk_evictions += deleted
+
+    def _remember(self, key: tuple, vector: np.ndarray):
+        """Inserta en el LRU en memoria descartando la entrada menos usada."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
@@ -1,65 +1,183 @@
 # embeddings.py
 # Servicio para generar embeddings usando modelos de transformers
 from sentence_transformers import SentenceTransformer
-from typing import List
+from typing import List, Optional
 import numpy as np
+import os
+import threading
+from .embedding_cache import EmbeddingCache
 
 class EmbeddingManager:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 batch_size: int = 32, window_size: int = 1024):
         """
         Inicializa el gestor de embeddings.
-        
+
+        El modelo se carga de forma perezosa y thread-safe la primera vez que se
+        necesita (o durante el warm-up), para que importar la API sea inmediato.
+
         Args:
             model_name (str): Nombre del modelo de sentence-transformers a usar
+            embedding_cache (EmbeddingCache): Caché de embeddings (opcional)
+            batch_size (int): Textos por lote enviado al modelo
+            window_size (int): Textos por ventana; acota la memoria de listas muy grandes
         """
-        self.transformer_model = SentenceTransformer(model_name)
         self.model_name = model_name
-    
-    def create_embeddings(self, text_chunks: List[str]) -> List[List[float]]:
+        self.embedding_cache = embedding_cache
+        self.batch_size = batch_size
+        self.window_size = max(window_size, batch_size)
+        self._transformer_model = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def transformer_model(self) -> SentenceTransformer:
+        """Modelo de sentence-transformers, cargado en el primer acceso."""
+        if self._transformer_model is None:
+            with self._model_lock:
+                if self._transformer_model is None:
+                    self._transformer_model = SentenceTransformer(self.model_name)
+        return self._transformer_model
+
+    @property
+    def vector_dimension(self) -> int:
+        """Dimensión de los vectores generados por el modelo."""
+        return self.transformer_model.get_sentence_embedding_dimension()
+
+    def is_loaded(self) -> bool:
+        """Indica si el modelo ya está cargado en memoria."""
+        return self._transformer_model is not None
+
+    def warm_up(self):
+        """Carga el modelo y ejecuta una codificación mínima."""
+        self.transformer_model.encode(["warm-up"], show_progress_bar=False)
+
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Codifica textos con el modelo agrupándolos por longitud.
+
+        Los textos se ordenan por longitud para que cada lote tenga un padding
+        mínimo y se procesan en ventanas de window_size; el resultado se escribe
+        en una única matriz float32 contigua en el orden original.
+
+        Args:
+            texts (List[str]): Textos a codificar
+
+        Returns:
+            np.ndarray: Matriz (len(texts), dimensión) float32
+        """
+        output = np.empty((len(texts), self.vector_dimension), dtype=np.float32)
+        if not texts:
+            return output
+
+        sorted_positions = np.argsort([-len(text) for text in texts], kind="stable")
+        for window_start in range(0, len(texts), self.window_size):
+            window_positions = sorted_positions[window_start:window_start + self.window_size]
+            window_vectors = self.transformer_model.encode(
+                [texts[position] for position in window_positions],
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+            output[window_positions] = window_vectors
+        return output
+
+    def create_embeddings(self, text_chunks: List[str]) -> np.ndarray:
         """
         Genera embeddings vectoriales para una lista de fragmentos de texto.
-        
+
+        Los textos ya vistos con el mismo modelo se sirven desde la caché y solo
+        los restantes pasan por el modelo.
+
         Args:
             text_chunks (List[str]): Lista de fragmentos de texto para procesar
-            
+
         Returns:
-            List[List[float]]: Lista de vectores embedding
+            np.ndarray: Matriz float32 contigua (len(text_chunks), dimensión)
         """
         try:
-            #Optimizar para documentos muy grandes
-            vector_embeddings = self.transformer_model.encode(text_chunks)
-            return vector_embeddings.tolist()
+            if self.embedding_cache is None:
+                return self.encode_texts(text_chunks)
+
+            if not text_chunks:
+                return self.encode_texts(text_chunks)
+
+            cached_vectors = self.embedding_cache.get_many(self.model_name, text_chunks)
+            missing_positions = [i for i in range(len(text_chunks)) if i not in cached_vectors]
+
+            # El modelo solo se carga si falta algún vector; con todo en caché la
+            # dimensión sale de los propios vectores cacheados
+            new_vectors = None
+            if missing_positions:
+                # Textos repetidos dentro de la misma llamada se codifican una sola vez
+                missing_texts = list(dict.fromkeys(text_chunks[i] for i in missing_positions))
+                #Optimizar para documentos muy grandes
+                new_vectors = self.encode_texts(missing_texts)
+                self.embedding_cache.put_many(self.model_name, missing_texts, new_vectors)
+                dimension = new_vectors.shape[1]
+            else:
+                dimension = next(iter(cached_vectors.values())).shape[0]
+
+            embedding_matrix = np.empty((len(text_chunks), dimension), dtype=np.float32)
+            for position, vector in cached_vectors.items():
+                embedding_matrix[position] = vector
+            if new_vectors is not None:
+                row_by_text = {text: row for row, text in enumerate(missing_texts)}
+                for position in missing_positions:
+                    embedding_matrix[position] = new_vectors[row_by_text[text_chunks[position]]]
+
+            return embedding_matrix
         except Exception as e:
             raise Exception(f"Error generando embeddings: {str(e)}")
-    
-    def create_single_embedding(self, text: str) -> List[float]:
+
+    def create_single_embedding(self, text: str) -> np.ndarray:
         """
         Genera embedding para un fragmento individual de texto.
-        
+
         Args:
             text (str): Texto para convertir a vector
-            
+
         Returns:
-            List[float]: Vector embedding del texto
+            np.ndarray: Vector embedding float32 del texto
         """
         try:
-            embedding_vector = self.transformer_model.encode([text])
-            return embedding_vector[0].tolist()
+            return self.create_embeddings([text])[0]
         except Exception as e:
             raise Exception(f"Error creando embedding individual: {str(e)}")
-    
+
     def get_transformer_info(self) -> dict:
         """
         Obtiene información técnica del modelo transformer utilizado.
-        
+
+        No carga el modelo: si aún no está en memoria (p. ej. una ingesta servida
+        entera desde la caché) la longitud máxima y la dimensión son None.
+
         Returns:
             dict: Detalles del modelo
         """
+        loaded = self.is_loaded()
         return {
             "model_name": self.model_name,
-            "max_sequence_length": self.transformer_model.max_seq_length,
-            "vector_dimension": self.transformer_model.get_sentence_embedding_dimension()
+            "model_loaded": loaded,
+            "max_sequence_length": self._transformer_model.max_seq_length if loaded else None,
+            "vector_dimension": self.vector_dimension if loaded else None,
+            "batch_size": self.batch_size,
+            "window_size": self.window_size,
+            "embedding_cache": self.embedding_cache.get_stats() if self.embedding_cache else {"enabled": False}
         }
 
 # Instancia global del gestor de embeddings
-document_embedding_manager = EmbeddingManager()
+embedding_cache = None
+if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true":
+    embedding_cache = EmbeddingCache(
+        db_path=os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite3") or None,
+        max_memory_entries=int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "10000")),
+        max_disk_entries=int(os.getenv("EMBEDDING_CACHE_MAX_DISK_ENTRIES", "500000"))
+    )
+
+document_embedding_manager = EmbeddingManager(
+    model_name=os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+    embedding_cache=embedding_cache,
+    batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "32")),
+    window_size=int(os.getenv("EMBEDDING_WINDOW_SIZE", "1024"))
+)
@@ -0,0 +1,51 @@
+# hashing.py
+# Utilidades de hashing de contenido para deduplicación e identificadores deterministas
+import hashlib
+
+# Tamaño de bloque para leer archivos sin cargarlos completos en memoria
+FILE_HASH_BLOCK_SIZE = 1024 * 1024
+
+def hash_text(text: str) -> str:
+    """
+    Calcula el hash SHA-256 de un texto.
+
+    Args:
+        text (str): Texto a procesar
+
+    Returns:
+        str: Hash hexadecimal del contenido
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def hash_file(file_path: str) -> str:
+    """
+    Calcula el hash SHA-256 de un archivo leyéndolo por bloques.
+
+    Args:
+        file_path (str): Ruta al archivo
+
+    Returns:
+        str: Hash hexadecimal del archivo
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as file_handle:
+        for block in iter(lambda: file_handle.read(FILE_HASH_BLOCK_SIZE), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def build_fragment_id(filename: str, chunk_hash: str, occurrence: int = 0) -> str:
+    """
+    Genera un identificador determinista para un fragmento de documento.
+
+    El id depende solo del documento y del contenido del fragmento, de modo que
+    volver a ingerir el mismo texto produce el mismo id (upsert idempotente).
+
+    Args:
+        filename (str): Nombre del documento al que pertenece el fragmento
+        chunk_hash (str): Hash del contenido del fragmento
+        occurrence (int): Número de repeticiones previas del mismo texto en el documento
+
+    Returns:
+        str: Identificador del fragmento
+    """
+    return hashlib.sha256(f"{filename}\x00{chunk_hash}\x00{occurrence}".encode("utf-8")).hexdigest()[:32]
@@ -0,0 +1,423 @@
+# ingestion_jobs.py
+# Cola de trabajos de ingesta de PDFs ejecutada en un pool acotado de workers
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from .pdf_processing import PDFDocumentStream
+from .hashing import hash_file, hash_text, build_fragment_id
+from .embeddings import document_embedding_manager
+from .vector_store import vector_db
+from .document_catalog import document_catalog, build_content_preview
+
+# Etapas del pipeline de ingesta en orden de ejecución
+INGESTION_STAGES = ["extract", "chunk", "embed", "store"]
+
+
+class IngestionQueueFullError(Exception):
+    """Se lanza cuando la cola de ingesta alcanzó su capacidad máxima."""
+
+
+class IngestionJob:
+    def __init__(self, filename: str, temporary_path: str):
+        """
+        Representa un trabajo de ingesta de un documento PDF.
+
+        Args:
+            filename (str): Nombre original del archivo subido
+            temporary_path (str): Ruta del archivo temporal a procesar
+        """
+        self.job_id = str(uuid.uuid4())
+        self.filename = filename
+        self.temporary_path = temporary_path
+        self.status = "queued"
+        self.current_stage = None
+        self.stages = {
+            stage: {"status": "pending", "started_at": None, "finished_at": None, "progress": 0.0}
+            for stage in INGESTION_STAGES
+        }
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def mark_running(self):
+        """Marca el trabajo como en ejecución."""
+        with self._lock:
+            self.status = "running"
+            self.started_at = datetime.now().isoformat()
+
+    def mark_completed(self, result: Dict[str, Any]):
+        """Marca el trabajo como completado con su resultado."""
+        with self._lock:
+            self.status = "completed"
+            self.result = result
+            self.finished_at = datetime.now().isoformat()
+
+    def mark_failed(self, error: str):
+        """Marca el trabajo y la etapa en curso como fallidos."""
+        with self._lock:
+            self.status = "failed"
+            self.error = error
+            if self.current_stage:
+                self.stages[self.current_stage]["status"] = "failed"
+            self.finished_at = datetime.now().isoformat()
+
+    def is_stage_pending(self, stage: str) -> bool:
+        """Indica si una etapa todavía no ha empezado."""
+        with self._lock:
+            return self.stages[stage]["status"] == "pending"
+
+    def start_stage(self, stage: str):
+        """Marca el inicio de una etapa del pipeline."""
+        with self._lock:
+            self.current_stage = stage
+            self.stages[stage]["status"] = "running"
+            self.stages[stage]["started_at"] = datetime.now().isoformat()
+
+    def update_stage_progress(self, stage: str, progress: float):
+        """Actualiza el progreso (0.0 - 1.0) de una etapa."""
+        with self._lock:
+            self.stages[stage]["progress"] = round(min(max(progress, 0.0), 1.0), 4)
+
+    def finish_stage(self, stage: str):
+        """Marca una etapa como completada."""
+        with self._lock:
+            self.stages[stage]["status"] = "completed"
+            self.stages[stage]["progress"] = 1.0
+            self.stages[stage]["finished_at"] = datetime.now().isoformat()
+
+    def skip_stage(self, stage: str):
+        """Marca una etapa como omitida (p. ej. documento sin cambios)."""
+        with self._lock:
+            self.stages[stage]["status"] = "skipped"
+            self.stages[stage]["progress"] = 1.0
+            self.stages[stage]["finished_at"] = datetime.now().isoformat()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Representación serializable del estado del trabajo."""
+        with self._lock:
+            completed_stages = sum(1 for s in self.stages.values() if s["status"] in ("completed", "skipped"))
+            return {
+                "job_id": self.job_id,
+                "filename": self.filename,
+                "status": self.status,
+                "current_stage": self.current_stage,
+                "stages": {name: dict(info) for name, info in self.stages.items()},
+                "overall_progress": round(completed_stages / len(INGESTION_STAGES), 4),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "result": self.result,
+                "error": self.error
+            }
+
+
+def _build_unchanged_result(job: IngestionJob, document_hash: str, existing: Dict[str, Any]) -> Dict[str, Any]:
+    """Respuesta para un documento idéntico al ya almacenado (no se reprocesa)."""
+    return {
+        "filename": job.filename,
+        "status": "Documento sin cambios: ya estaba almacenado, no se reprocesó.",
+        "unchanged": True,
+        "document_hash": document_hash,
+        "document_stats": {
+            "text_length": 0,
+            "total_pages": existing["total_pages"] or 0,
+            "fragments_count": existing["fragment_count"],
+            "embeddings_count": 0,
+            "embeddings_computed": 0,
+            "embeddings_reused": 0,
+            "vector_dimension": 0,
+        },
+        "stored_fragment_ids": [],
+        "sample_fragments": [],
+        "document_metadata": {
+            "title": existing["title"] or "",
+            "author": existing["author"] or "",
+            "subject": existing["subject"] or "",
+            "total_pages": existing["total_pages"] or 0
+        },
+        "model_info": document_embedding_manager.get_transformer_info(),
+        "database_status": vector_db.get_database_status()
+    }
+
+
+def ingest_pdf_document(job: IngestionJob, batch_size: int = 64,
+                        parallel_extraction: bool = False) -> Dict[str, Any]:
+    """
+    Ejecuta el pipeline de ingesta (extract, chunk, embed, store) en una sola pasada.
+
+    El PDF se abre una única vez y los fragmentos se embeben y almacenan en lotes
+    acotados a medida que se recorren las páginas, de modo que la memoria pico no
+    crece con el tamaño del documento. Un archivo idéntico al ya almacenado con el
+    mismo nombre no se reprocesa, y los fragmentos cuyo texto ya existe reutilizan
+    su embedding almacenado.
+
+    Args:
+        job (IngestionJob): Trabajo con la ruta del PDF a procesar
+        batch_size (int): Número máximo de fragmentos por lote de embedding/almacenamiento
+        parallel_extraction (bool): Extraer las páginas con un pool de procesos
+
+    Returns:
+        Dict[str, Any]: Estadísticas finales del procesamiento
+    """
+    #Deduplicación a nivel de archivo
+    document_hash = hash_file(job.temporary_path)
+    existing_document = document_catalog.find_document(job.filename, document_hash)
+    if existing_document:
+        for stage in INGESTION_STAGES:
+            job.skip_stage(stage)
+        return _build_unchanged_result(job, document_hash, existing_document)
+
+    # IDs de una versión previa del documento (re-ingesta con contenido distinto)
+    previous_fragment_ids = set(vector_db.get_document_fragment_ids(job.filename))
+
+    stored_fragment_ids: List[str] = []
+    sample_fragments: List[str] = []
+    chunk_occurrences: Dict[str, int] = {}
+    embeddings_computed = 0
+    embeddings_reused = 0
+    vector_dimension = 0
+    processing_time = datetime.now()
+    processing_timestamp = processing_time.isoformat()
+
+    try:
+        with PDFDocumentStream(job.temporary_path, fragment_size=1000,
+                               fragment_overlap=200, batch_size=batch_size,
+                               parallel_extraction=parallel_extraction) as document_stream:
+            document_metadata = document_stream.metadata
+            total_pages = document_stream.total_pages or 1
+
+            #Extraer y fragmentar el contenido página a página
+            job.start_stage("extract")
+            job.start_stage("chunk")
+            for fragment_batch in document_stream.iter_fragment_batches():
+                page_progress = document_stream.pages_processed / total_pages
+                job.update_stage_progress("extract", page_progress)
+                job.update_stage_progress("chunk", page_progress)
+                batch_texts = [fragment["text"] for fragment in fragment_batch]
+                batch_hashes = [hash_text(fragment_text) for fragment_text in batch_texts]
+
+                #Generar vectores embedding solo para contenido no visto
+                if job.is_stage_pending("embed"):
+                    job.start_stage("embed")
+                embeddings_by_hash = vector_db.get_embeddings_by_chunk_hashes(batch_hashes)
+                reused_count = sum(1 for chunk_hash in batch_hashes if chunk_hash in embeddings_by_hash)
+                pending_texts = {}
+                for chunk_hash, fragment_text in zip(batch_hashes, batch_texts):
+                    if chunk_hash not in embeddings_by_hash:
+                        pending_texts.setdefault(chunk_hash, fragment_text)
+                if pending_texts:
+                    new_vectors = document_embedding_manager.create_embeddings(list(pending_texts.values()))
+                    embeddings_by_hash.update(zip(pending_texts.keys(), new_vectors))
+                embeddings_computed += len(pending_texts)
+                embeddings_reused += reused_count
+                # Matriz float32 contigua del lote (las filas reutilizadas y nuevas se copian una vez)
+                embedding_vectors = np.stack([embeddings_by_hash[chunk_hash] for chunk_hash in batch_hashes])
+                embedding_vectors = embedding_vectors.astype(np.float32, copy=False)
+                vector_dimension = int(embedding_vectors.shape[1])
+                job.update_stage_progress("embed", page_progress)
+
+                #Preparar metadatos detallados e IDs deterministas para cada fragmento
+                if job.is_stage_pending("store"):
+                    job.start_stage("store")
+                fragments_metadata = []
+                batch_ids = []
+                for fragment, chunk_hash in zip(fragment_batch, batch_hashes):
+                    fragment_text = fragment["text"]
+                    occurrence = chunk_occurrences.get(chunk_hash, 0)
+                    chunk_occurrences[chunk_hash] = occurrence + 1
+                    batch_ids.append(build_fragment_id(job.filename, chunk_hash, occurrence))
+                    # Los datos del documento (título, autor, páginas...) viven en el catálogo;
+                    # el fragmento solo guarda la clave del documento y lo necesario para filtrar
+                    fragment_meta = {
+                        "filename": job.filename,
+                        "document_hash": document_hash,
+                        "chunk_hash": chunk_hash,
+                        "fragment_index": fragment["fragment_index"],
+                        "fragment_length": len(fragment_text),
+                        "page_start": fragment["page_start"],
+                        "page_end": fragment["page_end"],
+                        "upload_timestamp": processing_time.timestamp()
+                    }
+                    fragments_metadata.append(fragment_meta)
+
+                #Almacenar (upsert) el lote en base de datos vectorial
+                stored_fragment_ids.extend(
+                    vector_db.store_document_chunks(batch_texts, embedding_vectors, fragments_metadata, batch_ids)
+                )
+                job.update_stage_progress("store", page_progress)
+
+                if len(sample_fragments) < 3:
+                    sample_fragments.extend(batch_texts[:3 - len(sample_fragments)])
+
+            # Eliminar fragmentos de la versión anterior que ya no existen
+            stale_fragment_ids = list(previous_fragment_ids.difference(stored_fragment_ids))
+            if stale_fragment_ids:
+                vector_db.delete_fragments_by_ids(stale_fragment_ids)
+
+            document_catalog.upsert_document(
+                job.filename,
+                document_hash=document_hash,
+                title=document_metadata.get('title', ''),
+                author=document_metadata.get('author', ''),
+                subject=document_metadata.get('subject', ''),
+                total_pages=document_metadata.get('total_pages', 0),
+                file_size=os.path.getsize(job.temporary_path),
+                text_length=document_stream.text_length,
+                fragment_count=len(set(stored_fragment_ids)),
+                upload_timestamp=processing_time.timestamp(),
+                upload_date=processing_timestamp,
+                content_preview=build_content_preview(sample_fragments[0]) if sample_fragments else ""
+            )
+
+            for stage in INGESTION_STAGES:
+                job.finish_stage(stage)
+    except Exception:
+        # No dejar documentos parcialmente almacenados (conservando la versión previa)
+        new_fragment_ids = list(set(stored_fragment_ids).difference(previous_fragment_ids))
+        if new_fragment_ids:
+            vector_db.delete_fragments_by_ids(new_fragment_ids)
+        if stored_fragment_ids:
+            # Los eventos de la reversión no cuadran con la versión previa del documento
+            document_catalog.invalidate()
+        raise
+
+    return {
+        "filename": job.filename,
+        "status": "Documento procesado y almacenado exitosamente.",
+        "unchanged": False,
+        "document_hash": document_hash,
+        "document_stats": {
+            "text_length": document_stream.text_length,
+            "total_pages": document_metadata.get('total_pages', 0),
+            "fragments_count": document_stream.fragments_count,
+            "embeddings_count": embeddings_computed + embeddings_reused,
+            "embeddings_computed": embeddings_computed,
+            "embeddings_reused": embeddings_reused,
+            "stale_fragments_removed": len(stale_fragment_ids),
+            "vector_dimension": vector_dimension,
+        },
+        "stored_fragment_ids": stored_fragment_ids,
+        "sample_fragments": sample_fragments,  # Primeros 3 fragmentos como muestra
+        "document_metadata": document_metadata,
+        "model_info": document_embedding_manager.get_transformer_info(),
+        "database_status": vector_db.get_database_status()
+    }
+
+
+class IngestionJobManager:
+    def __init__(self, max_workers: int = 2, max_pending_jobs: int = 20, max_retained_jobs: int = 200,
+                 batch_size: int = 64, parallel_extraction: bool = False,
+                 pipeline: Callable[..., Dict[str, Any]] = ingest_pdf_document):
+        """
+        Inicializa el gestor de trabajos de ingesta.
+
+        Args:
+            max_workers (int): Número de workers que procesan documentos en paralelo
+            max_pending_jobs (int): Máximo de trabajos en cola o en ejecución
+            max_retained_jobs (int): Máximo de trabajos finalizados que se conservan para consulta
+            batch_size (int): Fragmentos por lote de embedding/almacenamiento
+            parallel_extraction (bool): Extraer páginas de PDFs grandes con varios procesos
+            pipeline (Callable): Función que ejecuta la ingesta de un trabajo
+        """
+        self.max_workers = max_workers
+        self.max_pending_jobs = max_pending_jobs
+        self.max_retained_jobs = max_retained_jobs
+        self.batch_size = batch_size
+        self.parallel_extraction = parallel_extraction
+        self.pipeline = pipeline
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingestion")
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._active_jobs = 0
+        self._lock = threading.Lock()
+
+    def submit(self, filename: str, temporary_path: str) -> IngestionJob:
+        """
+        Encola un documento para ingesta en segundo plano.
+
+        Args:
+            filename (str): Nombre original del archivo
+            temporary_path (str): Ruta del archivo temporal (se elimina al terminar)
+
+        Returns:
+            IngestionJob: Trabajo creado
+        """
+        with self._lock:
+            if self._active_jobs >= self.max_pending_jobs:
+                raise IngestionQueueFullError(
+                    f"Cola de ingesta llena ({self.max_pending_jobs} trabajos pendientes)"
+                )
+            job = IngestionJob(filename, temporary_path)
+            self.jobs[job.job_id] = job
+            self._active_jobs += 1
+            self._prune_finished_jobs()
+
+        self.executor.submit(self._run_job, job)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[IngestionJob]:
+        """Obtiene un trabajo por su identificador."""
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """Lista el estado de todos los trabajos conservados."""
+        with self._lock:
+            jobs = list(self.jobs.values())
+        return [job.to_dict() for job in jobs]
+
+    def get_queue_status(self) -> Dict[str, Any]:
+        """Obtiene estadísticas de ocupación de la cola."""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_pending_jobs": self.max_pending_jobs,
+                "batch_size": self.batch_size,
+                "parallel_extraction": self.parallel_extraction,
+                "active_jobs": self._active_jobs,
+                "retained_jobs": len(self.jobs)
+            }
+
+    def _run_job(self, job: IngestionJob):
+        """Ejecuta un trabajo en un worker del pool."""
+        job.mark_running()
+        try:
+            job.mark_completed(self.pipeline(
+                job, batch_size=self.batch_size, parallel_extraction=self.parallel_extraction
+            ))
+        except Exception as e:
+            job.mark_failed(f"Error procesando documento: {str(e)}")
+        finally:
+            # Limpiar archivo temporal
+            if os.path.exists(job.temporary_path):
+                os.unlink(job.temporary_path)
+            with self._lock:
+                self._active_jobs -= 1
+
+    def _prune_finished_jobs(self):
+        """Descarta los trabajos finalizados más antiguos por encima del límite."""
+        if len(self.jobs) <= self.max_retained_jobs:
+            return
+        for job_id in list(self.jobs.keys()):
+            if len(self.jobs) <= self.max_retained_jobs:
+                break
+            if self.jobs[job_id].status in ("completed", "failed"):
+                del self.jobs[job_id]
+
+
+# Instancia global del gestor de trabajos de ingesta
+ingestion_job_manager = IngestionJobManager(
+    max_workers=int(os.getenv("INGESTION_WORKERS", "2")),
+    max_pending_jobs=int(os.getenv("INGESTION_MAX_PENDING_JOBS", "20")),
+    batch_size=int(os.getenv("INGESTION_BATCH_SIZE", "64")),
+    parallel_extraction=os.getenv("PDF_PARALLEL_EXTRACTION", "false").lower() == "true"
+)
@@ -0,0 +1,257 @@
+# lexical_index.py
+# Índice invertido BM25 sobre los fragmentos almacenados, mantenido de forma incremental
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import Counter
+from heapq import nlargest
+from typing import Any, Dict, List, Optional
+
+from .vector_backends import matches_where
+from .vector_store import vector_db
+
+# Palabras vacías frecuentes (español e inglés) que no aportan a la búsqueda léxica
+STOPWORDS = frozenset("""
+a al algo como con cual cuando de del desde donde el ella ellos en entre era es esa ese esta este esto
+fue ha han hay la las le les lo los mas me mi muy no nos o para pero por que quien se ser si sin sobre
+son su sus tambien te tiene un una uno unos y ya
+an and are as at be by for from has in is it of on or that the this to was were will with
+""".split())
+
+# Palabras y códigos: "iso-9001", "art.15", "v2.3" se conservan enteros y también por partes
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Normaliza (minúsculas, sin acentos) y divide un texto en términos.
+
+    Los identificadores compuestos se indexan completos y por partes, para que
+    "ISO-9001" coincida tanto con "iso-9001" como con "9001".
+
+    Args:
+        text (str): Texto a tokenizar
+
+    Returns:
+        List[str]: Términos (con repeticiones)
+    """
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    normalized = "".join(char for char in normalized if not unicodedata.combining(char))
+    terms = []
+    for token in TOKEN_PATTERN.findall(normalized):
+        if token not in STOPWORDS:
+            terms.append(token)
+        parts = re.split(r"[-_./]", token)
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part and part not in STOPWORDS)
+    return terms
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Inicializa el índice invertido BM25.
+
+        Se construye desde la base vectorial durante el warm-up de arranque (o
+        en la primera búsqueda si el warm-up está desactivado) y después se
+        actualiza con los eventos de cambio de la colección: las altas añaden
+        los fragmentos ingeridos y los borrados los retiran, sin reconstruir el
+        índice. El texto de cada fragmento se guarda comprimido con zlib (en
+        torno a la mitad del original) para devolver los resultados sin consultar
+        la base vectorial, de modo que el modo léxico no hace ninguna llamada de red.
+
+        Args:
+            k1 (float): Saturación de la frecuencia de término
+            b (float): Normalización por longitud del fragmento
+        """
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._fragment_terms: Dict[str, tuple] = {}
+        self._fragment_lengths: Dict[str, int] = {}
+        self._metadatas: Dict[str, Dict[str, Any]] = {}
+        self._texts: Dict[str, bytes] = {}
+        self._text_bytes = 0
+        self._total_length = 0
+        self._built = False
+        self._lock = threading.RLock()
+        self.build_seconds = 0.0
+
+    def add_fragments(self, fragment_ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]):
+        """
+        Añade (o reemplaza) fragmentos en el índice.
+
+        Args:
+            fragment_ids (List[str]): IDs de los fragmentos
+            documents (List[str]): Textos
+            metadatas (List[Dict]): Metadatos
+        """
+        with self._lock:
+            for fragment_id, document, metadata in zip(fragment_ids, documents, metadatas):
+                self._remove(fragment_id)
+                term_counts = Counter(tokenize(document or ""))
+                for term, count in term_counts.items():
+                    self._postings.setdefault(term, {})[fragment_id] = count
+                # Las frecuencias ya están en las listas de postings; basta con los términos
+                self._fragment_terms[fragment_id] = tuple(term_counts)
+                length = sum(term_counts.values())
+                self._fragment_lengths[fragment_id] = length
+                self._total_length += length
+                self._metadatas[fragment_id] = dict(metadata or {})
+                text = zlib.compress((document or "").encode("utf-8"), 1)
+                self._texts[fragment_id] = text
+                self._text_bytes += len(text)
+
+    def remove_fragments(self, fragment_ids: List[str]):
+        """Elimina fragmentos del índice."""
+        with self._lock:
+            for fragment_id in fragment_ids:
+                self._remove(fragment_id)
+
+    def _remove(self, fragment_id: str):
+        term_counts = self._fragment_terms.pop(fragment_id, None)
+        if term_counts is None:
+            return
+        for term in term_counts:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(fragment_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._fragment_lengths.pop(fragment_id, 0)
+        self._metadatas.pop(fragment_id, None)
+        self._text_bytes -= len(self._texts.pop(fragment_id, b""))
+
+    def clear(self):
+        """Vacía el índice (queda construido: la colección también está vacía)."""
+        with self._lock:
+            self._postings = {}
+            self._fragment_terms = {}
+            self._fragment_lengths = {}
+            self._metadatas = {}
+            self._texts = {}
+            self._text_bytes = 0
+            self._total_length = 0
+
+    def ensure_built(self):
+        """Construye el índice desde la base vectorial si aún no se hizo."""
+        if self._built:
+            return
+        with self._lock:
+            if self._built:
+                return
+            started = time.perf_counter()
+            self.clear()
+            for page in vector_db.iter_fragment_pages():
+                self.add_fragments(page["ids"], page["documents"], page["metadatas"])
+            self._built = True
+            self.build_seconds = time.perf_counter() - started
+            print(f"🔤 Índice léxico construido: {len(self._metadatas)} fragmentos en {self.build_seconds:.2f}s")
+
+    def is_built(self) -> bool:
+        """Indica si el índice ya está construido."""
+        return self._built
+
+    def search(self, query: str, max_results: int = 5,
+               where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Busca los fragmentos con mayor puntuación BM25 para la consulta.
+
+        Args:
+            query (str): Consulta del usuario
+            max_results (int): Número máximo de resultados
+            where (Dict[str, Any]): Filtro de metadatos con la sintaxis de ChromaDB
+
+        Returns:
+            List[Dict[str, Any]]: fragment_id, content, metadata y bm25_score, de mayor a menor
+        """
+        self.ensure_built()
+        query_terms = set(tokenize(query))
+        with self._lock:
+            fragment_count = len(self._metadatas)
+            if not fragment_count or not query_terms:
+                return []
+            average_length = self._total_length / fragment_count or 1.0
+
+            scores: Dict[str, float] = {}
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (fragment_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for fragment_id, term_frequency in postings.items():
+                    length_norm = self.k1 * (1 - self.b + self.b * self._fragment_lengths[fragment_id] / average_length)
+                    scores[fragment_id] = scores.get(fragment_id, 0.0) + \
+                        idf * term_frequency * (self.k1 + 1) / (term_frequency + length_norm)
+
+            if where:
+                scores = {
+                    fragment_id: score for fragment_id, score in scores.items()
+                    if matches_where(self._metadatas[fragment_id], where)
+                }
+            top = [
+                (fragment_id, score, self._texts[fragment_id], self._metadatas[fragment_id])
+                for fragment_id, score in nlargest(max_results, scores.items(), key=lambda item: item[1])
+            ]
+
+        # Solo se descomprimen los fragmentos devueltos (fuera del lock)
+        return [
+            {
+                "fragment_id": fragment_id,
+                "content": zlib.decompress(text).decode("utf-8"),
+                "metadata": dict(metadata),
+                "bm25_score": score
+            }
+            for fragment_id, score, text, metadata in top
+        ]
+
+    def handle_collection_change(self, change: Dict[str, Any]):
+        """
+        Aplica un cambio de la colección al índice.
+
+        Args:
+            change (Dict[str, Any]): Evento de cambio emitido por VectorDatabase
+        """
+        with self._lock:
+            if change["operation"] == "clear":
+                self.clear()
+            elif not self._built:
+                # Se construirá completo (incluyendo este cambio) en la primera búsqueda
+                return
+            elif change["operation"] == "store":
+                fragments = change.get("fragments")
+                if fragments is None:
+                    # Alta sin textos (p. ej. migración): reconstruir en la próxima búsqueda
+                    self._built = False
+                    return
+                self.add_fragments(change["fragment_ids"], fragments["documents"], fragments["metadatas"])
+            else:
+                self.remove_fragments(change.get("fragment_ids", []))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene estadísticas del índice.
+
+        Returns:
+            Dict[str, Any]: Fragmentos, términos, bytes de texto comprimido y tiempo de construcción
+        """
+        with self._lock:
+            return {
+                "built": self._built,
+                "fragments": len(self._metadatas),
+                "terms": len(self._postings),
+                "text_bytes": self._text_bytes,
+                "build_seconds": round(self.build_seconds, 3)
+            }
+
+
+# Instancia global del índice léxico
+lexical_index = BM25Index(
+    k1=float(os.getenv("BM25_K1", "1.5")),
+    b=float(os.getenv("BM25_B", "0.75"))
+)
+vector_db.subscribe(lexical_index.handle_collection_change)
@@ -1,30 +1,93 @@
 # llm_service.py
-# Servicio para integración con LLM local usando Ollama y LangChain
-import requests
+# Servicio para integración con LLM local usando Ollama
+import asyncio
 import json
 import os
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Optional, AsyncIterator, Union
+from .ollama_client import OllamaClient, OllamaClientError, OllamaTimingStats, extract_timings
+from .conversation_memory import conversation_memory
+from .context_packer import context_packer
 
-# Importaciones de LangChain
-try:
-    from langchain.llms import Ollama
-    from langchain.prompts import PromptTemplate, ChatPromptTemplate
-    from langchain.chains import LLMChain
-    from langchain.memory import ConversationBufferMemory
-    from langchain.schema import BaseMessage, HumanMessage, AIMessage
-    LANGCHAIN_AVAILABLE = True
-except ImportError:
-    LANGCHAIN_AVAILABLE = False
+# Segundos tras los que se vuelve a comprobar un modelo no disponible
+UNAVAILABLE_RECHECK_SECONDS = 30
+
+# Instrucciones fijas de cada tarea. Van en el campo "system" de Ollama, delante
+# de todo lo variable, para que el prefijo del prompt sea idéntico entre
+# peticiones y Ollama pueda reutilizar su caché KV.
+QA_SYSTEM_PROMPT = """Eres un asistente de análisis de documentos. Responde basándote SOLO en el contexto proporcionado.
+
+REGLAS:
+- Solo usa información del contexto
+- Si no hay información suficiente, dilo claramente
+- Sé conciso y directo"""
+
+SUMMARY_SYSTEM_PROMPT = """Analiza el texto que se proporciona y devuelve un resumen estructurado con:
+1. RESUMEN EJECUTIVO (2-3 líneas)
+2. PUNTOS CLAVE (máximo 5 puntos)
+3. TEMAS PRINCIPALES
+4. CONCLUSIONES RELEVANTES"""
+
+COMPARISON_SYSTEM_PROMPT = """Compara los dos documentos que se proporcionan y devuelve un análisis comparativo con:
+1. SIMILITUDES
+2. DIFERENCIAS CLAVE
+3. COMPLEMENTARIEDAD
+4. CONCLUSIONES"""
+
+# Parte variable de cada tarea, enviada en el campo "prompt" tras las instrucciones fijas.
+QA_PROMPT_TEMPLATE = """{chat_history}CONTEXTO:
+{context}
+
+PREGUNTA: {question}
+
+RESPUESTA BASADA EN EL CONTEXTO:"""
+
+SUMMARY_PROMPT_TEMPLATE = """TEXTO:
+{text}
+
+ANÁLISIS:"""
+
+COMPARISON_PROMPT_TEMPLATE = """DOCUMENTO 1:
+{doc1}
+
+DOCUMENTO 2:
+{doc2}
+
+COMPARACIÓN:"""
+
+
+def parse_keep_alive(value: Optional[str]) -> Optional[Union[str, int]]:
+    """
+    Convierte OLLAMA_KEEP_ALIVE al formato de la API de Ollama.
+
+    Args:
+        value (str): Duración ("30m", "2h"), segundos ("600", "-1" = indefinido) o vacío
+
+    Returns:
+        str|int|None: Duración, segundos o None para usar el valor por defecto de Ollama
+    """
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return value
 
 class LocalLLMService:
-    def __init__(self, ollama_host: str = "localhost", ollama_port: int = 11434, model_name: str = "llama3"):
+    def __init__(self, ollama_host: str = "localhost", ollama_port: int = 11434, model_name: str = "llama3",
+                 keep_alive: Optional[Union[str, int]] = None, warm_ping_interval: float = 0):
         """
-        Inicializa el servicio LLM con soporte para LangChain y Ollama directo.
+        Inicializa el servicio LLM sobre la API de Ollama.
         
         Args:
             ollama_host (str): Host donde está ejecutándose Ollama
             ollama_port (int): Puerto de Ollama  
             model_name (str): Nombre del modelo a usar
+            keep_alive (str|int): Tiempo que Ollama mantiene el modelo cargado tras cada petición
+            warm_ping_interval (float): Segundos de inactividad tras los que se recarga/refresca
+                el modelo con una petición vacía (0 = desactivado)
         """
         self.ollama_host = ollama_host
         self.ollama_port = ollama_port
@@ -32,194 +95,150 @@ class LocalLLMService:
         self.model_name = model_name
         self.generate_url = f"{self.ollama_base_url}/api/generate"
         
-        # Inicializar LangChain si está disponible
-        self.langchain_available = LANGCHAIN_AVAILABLE
-        self.llm = None
-        self.chains = {}
+        # Cliente HTTP con pool de conexiones keep-alive y concurrencia acotada
+        self.ollama_client = OllamaClient(
+            self.ollama_base_url,
+            max_connections=int(os.getenv("OLLAMA_MAX_CONNECTIONS", "8")),
+            max_concurrent_requests=int(os.getenv("OLLAMA_MAX_CONCURRENT_REQUESTS", "4")),
+            endpoint_timeouts={
+                "generate": float(os.getenv("OLLAMA_GENERATE_TIMEOUT", "90")),
+                "tags": float(os.getenv("OLLAMA_TAGS_TIMEOUT", "5"))
+            },
+            keep_alive=keep_alive
+        )
         
-        if self.langchain_available:
-            self._setup_langchain()
+        # Residencia del modelo: keep_alive en cada petición y ping periódico en reposo
+        self.keep_alive = keep_alive
+        self.warm_ping_interval = warm_ping_interval
+        self.timing_stats = OllamaTimingStats()
+        self.warm_pings = 0
+        self.last_warm_ping = None
+        self._last_activity = 0.0
+        self._keep_warm_thread = None
+        self._keep_warm_stop = threading.Event()
         
-        # Verificar disponibilidad del modelo
-        self.model_available = self._check_model_availability()
+        # La disponibilidad del modelo se verifica de forma perezosa (ver model_available)
+        self._model_available = None
+        self._availability_checked_at = 0.0
+        self._availability_lock = threading.Lock()
     
-    def _setup_langchain(self):
-        """Configura LangChain con Ollama."""
-        try:
-            # Inicializar LLM de LangChain
-            self.llm = Ollama(
-                model=self.model_name,
-                base_url=self.ollama_base_url,
-                temperature=0.7,
-                num_predict=500
-            )
-            
-            # Configurar prompts estructurados
-            self._setup_prompt_templates()
-            
-            # Configurar chains
-            self._setup_chains()
-            
-        except Exception as e:
-            print(f"Error configurando LangChain: {e}")
-            self.langchain_available = False
-    
-    def _setup_prompt_templates(self):
-        """Configura templates de prompts estructurados."""
-        # Template para Q&A con contexto de documentos
-        self.qa_prompt = PromptTemplate(
-            input_variables=["context", "question"],
-            template="""Eres un asistente especializado en análisis de documentos. Responde basándote únicamente en el contexto proporcionado.
-
-CONTEXTO DE DOCUMENTOS:
-{context}
-
-INSTRUCCIONES:
-- Responde únicamente con información del contexto proporcionado
-- Si el contexto no contiene información suficiente, indícalo claramente
-- Cita el documento específico cuando sea relevante
-- Mantén un tono profesional y conciso
-
-PREGUNTA: {question}
-
-RESPUESTA BASADA EN EL CONTEXTO:"""
-        )
-        
-        # Template para resumen de documentos
-        self.summary_prompt = PromptTemplate(
-            input_variables=["text"],
-            template="""Analiza el siguiente texto y proporciona un resumen estructurado:
-
-TEXTO:
-{text}
-
-Proporciona:
-1. RESUMEN EJECUTIVO (2-3 líneas)
-2. PUNTOS CLAVE (máximo 5 puntos)
-3. TEMAS PRINCIPALES
-4. CONCLUSIONES RELEVANTES
-
-ANÁLISIS:"""
-        )
+    @property
+    def model_available(self) -> bool:
+        """
+        Indica si el modelo está disponible en Ollama.
         
-        # Template para comparación de documentos
-        self.comparison_prompt = PromptTemplate(
-            input_variables=["doc1", "doc2"],
-            template="""Compara los siguientes documentos y proporciona un análisis estructurado:
-
-DOCUMENTO 1:
-{doc1}
-
-DOCUMENTO 2:
-{doc2}
-
-ANÁLISIS COMPARATIVO:
-1. SIMILITUDES
-2. DIFERENCIAS CLAVE
-3. COMPLEMENTARIEDAD
-4. CONCLUSIONES
-
-COMPARACIÓN:"""
+        Se consulta en el primer acceso y se cachea; un resultado negativo se
+        vuelve a comprobar pasado UNAVAILABLE_RECHECK_SECONDS.
+        """
+        now = time.monotonic()
+        needs_check = self._model_available is None or (
+            not self._model_available and now - self._availability_checked_at > UNAVAILABLE_RECHECK_SECONDS
         )
+        if needs_check:
+            with self._availability_lock:
+                if self._model_available is None or (
+                    not self._model_available and now - self._availability_checked_at > UNAVAILABLE_RECHECK_SECONDS
+                ):
+                    self._model_available = self._check_model_availability()
+                    self._availability_checked_at = time.monotonic()
+        return self._model_available
     
-    def _setup_chains(self):
-        """Configura las chains de LangChain."""
-        if self.llm:
-            # Chain para Q&A con contexto
-            self.chains['qa'] = LLMChain(
-                llm=self.llm,
-                prompt=self.qa_prompt,
-                verbose=False
-            )
-            
-            # Chain para resúmenes
-            self.chains['summary'] = LLMChain(
-                llm=self.llm,
-                prompt=self.summary_prompt,
-                verbose=False
-            )
-            
-            # Chain para comparaciones
-            self.chains['comparison'] = LLMChain(
-                llm=self.llm,
-                prompt=self.comparison_prompt,
-                verbose=False
-            )
-            
-            # Memoria para conversaciones
-            self.memory = ConversationBufferMemory(
-                memory_key="chat_history",
-                return_messages=True
-            )
+    @model_available.setter
+    def model_available(self, available: bool):
+        self._model_available = available
+        self._availability_checked_at = time.monotonic()
+    
+    def is_availability_checked(self) -> bool:
+        """Indica si ya se verificó la disponibilidad del modelo."""
+        return self._model_available is not None
     
     def _check_model_availability(self) -> bool:
-        """Verifica si el modelo está disponible en Ollama."""
+        """Verifica si el modelo está descargado en Ollama (sin lanzar una generación)."""
         try:
-            test_payload = {
-                "model": self.model_name,
-                "prompt": "Test",
-                "stream": False
-            }
-            
-            response = requests.post(
-                self.generate_url,
-                json=test_payload,
-                timeout=10
-            )
-            
-            return response.status_code == 200
+            return self._is_model_listed(self.ollama_client.list_models())
         except Exception:
             return False
     
+    def _is_model_listed(self, models_data: Dict[str, Any]) -> bool:
+        """Comprueba si el modelo configurado aparece en la respuesta de /api/tags."""
+        available_models = {model["name"] for model in models_data.get("models", [])}
+        return self.model_name in available_models or f"{self.model_name}:latest" in available_models
+    
+    def _build_llm_status(self, models_data: Dict[str, Any],
+                          running_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Construye el estado del servicio a partir de las respuestas de /api/tags y /api/ps."""
+        available_models = [model["name"] for model in models_data.get("models", [])]
+        
+        return {
+            "ollama_connected": True,
+            "model_name": self.model_name,
+            "model_available": self.model_name in available_models,
+            "available_models": available_models,
+            "base_url": self.ollama_base_url,
+            "residency": self.get_residency_stats(running_data),
+            "features": {
+                "structured_prompts": True,
+                "conversation_memory": True,
+                "document_qa": True,
+                "summarization": True,
+                "comparison": True
+            }
+        }
+    
+    def _build_llm_status_error(self, error: Exception) -> Dict[str, Any]:
+        """Estado del servicio cuando Ollama no responde correctamente."""
+        if isinstance(error, OllamaClientError):
+            return {
+                "ollama_connected": False,
+                "error": f"Error conectando con Ollama: {error.status_code}",
+                "model_available": False
+            }
+        return {
+            "ollama_connected": False,
+            "error": str(error),
+            "model_available": False,
+            "recommendation": "Verifica que Ollama esté ejecutándose"
+        }
+    
     def get_llm_status(self) -> Dict[str, Any]:
         """Obtiene el estado completo del servicio LLM."""
         try:
-            models_url = f"{self.ollama_base_url}/api/tags"
-            response = requests.get(models_url, timeout=5)
-            
-            if response.status_code == 200:
-                models_data = response.json()
-                available_models = [model["name"] for model in models_data.get("models", [])]
-                
-                return {
-                    "ollama_connected": True,
-                    "langchain_available": self.langchain_available,
-                    "model_name": self.model_name,
-                    "model_available": self.model_name in available_models,
-                    "available_models": available_models,
-                    "base_url": self.ollama_base_url,
-                    "chains_configured": len(self.chains) if self.langchain_available else 0,
-                    "features": {
-                        "structured_prompts": self.langchain_available,
-                        "conversation_memory": self.langchain_available,
-                        "document_qa": True,
-                        "summarization": self.langchain_available,
-                        "comparison": self.langchain_available
-                    }
-                }
-            else:
-                return {
-                    "ollama_connected": False,
-                    "error": f"Error conectando con Ollama: {response.status_code}",
-                    "model_available": False
-                }
+            models_data = self.ollama_client.list_models()
         except Exception as e:
-            return {
-                "ollama_connected": False,
-                "error": str(e),
-                "model_available": False,
-                "recommendation": "Verifica que Ollama esté ejecutándose"
-            }
+            return self._build_llm_status_error(e)
+        try:
+            running_data = self.ollama_client.list_running_models()
+        except Exception:
+            running_data = None
+        return self._build_llm_status(models_data, running_data)
+    
+    async def aget_llm_status(self) -> Dict[str, Any]:
+        """Versión asíncrona de get_llm_status (no bloquea el event loop)."""
+        try:
+            models_data = await self.ollama_client.alist_models()
+        except Exception as e:
+            return self._build_llm_status_error(e)
+        try:
+            running_data = await self.ollama_client.alist_running_models()
+        except Exception:
+            running_data = None
+        return self._build_llm_status(models_data, running_data)
     
     def generate_contextual_response(self, question: str, context_fragments: List[Dict[str, Any]], 
-                                   max_tokens: int = 500) -> Dict[str, Any]:
+                                   max_tokens: int = 500, conversation_history: str = "",
+                                   context_budget_tokens: Optional[int] = None) -> Dict[str, Any]:
         """
-        Genera respuesta contextual usando LangChain si está disponible, sino Ollama directo.
+        Genera respuesta contextual con Ollama.
+        
+        Todas las generaciones pasan por OllamaClient (campo system, keep_alive y
+        registro de tiempos).
         
         Args:
             question (str): Pregunta del usuario
             context_fragments (List[Dict]): Fragmentos de contexto relevantes
             max_tokens (int): Número máximo de tokens
+            conversation_history (str): Historial acotado de la sesión (opcional)
+            context_budget_tokens (int): Tokens de contexto (por defecto, el presupuesto de qa)
             
         Returns:
             Dict[str, Any]: Respuesta generada con metadatos
@@ -228,92 +247,189 @@ COMPARACIÓN:"""
             if not self.model_available:
                 return self._fallback_response(question, context_fragments)
             
-            # Construir contexto estructurado
-            context_text = self._build_context_from_fragments(context_fragments)
+            # Construir contexto estructurado dentro del presupuesto de tokens
+            packing = self._build_context_from_fragments(context_fragments, context_budget_tokens)
+            context_text = packing["text"]
             
-            # Usar LangChain si está disponible
-            if self.langchain_available and 'qa' in self.chains:
-                return self._generate_with_langchain(question, context_text, context_fragments)
-            else:
-                return self._generate_with_ollama_direct(question, context_text, context_fragments, max_tokens)
+            result = self._generate_with_ollama_direct(question, context_text, context_fragments, max_tokens, conversation_history)
+            result["context_packing"] = self._packing_metadata(packing)
+            return result
                 
         except Exception as e:
             return self._fallback_response(question, context_fragments, str(e))
     
-    def _generate_with_langchain(self, question: str, context_text: str, 
-                               context_fragments: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Genera respuesta usando LangChain."""
+    async def agenerate_contextual_response(self, question: str, context_fragments: List[Dict[str, Any]],
+                                            max_tokens: int = 500, conversation_history: str = "",
+                                            context_budget_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Versión asíncrona de generate_contextual_response para los handlers de FastAPI.
+        
+        Args:
+            question (str): Pregunta del usuario
+            context_fragments (List[Dict]): Fragmentos de contexto relevantes
+            max_tokens (int): Número máximo de tokens
+            conversation_history (str): Historial acotado de la sesión (opcional)
+            context_budget_tokens (int): Tokens de contexto (por defecto, el presupuesto de qa)
+            
+        Returns:
+            Dict[str, Any]: Respuesta generada con metadatos
+        """
         try:
-            # Ejecutar chain de Q&A
-            response = self.chains['qa'].run(
-                context=context_text,
-                question=question
-            )
+            if not await asyncio.to_thread(lambda: self.model_available):
+                return self._fallback_response(question, context_fragments)
             
-            return {
-                "success": True,
-                "response": response.strip(),
-                "method": "langchain_structured",
-                "model_used": self.model_name,
-                "context_fragments_used": len(context_fragments),
-                "langchain_used": True,
-                "prompt_template": "structured_qa"
-            }
+            packing = self._build_context_from_fragments(context_fragments, context_budget_tokens)
+            context_text = packing["text"]
             
+            result = await self._agenerate_with_ollama_direct(question, context_text, context_fragments, max_tokens, conversation_history)
+            result["context_packing"] = self._packing_metadata(packing)
+            return result
+                
         except Exception as e:
-            # Fallback a Ollama directo si LangChain falla
-            return self._generate_with_ollama_direct(question, context_text, context_fragments, 500)
+            return self._fallback_response(question, context_fragments, str(e))
     
-    def _generate_with_ollama_direct(self, question: str, context_text: str, 
-                                   context_fragments: List[Dict[str, Any]], max_tokens: int) -> Dict[str, Any]:
-        """Genera respuesta usando Ollama directamente."""
-        try:
-            system_prompt = """Eres un asistente de análisis de documentos. Responde basándote SOLO en el contexto proporcionado.
-
-REGLAS:
-- Solo usa información del contexto
-- Si no hay información suficiente, dilo claramente
-- Sé conciso y directo"""
-
-            user_prompt = f"""CONTEXTO:
-{context_text}
-
-PREGUNTA: {question}
-
-RESPUESTA BASADA EN EL CONTEXTO:"""
+    def _build_qa_payload(self, question: str, context_text: str, conversation_history: str = "",
+                          max_tokens: int = 500) -> Dict[str, Any]:
+        """
+        Construye la petición a Ollama para preguntas con contexto.
+        
+        El orden va de lo más estable a lo más variable: instrucciones fijas
+        (system), historial de la sesión (crece por el final entre turnos),
+        contexto recuperado y pregunta.
+        """
+        history_section = f"HISTORIAL DE LA CONVERSACIÓN:\n{conversation_history}\n\n" if conversation_history else ""
+        user_prompt = QA_PROMPT_TEMPLATE.format(
+            chat_history=history_section, context=context_text, question=question
+        )
 
-            payload = {
-                "model": self.model_name,
-                "prompt": f"{system_prompt}\n\n{user_prompt}",
-                "stream": False,
-                "options": {
-                    "num_predict": 200,  # Reducir para respuestas más rápidas
-                    "temperature": 0.7,
-                    "top_p": 0.9
-                }
+        return {
+            "model": self.model_name,
+            "system": QA_SYSTEM_PROMPT,
+            "prompt": user_prompt,
+            "stream": False,
+            "options": {
+                "num_predict": max_tokens,
+                "temperature": 0.7,
+                "top_p": 0.9
             }
+        }
+    
+    def _build_direct_qa_result(self, payload: Dict[str, Any], response_data: Dict[str, Any],
+                                context_fragments: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Resultado estándar de una respuesta generada con Ollama directo."""
+        timings = self._record_generation(payload, response_data)
+        return {
+            "success": True,
+            "response": response_data.get("response", "").strip(),
+            "method": "ollama_direct",
+            "model_used": self.model_name,
+            "context_fragments_used": len(context_fragments),
+            "tokens_used": response_data.get("eval_count", 0),
+            "prompt_tokens": response_data.get("prompt_eval_count", 0),
+            "generation_time": response_data.get("total_duration", 0) / 1e9 if response_data.get("total_duration") else 0,
+            "timings": timings
+        }
+    
+    def _generate_with_ollama_direct(self, question: str, context_text: str, 
+                                   context_fragments: List[Dict[str, Any]], max_tokens: int,
+                                   conversation_history: str = "") -> Dict[str, Any]:
+        """Genera respuesta usando Ollama directamente."""
+        payload = self._build_qa_payload(question, context_text, conversation_history, max_tokens)
+        response_data = self.ollama_client.generate(payload, timeout=90)
+        return self._build_direct_qa_result(payload, response_data, context_fragments)
+    
+    async def _agenerate_with_ollama_direct(self, question: str, context_text: str,
+                                            context_fragments: List[Dict[str, Any]], max_tokens: int,
+                                            conversation_history: str = "") -> Dict[str, Any]:
+        """Genera respuesta usando Ollama directamente sin bloquear el event loop."""
+        payload = self._build_qa_payload(question, context_text, conversation_history, max_tokens)
+        response_data = await self.ollama_client.agenerate(payload, timeout=90)
+        return self._build_direct_qa_result(payload, response_data, context_fragments)
+    
+    async def astream_contextual_response(self, question: str, context_fragments: List[Dict[str, Any]],
+                                          conversation_history: str = "",
+                                          max_tokens: int = 500) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Genera una respuesta contextual entregando los tokens según los produce Ollama.
+        
+        Usa Ollama directo en modo streaming. Si el modelo no está disponible se
+        emite la respuesta de respaldo como un único token.
+        
+        Args:
+            question (str): Pregunta del usuario
+            context_fragments (List[Dict]): Fragmentos de contexto relevantes
+            conversation_history (str): Historial acotado de la sesión (opcional)
+            max_tokens (int): Número máximo de tokens
             
-            response = requests.post(self.generate_url, json=payload, timeout=90)
-            
-            if response.status_code == 200:
-                response_data = response.json()
-                generated_text = response_data.get("response", "").strip()
-                
-                return {
-                    "success": True,
-                    "response": generated_text,
-                    "method": "ollama_direct",
-                    "model_used": self.model_name,
-                    "context_fragments_used": len(context_fragments),
-                    "langchain_used": False,
-                    "tokens_used": response_data.get("eval_count", 0),
-                    "generation_time": response_data.get("total_duration", 0) / 1e9 if response_data.get("total_duration") else 0
-                }
-            else:
-                raise Exception(f"Error HTTP {response.status_code}: {response.text}")
-                
+        Yields:
+            Dict[str, Any]: Eventos {"type": "token", "content"} y un evento final
+            {"type": "done", ...} con el método, el modelo y las métricas de Ollama
+        """
+        started = time.perf_counter()
+        first_token_at = None
+        
+        if not await asyncio.to_thread(lambda: self.model_available):
+            fallback = self._fallback_response(question, context_fragments)
+            yield {"type": "token", "content": fallback["response"]}
+            yield {"type": "done", "method": "fallback", "model_used": None,
+                   "generation_seconds": round(time.perf_counter() - started, 3)}
+            return
+        
+        packing = self._build_context_from_fragments(context_fragments)
+        payload = self._build_qa_payload(question, packing["text"], conversation_history, max_tokens)
+        final_chunk: Dict[str, Any] = {}
+        try:
+            async for chunk in self.ollama_client.astream_generate(payload, timeout=90):
+                token = chunk.get("response", "")
+                if token:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    yield {"type": "token", "content": token}
+                if chunk.get("done"):
+                    final_chunk = chunk
         except Exception as e:
-            raise e
+            if first_token_at is None:
+                # Nada se ha emitido todavía: se responde con el respaldo
+                fallback = self._fallback_response(question, context_fragments, str(e))
+                yield {"type": "token", "content": fallback["response"]}
+                yield {"type": "done", "method": "fallback", "model_used": None, "error": str(e),
+                       "generation_seconds": round(time.perf_counter() - started, 3)}
+                return
+            raise
+        
+        finished = time.perf_counter()
+        timings = self._record_generation(payload, final_chunk)
+        eval_count = final_chunk.get("eval_count", 0)
+        eval_seconds = final_chunk.get("eval_duration", 0) / 1e9
+        yield {
+            "type": "done",
+            "method": "ollama_stream",
+            "model_used": self.model_name,
+            "context_fragments_used": len(context_fragments),
+            "context_packing": self._packing_metadata(packing),
+            "time_to_first_token_seconds": round(first_token_at - started, 3) if first_token_at else None,
+            "generation_seconds": round(finished - started, 3),
+            "prompt_tokens": final_chunk.get("prompt_eval_count", 0),
+            "completion_tokens": eval_count,
+            "tokens_per_second": round(eval_count / eval_seconds, 2) if eval_seconds else None,
+            "timings": timings
+        }
+    
+    def _build_summary_payload(self, document_content: str) -> Dict[str, Any]:
+        """Construye la petición a Ollama para resumir un documento."""
+        prompt = SUMMARY_PROMPT_TEMPLATE.format(text=document_content)
+
+        return {
+            "model": self.model_name,
+            "system": SUMMARY_SYSTEM_PROMPT,
+            "prompt": prompt,
+            "stream": False,
+            "options": {"num_predict": 400, "temperature": 0.7}
+        }
+    
+    def _truncate_summary_content(self, document_content: str) -> tuple:
+        """Ajusta el contenido a resumir al presupuesto de tokens; devuelve (contenido, truncado)."""
+        return context_packer.fit_text(document_content, "summary")
     
     def generate_document_summary(self, document_content: str) -> Dict[str, Any]:
         """
@@ -330,63 +446,70 @@ RESPUESTA BASADA EN EL CONTEXTO:"""
                 return {"success": False, "error": "Modelo no disponible"}
             
             # Truncar contenido si es muy largo
-            max_content_length = 3000
-            if len(document_content) > max_content_length:
-                document_content = document_content[:max_content_length] + "..."
+            document_content, truncated = self._truncate_summary_content(document_content)
             
-            if self.langchain_available and 'summary' in self.chains:
-                # Usar LangChain para resumen estructurado
-                response = self.chains['summary'].run(text=document_content)
-                
-                return {
-                    "success": True,
-                    "summary": response.strip(),
-                    "method": "langchain_structured_summary",
-                    "original_length": len(document_content),
-                    "truncated": len(document_content) > max_content_length
-                }
-            else:
-                # Usar Ollama directo
-                prompt = f"""Analiza el siguiente texto y proporciona un resumen estructurado:
-
-TEXTO:
-{document_content}
-
-Proporciona:
-1. RESUMEN EJECUTIVO (2-3 líneas)
-2. PUNTOS CLAVE (máximo 5 puntos)  
-3. TEMAS PRINCIPALES
-4. CONCLUSIONES RELEVANTES
-
-ANÁLISIS:"""
-
-                payload = {
-                    "model": self.model_name,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {"num_predict": 400, "temperature": 0.7}
-                }
-                
-                response = requests.post(self.generate_url, json=payload, timeout=30)
-                
-                if response.status_code == 200:
-                    response_data = response.json()
-                    return {
-                        "success": True,
-                        "summary": response_data.get("response", "").strip(),
-                        "method": "ollama_direct_summary",
-                        "original_length": len(document_content),
-                        "truncated": len(document_content) > max_content_length
-                    }
-                else:
-                    return {"success": False, "error": f"Error HTTP {response.status_code}"}
+            payload = self._build_summary_payload(document_content)
+            response_data = self.ollama_client.generate(payload, timeout=30)
+            return {
+                "success": True,
+                "summary": response_data.get("response", "").strip(),
+                "method": "ollama_direct_summary",
+                "original_length": len(document_content),
+                "truncated": truncated,
+                "timings": self._record_generation(payload, response_data)
+            }
+                    
+        except OllamaClientError as e:
+            return {"success": False, "error": f"Error HTTP {e.status_code}"}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    async def agenerate_document_summary(self, document_content: str) -> Dict[str, Any]:
+        """Versión asíncrona de generate_document_summary."""
+        try:
+            if not await asyncio.to_thread(lambda: self.model_available):
+                return {"success": False, "error": "Modelo no disponible"}
+            
+            document_content, truncated = self._truncate_summary_content(document_content)
+            
+            payload = self._build_summary_payload(document_content)
+            response_data = await self.ollama_client.agenerate(payload, timeout=30)
+            return {
+                "success": True,
+                "summary": response_data.get("response", "").strip(),
+                "method": "ollama_direct_summary",
+                "original_length": len(document_content),
+                "truncated": truncated,
+                "timings": self._record_generation(payload, response_data)
+            }
                     
+        except OllamaClientError as e:
+            return {"success": False, "error": f"Error HTTP {e.status_code}"}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    def _build_comparison_payload(self, doc1_content: str, doc2_content: str) -> Dict[str, Any]:
+        """Construye la petición a Ollama para comparar dos documentos."""
+        prompt = COMPARISON_PROMPT_TEMPLATE.format(doc1=doc1_content, doc2=doc2_content)
+
+        return {
+            "model": self.model_name,
+            "system": COMPARISON_SYSTEM_PROMPT,
+            "prompt": prompt,
+            "stream": False,
+            "options": {"num_predict": 500, "temperature": 0.7}
+        }
+    
+    def _truncate_comparison_content(self, doc1_content: str, doc2_content: str) -> tuple:
+        """Reparte el presupuesto de comparación entre ambos documentos."""
+        share = context_packer.get_budget("comparison") // 2
+        doc1_content, _ = context_packer.fit_text(doc1_content, "comparison", share)
+        doc2_content, _ = context_packer.fit_text(doc2_content, "comparison", share)
+        return doc1_content, doc2_content
+    
     def compare_documents(self, doc1_content: str, doc2_content: str) -> Dict[str, Any]:
         """
-        Compara dos documentos usando LangChain o Ollama directo.
+        Compara dos documentos con Ollama.
         
         Args:
             doc1_content (str): Contenido del primer documento
@@ -400,90 +523,190 @@ ANÁLISIS:"""
                 return {"success": False, "error": "Modelo no disponible"}
             
             # Truncar contenido si es necesario
-            max_len = 1500
-            if len(doc1_content) > max_len:
-                doc1_content = doc1_content[:max_len] + "..."
-            if len(doc2_content) > max_len:
-                doc2_content = doc2_content[:max_len] + "..."
+            doc1_content, doc2_content = self._truncate_comparison_content(doc1_content, doc2_content)
             
-            if self.langchain_available and 'comparison' in self.chains:
-                # Usar LangChain para comparación estructurada
-                response = self.chains['comparison'].run(
-                    doc1=doc1_content,
-                    doc2=doc2_content
-                )
-                
-                return {
-                    "success": True,
-                    "comparison": response.strip(),
-                    "method": "langchain_structured_comparison"
-                }
-            else:
-                # Usar Ollama directo
-                prompt = f"""Compara los siguientes documentos:
-
-DOCUMENTO 1:
-{doc1_content}
-
-DOCUMENTO 2:
-{doc2_content}
-
-ANÁLISIS COMPARATIVO:
-1. SIMILITUDES
-2. DIFERENCIAS CLAVE
-3. COMPLEMENTARIEDAD
-4. CONCLUSIONES
-
-COMPARACIÓN:"""
-
-                payload = {
-                    "model": self.model_name,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {"num_predict": 500, "temperature": 0.7}
-                }
-                
-                response = requests.post(self.generate_url, json=payload, timeout=30)
-                
-                if response.status_code == 200:
-                    response_data = response.json()
-                    return {
-                        "success": True,
-                        "comparison": response_data.get("response", "").strip(),
-                        "method": "ollama_direct_comparison"
-                    }
-                else:
-                    return {"success": False, "error": f"Error HTTP {response.status_code}"}
+            payload = self._build_comparison_payload(doc1_content, doc2_content)
+            response_data = self.ollama_client.generate(payload, timeout=30)
+            return {
+                "success": True,
+                "comparison": response_data.get("response", "").strip(),
+                "method": "ollama_direct_comparison",
+                "timings": self._record_generation(payload, response_data)
+            }
                     
+        except OllamaClientError as e:
+            return {"success": False, "error": f"Error HTTP {e.status_code}"}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    def clear_conversation_memory(self):
-        """Limpia la memoria de conversación."""
-        if hasattr(self, 'memory') and self.memory:
-            self.memory.clear()
+    async def acompare_documents(self, doc1_content: str, doc2_content: str) -> Dict[str, Any]:
+        """Versión asíncrona de compare_documents."""
+        try:
+            if not await asyncio.to_thread(lambda: self.model_available):
+                return {"success": False, "error": "Modelo no disponible"}
+            
+            doc1_content, doc2_content = self._truncate_comparison_content(doc1_content, doc2_content)
+            
+            payload = self._build_comparison_payload(doc1_content, doc2_content)
+            response_data = await self.ollama_client.agenerate(payload, timeout=30)
+            return {
+                "success": True,
+                "comparison": response_data.get("response", "").strip(),
+                "method": "ollama_direct_comparison",
+                "timings": self._record_generation(payload, response_data)
+            }
+                    
+        except OllamaClientError as e:
+            return {"success": False, "error": f"Error HTTP {e.status_code}"}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
     
-    def _build_context_from_fragments(self, fragments: List[Dict[str, Any]]) -> str:
-        """Construye contexto estructurado a partir de fragmentos."""
-        context_parts = []
+    def _record_generation(self, payload: Dict[str, Any], response_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Registra una generación terminada de Ollama.
         
-        for i, fragment in enumerate(fragments[:3]):  # Límite de 3 fragmentos para reducir tamaño
-            filename = fragment.get('metadata', {}).get('filename', f'Documento_{i+1}')
-            content = fragment.get('content', '')
-            similarity = fragment.get('similarity_score', 0)
+        Acumula sus tiempos (carga del modelo, evaluación del prompt y generación),
+        calibra el contador de tokens del empaquetador de contexto y marca la
+        actividad que aplaza el siguiente ping de residencia.
+        
+        Args:
+            payload (Dict[str, Any]): Petición enviada
+            response_data (Dict[str, Any]): Respuesta final de Ollama
             
-            # Truncar contenido si es muy largo
-            max_content_length = 800  # Reducir longitud máxima
-            if len(content) > max_content_length:
-                content = content[:max_content_length] + "..."
+        Returns:
+            Dict[str, Any]: Desglose de tiempos de la generación
+        """
+        self._last_activity = time.monotonic()
+        timings = extract_timings(response_data)
+        self.timing_stats.record(timings)
+        # Tras una carga del modelo la caché KV está vacía: la muestra cubre el prompt completo
+        context_packer.token_counter.observe(
+            f"{payload.get('system', '')}\n\n{payload['prompt']}", response_data.get("prompt_eval_count", 0),
+            uncached=timings["cold_start"]
+        )
+        return timings
+    
+    def warm_up(self) -> bool:
+        """
+        Carga el modelo en memoria con una petición sin prompt (no genera tokens).
+        
+        Renueva también el keep_alive, de modo que un modelo ya cargado sigue residente.
+        
+        Returns:
+            bool: True si el modelo está disponible y cargado
+        """
+        if not self.model_available:
+            return False
+        started = time.perf_counter()
+        response_data = self.ollama_client.generate({"model": self.model_name, "prompt": "", "stream": False})
+        load_seconds = response_data.get("load_duration", 0) / 1e9
+        self.warm_pings += 1
+        self.last_warm_ping = {
+            "at": datetime.now().isoformat(),
+            "load_seconds": round(load_seconds, 3),
+            "duration_seconds": round(time.perf_counter() - started, 3)
+        }
+        self._last_activity = time.monotonic()
+        return True
+    
+    def start_keep_warm(self):
+        """Lanza el hilo que mantiene el modelo cargado durante los periodos de inactividad."""
+        if self.warm_ping_interval <= 0:
+            return
+        if self._keep_warm_thread is not None and self._keep_warm_thread.is_alive():
+            return
+        self._keep_warm_stop.clear()
+        self._keep_warm_thread = threading.Thread(target=self._keep_warm_loop, name="llm-keep-warm", daemon=True)
+        self._keep_warm_thread.start()
+    
+    def stop_keep_warm(self):
+        """Detiene el hilo de residencia del modelo."""
+        self._keep_warm_stop.set()
+    
+    def _keep_warm_loop(self):
+        """Envía un ping de carga cuando no ha habido generaciones en el último intervalo."""
+        while not self._keep_warm_stop.wait(self.warm_ping_interval):
+            if time.monotonic() - self._last_activity < self.warm_ping_interval:
+                continue
+            try:
+                self.warm_up()
+            except Exception as e:
+                print(f"⚠️ Ping de residencia del modelo fallido: {str(e)}")
+    
+    def get_residency_stats(self, running_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Obtiene la configuración de residencia del modelo y los tiempos de Ollama.
+        
+        Args:
+            running_data (Dict[str, Any]): Respuesta de /api/ps (opcional)
             
-            context_part = f"""[DOCUMENTO: {filename}]
+        Returns:
+            Dict[str, Any]: keep_alive, pings de residencia, si el modelo está
+                cargado ahora y tiempos medios de carga, prompt y generación
+        """
+        residency = {
+            "keep_alive": self.keep_alive,
+            "warm_ping_interval_seconds": self.warm_ping_interval,
+            "keep_warm_running": self._keep_warm_thread is not None and self._keep_warm_thread.is_alive(),
+            "warm_pings": self.warm_pings,
+            "last_warm_ping": self.last_warm_ping,
+            "timings": self.timing_stats.get_stats()
+        }
+        if running_data is not None:
+            loaded = [model for model in running_data.get("models", [])
+                      if model.get("name") in (self.model_name, f"{self.model_name}:latest")]
+            residency["model_loaded"] = bool(loaded)
+            residency["expires_at"] = loaded[0].get("expires_at") if loaded else None
+        return residency
+    
+    def clear_conversation_memory(self, session_id: str):
+        """
+        Limpia la memoria de conversación de una sesión.
+        
+        Args:
+            session_id (str): Sesión a limpiar
+        """
+        if not session_id:
+            raise ValueError("session_id es obligatorio")
+        conversation_memory.clear_session(session_id)
+    
+    def clear_all_conversation_memory(self) -> int:
+        """
+        Limpia la memoria de conversación de todas las sesiones.
+        
+        Returns:
+            int: Sesiones eliminadas
+        """
+        return conversation_memory.clear_all()
+    
+    def _build_context_from_fragments(self, fragments: List[Dict[str, Any]],
+                                      budget_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Construye contexto estructurado con los fragmentos que caben en el presupuesto.
+        
+        Los fragmentos llegan ordenados por relevancia; se incluyen enteros mientras
+        quepan y el último se recorta para aprovechar el espacio restante.
+        
+        Args:
+            fragments (List[Dict]): Fragmentos en orden de relevancia
+            budget_tokens (int): Tokens de contexto (por defecto, el presupuesto de qa)
+            
+        Returns:
+            Dict[str, Any]: Texto del contexto y métricas del empaquetado
+        """
+        def format_fragment(i: int, fragment: Dict[str, Any], content: str) -> str:
+            filename = fragment.get('metadata', {}).get('filename', f'Documento_{i+1}')
+            similarity = fragment.get('similarity_score', 0)
+            return f"""[DOCUMENTO: {filename}]
 [RELEVANCIA: {similarity:.3f}]
 {content}
 ---"""
-            context_parts.append(context_part)
         
-        return "\n".join(context_parts)
+        return context_packer.pack(fragments, task="qa", budget_tokens=budget_tokens, formatter=format_fragment)
+    
+    def _packing_metadata(self, packing: Dict[str, Any]) -> Dict[str, Any]:
+        """Métricas del empaquetado de contexto, sin el texto."""
+        return {key: value for key, value in packing.items() if key != "text"}
     
     def _fallback_response(self, question: str, context_fragments: List[Dict[str, Any]], error: str = None) -> Dict[str, Any]:
         """Genera respuesta de respaldo cuando el LLM no está disponible."""
@@ -516,5 +739,7 @@ ollama_model = os.getenv("OLLAMA_MODEL", "llama3.2:3b")
 local_llm_service = LocalLLMService(
     ollama_host=ollama_host,
     ollama_port=ollama_port,
-    model_name=ollama_model
+    model_name=ollama_model,
+    keep_alive=parse_keep_alive(os.getenv("OLLAMA_KEEP_ALIVE", "30m")),
+    warm_ping_interval=float(os.getenv("OLLAMA_WARM_PING_INTERVAL", "600"))
 )
\ No newline at end of file
@@ -0,0 +1,292 @@
+# ollama_client.py
+# Cliente HTTP para Ollama con conexiones keep-alive reutilizadas y concurrencia acotada
+import asyncio
+import json
+import threading
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional, Union
+
+import httpx
+
+# Timeouts por endpoint (segundos); la conexión inicial siempre es corta
+DEFAULT_ENDPOINT_TIMEOUTS = {
+    "generate": 90.0,
+    "tags": 5.0,
+}
+CONNECT_TIMEOUT = 5.0
+
+# Carga del modelo por encima de la cual una generación se considera arranque en frío
+COLD_LOAD_SECONDS = 1.0
+
+
+def extract_timings(response_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Desglosa los tiempos que Ollama devuelve (en nanosegundos) al terminar una generación.
+
+    Args:
+        response_data (Dict[str, Any]): Respuesta final de /api/generate
+
+    Returns:
+        Dict[str, Any]: Segundos de carga del modelo, evaluación del prompt y
+            generación, tokens de cada fase y velocidad de generación
+    """
+    load_seconds = response_data.get("load_duration", 0) / 1e9
+    prompt_eval_seconds = response_data.get("prompt_eval_duration", 0) / 1e9
+    generation_seconds = response_data.get("eval_duration", 0) / 1e9
+    prompt_tokens = response_data.get("prompt_eval_count", 0)
+    completion_tokens = response_data.get("eval_count", 0)
+    return {
+        "load_seconds": round(load_seconds, 3),
+        "prompt_eval_seconds": round(prompt_eval_seconds, 3),
+        "generation_seconds": round(generation_seconds, 3),
+        "total_seconds": round(response_data.get("total_duration", 0) / 1e9, 3),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "prompt_tokens_per_second": round(prompt_tokens / prompt_eval_seconds, 2) if prompt_eval_seconds else None,
+        "tokens_per_second": round(completion_tokens / generation_seconds, 2) if generation_seconds else None,
+        "cold_start": load_seconds > COLD_LOAD_SECONDS
+    }
+
+
+class OllamaTimingStats:
+    def __init__(self):
+        """Acumula los tiempos de carga, evaluación del prompt y generación de Ollama."""
+        self.generations = 0
+        self.cold_starts = 0
+        self.load_seconds = 0.0
+        self.prompt_eval_seconds = 0.0
+        self.generation_seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.last_cold_start_at = None
+        self._lock = threading.Lock()
+
+    def record(self, timings: Dict[str, Any]):
+        """Registra los tiempos de una generación (salida de extract_timings)."""
+        with self._lock:
+            self.generations += 1
+            self.load_seconds += timings["load_seconds"]
+            self.prompt_eval_seconds += timings["prompt_eval_seconds"]
+            self.generation_seconds += timings["generation_seconds"]
+            self.prompt_tokens += timings["prompt_tokens"]
+            self.completion_tokens += timings["completion_tokens"]
+            if timings["cold_start"]:
+                self.cold_starts += 1
+                self.last_cold_start_at = datetime.now().isoformat()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene los totales y medias por generación.
+
+        Returns:
+            Dict[str, Any]: Generaciones, arranques en frío y tiempos medios por fase
+        """
+        with self._lock:
+            generations = self.generations
+            return {
+                "generations": generations,
+                "cold_starts": self.cold_starts,
+                "last_cold_start_at": self.last_cold_start_at,
+                "avg_load_seconds": round(self.load_seconds / generations, 3) if generations else None,
+                "avg_prompt_eval_seconds": round(self.prompt_eval_seconds / generations, 3) if generations else None,
+                "avg_generation_seconds": round(self.generation_seconds / generations, 3) if generations else None,
+                "avg_prompt_tokens": round(self.prompt_tokens / generations, 1) if generations else None,
+                "avg_completion_tokens": round(self.completion_tokens / generations, 1) if generations else None
+            }
+
+
+class OllamaClientError(Exception):
+    """Error HTTP devuelto por Ollama."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"Error HTTP {status_code}: {detail}")
+        self.status_code = status_code
+
+
+class OllamaClient:
+    def __init__(self, base_url: str, max_connections: int = 8, max_keepalive_connections: int = 4,
+                 max_concurrent_requests: int = 4, endpoint_timeouts: Optional[Dict[str, float]] = None,
+                 keep_alive: Optional[Union[str, int]] = None):
+        """
+        Inicializa el cliente HTTP de Ollama.
+
+        Los clientes síncrono y asíncrono se crean en el primer uso y mantienen
+        un pool de conexiones keep-alive, en lugar de abrir una conexión por llamada.
+        Todas las generaciones envían el mismo keep_alive, de modo que Ollama
+        mantiene el modelo cargado ese tiempo tras cada petición. Las
+        generaciones síncronas y asíncronas comparten el mismo límite de
+        peticiones simultáneas.
+
+        Args:
+            base_url (str): URL base de Ollama (p. ej. http://ollama:11434)
+            max_connections (int): Conexiones máximas del pool
+            max_keepalive_connections (int): Conexiones inactivas que se mantienen abiertas
+            max_concurrent_requests (int): Generaciones simultáneas permitidas (síncronas y asíncronas)
+            endpoint_timeouts (Dict[str, float]): Timeouts por endpoint (generate, tags)
+            keep_alive (str|int): Tiempo que Ollama mantiene el modelo en memoria
+                ("30m", segundos, -1 = indefinido; None = valor por defecto de Ollama)
+        """
+        self.base_url = base_url
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self.max_concurrent_requests = max_concurrent_requests
+        self.endpoint_timeouts = {**DEFAULT_ENDPOINT_TIMEOUTS, **(endpoint_timeouts or {})}
+        self.keep_alive = keep_alive
+        self._sync_client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Plazas de generación compartidas por ambos clientes (hilos y event loop)
+        self._generation_slots = threading.BoundedSemaphore(max_concurrent_requests)
+        self._lock = threading.Lock()
+
+    def _timeout_for(self, endpoint: str, timeout: Optional[float]) -> httpx.Timeout:
+        """Timeout de una llamada: el explícito o el configurado para el endpoint."""
+        return httpx.Timeout(timeout or self.endpoint_timeouts.get(endpoint, 30.0), connect=CONNECT_TIMEOUT)
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        """Cliente síncrono compartido (thread-safe)."""
+        if self._sync_client is None:
+            with self._lock:
+                if self._sync_client is None:
+                    self._sync_client = httpx.Client(base_url=self.base_url, limits=self.limits)
+        return self._sync_client
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Cliente asíncrono compartido, ligado al event loop en ejecución."""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(base_url=self.base_url, limits=self.limits)
+            self._async_loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        return self._async_client
+
+    async def _acquire_generation_slot(self):
+        """Ocupa una plaza de generación sin bloquear el event loop."""
+        if self._generation_slots.acquire(blocking=False):
+            return
+        waiter = asyncio.ensure_future(asyncio.to_thread(self._generation_slots.acquire))
+        try:
+            await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # La plaza se obtendrá igualmente en el hilo: devolverla al conseguirla
+            waiter.add_done_callback(lambda _: self._generation_slots.release())
+            raise
+
+    def _with_keep_alive(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Añade el keep_alive configurado si la petición no fija uno propio."""
+        if self.keep_alive is None or "keep_alive" in payload:
+            return payload
+        return {**payload, "keep_alive": self.keep_alive}
+
+    @staticmethod
+    def _parse_response(response: httpx.Response) -> Dict[str, Any]:
+        if response.status_code != 200:
+            raise OllamaClientError(response.status_code, response.text)
+        return response.json()
+
+    def generate(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Llama a /api/generate de forma síncrona.
+
+        Espera una plaza libre del mismo límite de concurrencia que las llamadas
+        asíncronas (resúmenes, clasificación, pings de residencia...).
+
+        Args:
+            payload (Dict[str, Any]): Cuerpo de la petición
+            timeout (float): Timeout de lectura (por defecto el del endpoint generate)
+
+        Returns:
+            Dict[str, Any]: Respuesta JSON de Ollama
+        """
+        with self._generation_slots:
+            response = self.sync_client.post("/api/generate", json=self._with_keep_alive(payload),
+                                             timeout=self._timeout_for("generate", timeout))
+        return self._parse_response(response)
+
+    def list_models(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Llama a /api/tags de forma síncrona."""
+        response = self.sync_client.get("/api/tags", timeout=self._timeout_for("tags", timeout))
+        return self._parse_response(response)
+
+    def list_running_models(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Llama a /api/ps de forma síncrona (modelos cargados en memoria y su expiración)."""
+        response = self.sync_client.get("/api/ps", timeout=self._timeout_for("tags", timeout))
+        return self._parse_response(response)
+
+    async def agenerate(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Llama a /api/generate sin bloquear el event loop.
+
+        La concurrencia se limita con un semáforo para no saturar Ollama; la
+        plaza se comparte con las llamadas síncronas.
+
+        Args:
+            payload (Dict[str, Any]): Cuerpo de la petición
+            timeout (float): Timeout de lectura (por defecto el del endpoint generate)
+
+        Returns:
+            Dict[str, Any]: Respuesta JSON de Ollama
+        """
+        client = self._get_async_client()
+        async with self._semaphore:
+            await self._acquire_generation_slot()
+            try:
+                response = await client.post("/api/generate", json=self._with_keep_alive(payload),
+                                             timeout=self._timeout_for("generate", timeout))
+            finally:
+                self._generation_slots.release()
+        return self._parse_response(response)
+
+    async def astream_generate(self, payload: Dict[str, Any],
+                               timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Llama a /api/generate en modo streaming y entrega cada línea JSON al llegar.
+
+        El timeout de lectura aplica entre fragmentos, no a la generación completa.
+
+        Args:
+            payload (Dict[str, Any]): Cuerpo de la petición (se fuerza stream=True)
+            timeout (float): Timeout de lectura (por defecto el del endpoint generate)
+
+        Yields:
+            Dict[str, Any]: Fragmentos de Ollama; el último incluye done=True y métricas
+        """
+        client = self._get_async_client()
+        async with self._semaphore:
+            await self._acquire_generation_slot()
+            try:
+                async with client.stream("POST", "/api/generate", json={**self._with_keep_alive(payload), "stream": True},
+                                         timeout=self._timeout_for("generate", timeout)) as response:
+                    if response.status_code != 200:
+                        detail = (await response.aread()).decode("utf-8", errors="replace")
+                        raise OllamaClientError(response.status_code, detail)
+                    async for line in response.aiter_lines():
+                        if line.strip():
+                            yield json.loads(line)
+            finally:
+                self._generation_slots.release()
+
+    async def alist_models(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Llama a /api/tags sin bloquear el event loop."""
+        client = self._get_async_client()
+        response = await client.get("/api/tags", timeout=self._timeout_for("tags", timeout))
+        return self._parse_response(response)
+
+    async def alist_running_models(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Llama a /api/ps sin bloquear el event loop."""
+        client = self._get_async_client()
+        response = await client.get("/api/ps", timeout=self._timeout_for("tags", timeout))
+        return self._parse_response(response)
+
+    async def aclose(self):
+        """Cierra los pools de conexiones."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
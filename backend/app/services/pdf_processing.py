@@ -1,53 +1,237 @@
 # pdf_processing.py
 # Procesador de documentos PDF con extracción y fragmentación de texto
 import fitz  # PyMuPDF
-from typing import List
+import multiprocessing
+import os
+import threading
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
-def extract_text_content(pdf_file_path: str) -> str:
+def iter_page_texts(pdf_document) -> Iterator[Tuple[int, str]]:
+    """
+    Recorre un documento PDF ya abierto y genera el texto de cada página.
+    
+    Args:
+        pdf_document: Documento abierto con fitz.open
+        
+    Yields:
+        Tuple[int, str]: Número de página (1-based) y su contenido textual
+    """
+    for page_index in range(len(pdf_document)):
+        page = pdf_document.load_page(page_index)
+        yield page_index + 1, page.get_text()
+
+# Mínimo de páginas por worker para que compense abrir el documento en otro proceso
+MIN_PAGES_PER_EXTRACTION_WORKER = 16
+
+# Por debajo de este tamaño se extrae en serie aunque haya varias CPUs: a ~2.5 ms
+# por página la extracción serial ya es corta, y el pool (compartido entre
+# ingestas) añade un 10-25% de CPU en IPC y aperturas del documento por rango
+PARALLEL_EXTRACTION_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+
+def available_cpu_count() -> int:
+    """CPUs que puede usar el proceso (respeta la afinidad, p. ej. en contenedores)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+def choose_extraction_workers(page_count: int, cpu_count: Optional[int] = None,
+                              min_pages_per_worker: int = MIN_PAGES_PER_EXTRACTION_WORKER,
+                              min_pages: int = PARALLEL_EXTRACTION_MIN_PAGES) -> int:
+    """
+    Calcula cuántos procesos usar para extraer texto según páginas y CPUs.
+    
+    Con una sola CPU o menos de min_pages páginas la extracción es serial.
+    
+    Args:
+        page_count (int): Número de páginas del documento
+        cpu_count (int): CPUs disponibles (por defecto las del proceso)
+        min_pages_per_worker (int): Páginas mínimas asignadas a cada worker
+        min_pages (int): Páginas mínimas para usar el pool de procesos
+        
+    Returns:
+        int: Número de workers (1 significa extracción serial)
+    """
+    available_cpus = cpu_count or available_cpu_count()
+    if available_cpus <= 1 or page_count < min_pages:
+        return 1
+    by_pages = page_count // max(min_pages_per_worker, 1)
+    return max(1, min(available_cpus, by_pages))
+
+def split_page_ranges(page_count: int, range_count: int) -> List[Tuple[int, int]]:
+    """
+    Divide las páginas [0, page_count) en rangos contiguos de tamaño similar.
+    
+    Returns:
+        List[Tuple[int, int]]: Rangos (inicio inclusivo, fin exclusivo)
+    """
+    range_count = max(1, min(range_count, page_count))
+    base_size, remainder = divmod(page_count, range_count)
+    page_ranges = []
+    start = 0
+    for range_index in range(range_count):
+        end = start + base_size + (1 if range_index < remainder else 0)
+        page_ranges.append((start, end))
+        start = end
+    return page_ranges
+
+def _extract_page_range(pdf_file_path: str, start: int, end: int) -> List[str]:
+    """Worker: abre su propio documento fitz y extrae el texto de [start, end)."""
+    pdf_document = fitz.open(pdf_file_path)
+    try:
+        return [pdf_document.load_page(page_index).get_text() for page_index in range(start, end)]
+    finally:
+        pdf_document.close()
+
+# Pool de extracción compartido. Usa "spawn": la API crea los trabajos desde hilos
+# de ingesta en un proceso con torch y pools HTTP cargados, y un fork ahí puede
+# heredar locks tomados y bloquearse.
+_extraction_pool: Optional[ProcessPoolExecutor] = None
+_extraction_pool_lock = threading.Lock()
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """
+    Obtiene el pool de procesos de extracción, creándolo en el primer uso.
+    
+    Se crea una sola vez (un proceso por CPU) y se reutiliza entre documentos,
+    así que el coste de arrancar los procesos no se paga en cada ingesta.
+    
+    Returns:
+        ProcessPoolExecutor: Pool compartido con contexto spawn
+    """
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            _extraction_pool = ProcessPoolExecutor(
+                max_workers=available_cpu_count(),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _extraction_pool
+
+def shutdown_extraction_pool():
+    """Cierra el pool de extracción (al apagar la API)."""
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is not None:
+            _extraction_pool.shutdown(wait=False, cancel_futures=True)
+            _extraction_pool = None
+
+def iter_page_texts_parallel(pdf_file_path: str, page_count: int, max_workers: Optional[int] = None,
+                             pages_per_task: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Extrae páginas en paralelo con un pool de procesos y las genera en orden.
+    
+    Cada worker abre su propio documento y procesa un rango contiguo de páginas;
+    los resultados se combinan respetando el orden original de las páginas.
+    Como mucho hay `workers` rangos en curso: se encola uno nuevo cada vez que
+    el consumidor recibe el siguiente, de modo que la extracción no adelanta
+    al embedding y la memoria no crece con el tamaño del documento.
+    
+    Args:
+        pdf_file_path (str): Ruta al archivo PDF
+        page_count (int): Número total de páginas
+        max_workers (int): Rangos en curso a la vez (automático si es None)
+        pages_per_task (int): Páginas por tarea (por defecto un rango por worker)
+        
+    Yields:
+        Tuple[int, str]: Número de página (1-based) y su contenido textual
+    """
+    workers = max_workers or choose_extraction_workers(page_count)
+    if workers <= 1 or page_count == 0:
+        pdf_document = fitz.open(pdf_file_path)
+        try:
+            yield from iter_page_texts(pdf_document)
+        finally:
+            pdf_document.close()
+        return
+    
+    range_count = -(-page_count // pages_per_task) if pages_per_task else workers
+    page_ranges = split_page_ranges(page_count, range_count)
+    executor = get_extraction_pool()
+    pending_ranges = iter(page_ranges)
+    in_flight = deque()
+    try:
+        for start, end in pending_ranges:
+            in_flight.append((start, executor.submit(_extract_page_range, pdf_file_path, start, end)))
+            if len(in_flight) >= workers:
+                break
+        while in_flight:
+            # Se consume en orden; el hueco liberado se ocupa con el siguiente rango
+            start, future = in_flight.popleft()
+            page_texts = future.result()
+            next_range = next(pending_ranges, None)
+            if next_range is not None:
+                in_flight.append((next_range[0], executor.submit(_extract_page_range, pdf_file_path, *next_range)))
+            for offset, page_text in enumerate(page_texts):
+                yield start + offset + 1, page_text
+    finally:
+        # Si el consumidor abandona (error o cierre), no dejar rangos encolados
+        for _, future in in_flight:
+            future.cancel()
+
+def extract_pages_parallel(pdf_file_path: str, max_workers: Optional[int] = None) -> List[str]:
+    """
+    Extrae el contenido de todas las páginas usando varios procesos.
+    
+    Args:
+        pdf_file_path (str): Ruta al archivo PDF
+        max_workers (int): Número de procesos (automático si es None)
+        
+    Returns:
+        List[str]: Contenido de cada página en orden
+    """
+    try:
+        pdf_document = fitz.open(pdf_file_path)
+        page_count = len(pdf_document)
+        pdf_document.close()
+        return [page_text for _, page_text in iter_page_texts_parallel(pdf_file_path, page_count, max_workers)]
+    except Exception as e:
+        raise Exception(f"Error en extracción paralela del PDF: {str(e)}")
+
+def extract_text_content(pdf_file_path: str, parallel: bool = False) -> str:
     """
     Extrae contenido textual completo de un archivo PDF usando PyMuPDF.
     
     Args:
         pdf_file_path (str): Ruta al archivo PDF
+        parallel (bool): Repartir las páginas entre varios procesos
         
     Returns:
         str: Contenido textual extraído
     """
-    extracted_content = ""
+    if parallel:
+        return "".join(extract_pages_parallel(pdf_file_path))
     try:
         # Abrir documento PDF
         pdf_document = fitz.open(pdf_file_path)
         
-        # Procesar cada página del documento
-        for page_index in range(len(pdf_document)):
-            page = pdf_document.load_page(page_index)
-            extracted_content += page.get_text()
+        # Procesar cada página del documento (join evita concatenaciones cuadráticas)
+        extracted_content = "".join(page_text for _, page_text in iter_page_texts(pdf_document))
             
         pdf_document.close()
         return extracted_content
     except Exception as e:
         raise Exception(f"Error procesando archivo PDF: {str(e)}")
 
-def extract_content_by_pages(pdf_file_path: str) -> List[str]:
+def extract_content_by_pages(pdf_file_path: str, parallel: bool = False) -> List[str]:
     """
     Extrae contenido textual página por página del PDF.
     
     Args:
         pdf_file_path (str): Ruta al archivo PDF
+        parallel (bool): Repartir las páginas entre varios procesos
         
     Returns:
         List[str]: Lista con contenido de cada página
     """
-    pages_content = []
+    if parallel:
+        return extract_pages_parallel(pdf_file_path)
     try:
         pdf_document = fitz.open(pdf_file_path)
-        
-        for page_index in range(len(pdf_document)):
-            page = pdf_document.load_page(page_index)
-            page_content = page.get_text()
-            pages_content.append(page_content)
-            
+        pages_content = [page_text for _, page_text in iter_page_texts(pdf_document)]
         pdf_document.close()
         return pages_content
     except Exception as e:
@@ -65,13 +249,35 @@ def extract_document_metadata(pdf_file_path: str) -> dict:
     """
     try:
         pdf_document = fitz.open(pdf_file_path)
-        document_metadata = pdf_document.metadata
-        document_metadata['total_pages'] = len(pdf_document)
+        document_metadata = read_document_metadata(pdf_document)
         pdf_document.close()
         return document_metadata
     except Exception as e:
         raise Exception(f"Error obteniendo metadatos: {str(e)}")
 
+def read_document_metadata(pdf_document) -> dict:
+    """
+    Lee los metadatos de un documento PDF ya abierto.
+    
+    Args:
+        pdf_document: Documento abierto con fitz.open
+        
+    Returns:
+        dict: Metadatos del documento incluyendo total_pages
+    """
+    document_metadata = dict(pdf_document.metadata or {})
+    document_metadata['total_pages'] = len(pdf_document)
+    return document_metadata
+
+def _build_content_splitter(fragment_size: int, fragment_overlap: int) -> RecursiveCharacterTextSplitter:
+    """Crea el splitter jerárquico usado para fragmentar contenido."""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=fragment_size,
+        chunk_overlap=fragment_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", " ", ""]
+    )
+
 def fragment_text_content(content: str, fragment_size: int = 1000, fragment_overlap: int = 200) -> List[str]:
     """
     Divide el contenido textual en fragmentos usando RecursiveCharacterTextSplitter.
@@ -86,12 +292,7 @@ def fragment_text_content(content: str, fragment_size: int = 1000, fragment_over
     """
     try:
         #Usando separadores jerárquicos para mejor fragmentación
-        content_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=fragment_size,
-            chunk_overlap=fragment_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
+        content_splitter = _build_content_splitter(fragment_size, fragment_overlap)
         
         text_fragments = content_splitter.split_text(content)
         return text_fragments
@@ -111,12 +312,175 @@ def process_pdf_document(pdf_file_path: str, fragment_size: int = 1000, fragment
         List[str]: Lista de fragmentos procesados
     """
     try:
-        # Extraer contenido textual del PDF
-        document_content = extract_text_content(pdf_file_path)
-        
-        # Fragmentar el contenido
-        content_fragments = fragment_text_content(document_content, fragment_size, fragment_overlap)
+        # Extraer y fragmentar el contenido en una sola pasada por las páginas
+        pdf_document = fitz.open(pdf_file_path)
+        content_fragments = [
+            fragment["text"]
+            for fragment in iter_text_fragments(iter_page_texts(pdf_document), fragment_size, fragment_overlap)
+        ]
+        pdf_document.close()
         
         return content_fragments
     except Exception as e:
         raise Exception(f"Error procesando documento PDF: {str(e)}")
+
+def iter_text_fragments(page_texts: Iterator[Tuple[int, str]], fragment_size: int = 1000,
+                        fragment_overlap: int = 200, window_factor: int = 4) -> Iterator[Dict[str, Any]]:
+    """
+    Fragmenta incrementalmente el texto a medida que llegan las páginas.
+    
+    Solo se mantiene en memoria una ventana de unas pocas veces fragment_size:
+    cuando la ventana se llena se emiten todos los fragmentos salvo el último,
+    que se conserva para continuar el texto de la página siguiente.
+    
+    Args:
+        page_texts: Iterador de (número de página, texto)
+        fragment_size (int): Tamaño máximo de cada fragmento
+        fragment_overlap (int): Superposición entre fragmentos
+        window_factor (int): Tamaño de la ventana en múltiplos de fragment_size
+        
+    Yields:
+        Dict[str, Any]: Fragmento con claves text, page_start y page_end
+    """
+    content_splitter = _build_content_splitter(fragment_size, fragment_overlap)
+    window_limit = max(fragment_size * window_factor, fragment_size + fragment_overlap + 1)
+    
+    buffer_parts: List[str] = []
+    buffer_length = 0
+    # Inicio (offset en el buffer) de cada página contenida en el buffer
+    page_offsets: List[int] = []
+    page_numbers: List[int] = []
+    
+    def split_buffer(final: bool) -> Iterator[Dict[str, Any]]:
+        nonlocal buffer_parts, buffer_length, page_offsets, page_numbers
+        buffer_text = "".join(buffer_parts)
+        fragments = content_splitter.split_text(buffer_text)
+        if not fragments:
+            buffer_parts, buffer_length, page_offsets, page_numbers = [], 0, [], []
+            return
+        
+        emit_count = len(fragments) if final else len(fragments) - 1
+        search_from = 0
+        positions = []
+        for fragment in fragments:
+            position = buffer_text.find(fragment, search_from)
+            if position < 0:
+                position = search_from
+            positions.append(position)
+            search_from = position + 1
+        
+        def page_at(offset: int) -> int:
+            return page_numbers[max(bisect_right(page_offsets, offset) - 1, 0)]
+        
+        for fragment, position in zip(fragments[:emit_count], positions[:emit_count]):
+            yield {
+                "text": fragment,
+                "page_start": page_at(position),
+                "page_end": page_at(position + max(len(fragment) - 1, 0))
+            }
+        
+        if final:
+            buffer_parts, buffer_length, page_offsets, page_numbers = [], 0, [], []
+            return
+        
+        # Conservar el último fragmento (posiblemente incompleto) como inicio de la ventana
+        tail_start = positions[-1]
+        tail_text = buffer_text[tail_start:]
+        first_kept = max(bisect_right(page_offsets, tail_start) - 1, 0)
+        page_numbers = page_numbers[first_kept:]
+        page_offsets = [max(offset - tail_start, 0) for offset in page_offsets[first_kept:]]
+        buffer_parts = [tail_text]
+        buffer_length = len(tail_text)
+    
+    for page_number, page_text in page_texts:
+        if not page_text:
+            continue
+        page_offsets.append(buffer_length)
+        page_numbers.append(page_number)
+        buffer_parts.append(page_text)
+        buffer_length += len(page_text)
+        
+        if buffer_length >= window_limit:
+            yield from split_buffer(final=False)
+    
+    if buffer_length:
+        yield from split_buffer(final=True)
+
+class PDFDocumentStream:
+    def __init__(self, pdf_file_path: str, fragment_size: int = 1000, fragment_overlap: int = 200,
+                 batch_size: int = 64, parallel_extraction: bool = False):
+        """
+        Pipeline de una sola pasada: abre el PDF una vez, lee sus metadatos y
+        genera lotes acotados de fragmentos a medida que recorre las páginas.
+        
+        Args:
+            pdf_file_path (str): Ruta al archivo PDF
+            fragment_size (int): Tamaño máximo de cada fragmento
+            fragment_overlap (int): Superposición entre fragmentos
+            batch_size (int): Número máximo de fragmentos por lote
+            parallel_extraction (bool): Extraer páginas con un pool de procesos
+        """
+        self.pdf_file_path = pdf_file_path
+        self.fragment_size = fragment_size
+        self.fragment_overlap = fragment_overlap
+        self.batch_size = batch_size
+        self.parallel_extraction = parallel_extraction
+        self.pdf_document = None
+        self.metadata: Dict[str, Any] = {}
+        self.total_pages = 0
+        self.pages_processed = 0
+        self.text_length = 0
+        self.fragments_count = 0
+    
+    def __enter__(self) -> "PDFDocumentStream":
+        try:
+            self.pdf_document = fitz.open(self.pdf_file_path)
+            self.metadata = read_document_metadata(self.pdf_document)
+            self.total_pages = self.metadata['total_pages']
+            return self
+        except Exception as e:
+            raise Exception(f"Error procesando archivo PDF: {str(e)}")
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.pdf_document is not None:
+            self.pdf_document.close()
+            self.pdf_document = None
+    
+    def _counted_pages(self) -> Iterator[Tuple[int, str]]:
+        """Recorre las páginas actualizando las estadísticas del flujo."""
+        if self.parallel_extraction and choose_extraction_workers(self.total_pages) > 1:
+            # Rangos pequeños para que el primer lote llegue pronto al embedding
+            page_texts = iter_page_texts_parallel(
+                self.pdf_file_path, self.total_pages, pages_per_task=MIN_PAGES_PER_EXTRACTION_WORKER
+            )
+        else:
+            page_texts = iter_page_texts(self.pdf_document)
+        for page_number, page_text in page_texts:
+            self.pages_processed = page_number
+            self.text_length += len(page_text)
+            yield page_number, page_text
+    
+    def iter_fragment_batches(self) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Genera lotes de fragmentos (text, page_start, page_end, fragment_index).
+        
+        Yields:
+            List[Dict[str, Any]]: Lote de como máximo batch_size fragmentos
+        """
+        if self.pdf_document is None:
+            raise Exception("El documento PDF no está abierto; use PDFDocumentStream como context manager")
+        
+        try:
+            batch: List[Dict[str, Any]] = []
+            fragments = iter_text_fragments(self._counted_pages(), self.fragment_size, self.fragment_overlap)
+            for fragment in fragments:
+                fragment["fragment_index"] = self.fragments_count
+                self.fragments_count += 1
+                batch.append(fragment)
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        except Exception as e:
+            raise Exception(f"Error fragmentando contenido: {str(e)}")
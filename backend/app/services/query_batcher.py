@@ -0,0 +1,153 @@
+# query_batcher.py
+# Micro-batching de embeddings de consultas concurrentes
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from .embeddings import EmbeddingManager, document_embedding_manager
+
+# Límites superiores (en número de consultas) de los buckets del histograma de tamaños de lote
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+
+
+class QueryEmbeddingBatcher:
+    def __init__(self, embedding_manager: EmbeddingManager, max_wait_ms: float = 8.0,
+                 max_batch_size: int = 32):
+        """
+        Agrupa consultas que llegan dentro de una ventana corta en una sola llamada al modelo.
+
+        Cada llamador recibe un Future que se resuelve con su vector cuando el lote
+        se procesa; así varias peticiones de chat concurrentes comparten un único
+        forward pass del modelo de embeddings.
+
+        Args:
+            embedding_manager (EmbeddingManager): Gestor que genera los embeddings
+            max_wait_ms (float): Tiempo máximo que espera el primer elemento de un lote
+            max_batch_size (int): Número máximo de consultas por lote
+        """
+        self.embedding_manager = embedding_manager
+        self.max_wait_seconds = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._pending: "queue.Queue[Tuple[str, Future, float]]" = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._max_batch_seen = 0
+        self._batch_size_histogram = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        self._batch_size_histogram["more"] = 0
+        self._total_queue_delay = 0.0
+        self._max_queue_delay = 0.0
+
+    def submit(self, text: str) -> Future:
+        """
+        Encola una consulta para el próximo lote.
+
+        Args:
+            text (str): Texto de la consulta
+
+        Returns:
+            Future: Se resuelve con el vector float32 de la consulta
+        """
+        self._ensure_worker()
+        result_future: Future = Future()
+        self._pending.put((text, result_future, time.perf_counter()))
+        return result_future
+
+    def embed(self, text: str) -> np.ndarray:
+        """
+        Genera el embedding de una consulta esperando al lote en el que se incluya.
+
+        Args:
+            text (str): Texto de la consulta
+
+        Returns:
+            np.ndarray: Vector float32 de la consulta
+        """
+        return self.submit(text).result()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Obtiene métricas de tamaño de lote y retardo en cola.
+
+        Returns:
+            Dict[str, Any]: Métricas del micro-batching
+        """
+        with self._metrics_lock:
+            return {
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+                "max_batch_size": self.max_batch_size,
+                "batches": self._batches,
+                "queries": self._items,
+                "average_batch_size": round(self._items / self._batches, 3) if self._batches else 0.0,
+                "max_batch_size_seen": self._max_batch_seen,
+                "batch_size_histogram": {str(k): v for k, v in self._batch_size_histogram.items()},
+                "average_queue_delay_ms": round(self._total_queue_delay / self._items * 1000, 3) if self._items else 0.0,
+                "max_queue_delay_ms": round(self._max_queue_delay * 1000, 3),
+                "pending": self._pending.qsize()
+            }
+
+    def _ensure_worker(self):
+        """Arranca el hilo de procesamiento de lotes la primera vez que se usa."""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect_batch(self) -> List[Tuple[str, Future, float]]:
+        """Espera la primera consulta y agrega las que lleguen dentro de la ventana."""
+        batch = [self._pending.get()]
+        deadline = time.perf_counter() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        """Bucle del hilo: forma lotes, los codifica y resuelve los futures."""
+        while True:
+            batch = self._collect_batch()
+            dispatched_at = time.perf_counter()
+            texts = [text for text, _, _ in batch]
+            try:
+                vectors = self.embedding_manager.create_embeddings(texts)
+                for (_, result_future, _), vector in zip(batch, vectors):
+                    result_future.set_result(vector)
+            except Exception as e:
+                for _, result_future, _ in batch:
+                    result_future.set_exception(e)
+            self._record_batch(batch, dispatched_at)
+
+    def _record_batch(self, batch: List[Tuple[str, Future, float]], dispatched_at: float):
+        """Actualiza las métricas con un lote procesado."""
+        batch_size = len(batch)
+        delays = [dispatched_at - enqueued_at for _, _, enqueued_at in batch]
+        with self._metrics_lock:
+            self._batches += 1
+            self._items += batch_size
+            self._max_batch_seen = max(self._max_batch_seen, batch_size)
+            bucket = next((b for b in BATCH_SIZE_BUCKETS if batch_size <= b), "more")
+            self._batch_size_histogram[bucket] += 1
+            self._total_queue_delay += sum(delays)
+            self._max_queue_delay = max(self._max_queue_delay, max(delays))
+
+
+# Instancia global del micro-batcher de consultas
+query_embedding_batcher = QueryEmbeddingBatcher(
+    document_embedding_manager,
+    max_wait_ms=float(os.getenv("QUERY_BATCH_WAIT_MS", "8")),
+    max_batch_size=int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+)
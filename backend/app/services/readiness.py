@@ -0,0 +1,89 @@
+# readiness.py
+# Warm-up en segundo plano y estado de preparación (readiness) de los servicios
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict
+
+from .embeddings import document_embedding_manager
+from .vector_store import vector_db
+from .lexical_index import lexical_index
+from .llm_service import local_llm_service
+from .reranker import cross_encoder_reranker
+
+
+class ServiceReadiness:
+    def __init__(self):
+        """
+        Registra el estado de inicialización de los componentes pesados.
+
+        Los componentes se inicializan de forma perezosa; el warm-up opcional los
+        prepara en un hilo de fondo sin bloquear el arranque de la API.
+        """
+        self.components: Dict[str, Dict[str, Any]] = {}
+        self._warmup_thread = None
+        self._lock = threading.Lock()
+        self.checks: Dict[str, Callable[[], bool]] = {
+            "embedding_model": document_embedding_manager.is_loaded,
+            "vector_database": lambda: vector_db.connected,
+            "lexical_index": lexical_index.is_built,
+            "llm": lambda: local_llm_service.is_availability_checked() and local_llm_service.model_available
+        }
+        self.warmups: Dict[str, Callable[[], Any]] = {
+            "embedding_model": document_embedding_manager.warm_up,
+            "vector_database": vector_db.ensure_connection,
+            # Las búsquedas léxicas e híbridas no pagan la construcción tras un reinicio
+            "lexical_index": lexical_index.ensure_built,
+            # Carga el modelo en Ollama para que la primera pregunta no pague la carga
+            "llm": local_llm_service.warm_up
+        }
+        if cross_encoder_reranker.enabled:
+            # Opcional como el LLM: si no carga, las búsquedas mantienen el orden vectorial
+            self.checks["reranker"] = cross_encoder_reranker.is_loaded
+            self.warmups["reranker"] = cross_encoder_reranker.warm_up
+
+    def start_background_warmup(self):
+        """Lanza el warm-up de todos los componentes en un hilo de fondo."""
+        with self._lock:
+            if self._warmup_thread is not None and self._warmup_thread.is_alive():
+                return
+            self._warmup_thread = threading.Thread(target=self._run_warmup, name="service-warmup", daemon=True)
+            self._warmup_thread.start()
+
+    def _run_warmup(self):
+        """Inicializa cada componente registrando duración y errores."""
+        for component, warm_up in self.warmups.items():
+            started = time.perf_counter()
+            self.components[component] = {"status": "warming_up", "started_at": datetime.now().isoformat()}
+            try:
+                warm_up()
+                self.components[component].update({"status": "ready" if self.checks[component]() else "unavailable"})
+            except Exception as e:
+                self.components[component].update({"status": "error", "error": str(e)})
+            self.components[component]["duration_seconds"] = round(time.perf_counter() - started, 3)
+
+    def get_readiness(self) -> Dict[str, Any]:
+        """
+        Obtiene el estado de preparación de cada componente.
+
+        Returns:
+            Dict[str, Any]: ready global y detalle por componente
+        """
+        components = {}
+        for component, check in self.checks.items():
+            try:
+                ready = bool(check())
+            except Exception:
+                ready = False
+            components[component] = {"ready": ready, **self.components.get(component, {"status": "lazy"})}
+
+        # El LLM es opcional: sin él la API responde con el modo de respaldo
+        required = ("embedding_model", "vector_database")
+        return {
+            "ready": all(components[name]["ready"] for name in required),
+            "components": components
+        }
+
+
+# Instancia global del estado de preparación
+service_readiness = ServiceReadiness()
@@ -0,0 +1,165 @@
+# reranker.py
+# Reordenación de candidatos con un cross-encoder local y presupuesto de tiempo por consulta
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from sentence_transformers import CrossEncoder
+
+from .hashing import hash_text
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", enabled: bool = False,
+                 candidates: int = 50, batch_size: int = 16, time_budget_ms: float = 300,
+                 cache_entries: int = 10000):
+        """
+        Inicializa el reordenador de fragmentos.
+
+        El cross-encoder puntúa cada par (consulta, fragmento) leyendo ambos textos
+        a la vez, lo que ordena mejor que la similitud entre embeddings pero cuesta
+        más; por eso solo se aplica a los candidatos de la búsqueda y con un
+        presupuesto de tiempo. Si el presupuesto se agota antes de puntuar todos
+        los candidatos, se conserva el orden original (las puntuaciones ya
+        calculadas quedan en caché para la siguiente consulta).
+
+        Args:
+            model_name (str): Modelo CrossEncoder de sentence-transformers
+            enabled (bool): Reordenar por defecto en cada búsqueda
+            candidates (int): Candidatos que se recuperan para reordenar
+            batch_size (int): Pares por lote enviado al modelo
+            time_budget_ms (float): Tiempo máximo de puntuación por consulta
+            cache_entries (int): Máximo de puntuaciones de pares en caché (LRU)
+        """
+        self.model_name = model_name
+        self.enabled = enabled
+        self.candidates = candidates
+        self.batch_size = batch_size
+        self.time_budget_ms = time_budget_ms
+        self.cache_entries = cache_entries
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.reranked_queries = 0
+        self.fallbacks = 0
+
+    @property
+    def model(self) -> CrossEncoder:
+        """Modelo cross-encoder, cargado en el primer acceso."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = CrossEncoder(self.model_name)
+        return self._model
+
+    def is_loaded(self) -> bool:
+        """Indica si el modelo ya está cargado en memoria."""
+        return self._model is not None
+
+    def warm_up(self):
+        """Carga el modelo y puntúa un par mínimo."""
+        self.model.predict([("warm-up", "warm-up")], show_progress_bar=False)
+
+    def rerank(self, query: str, fragments: List[Dict[str, Any]],
+               top_n: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Reordena fragmentos por la puntuación del cross-encoder.
+
+        Args:
+            query (str): Consulta del usuario
+            fragments (List[Dict]): Candidatos en el orden de la búsqueda
+            top_n (int): Fragmentos a devolver
+
+        Returns:
+            Tuple: (fragmentos reordenados y recortados a top_n, metadatos con
+                latencia, pares puntuados, aciertos de caché y estado)
+        """
+        started = time.perf_counter()
+        metadata = {"model": self.model_name, "candidates": len(fragments), "time_budget_ms": self.time_budget_ms}
+        if not fragments:
+            metadata.update(status="no_candidates", scored=0, cache_hits=0, latency_ms=0.0)
+            return fragments, metadata
+
+        query_hash = hash_text(query)
+        keys = [(query_hash, hash_text(fragment.get("content", ""))) for fragment in fragments]
+        scores: Dict[int, float] = {}
+        with self._cache_lock:
+            for position, key in enumerate(keys):
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    scores[position] = self._scores[key]
+        metadata["cache_hits"] = len(scores)
+
+        status = "reranked"
+        pending = [position for position in range(len(fragments)) if position not in scores]
+        try:
+            for batch_start in range(0, len(pending), self.batch_size):
+                if (time.perf_counter() - started) * 1000 > self.time_budget_ms:
+                    status = "budget_exceeded"
+                    break
+                batch = pending[batch_start:batch_start + self.batch_size]
+                batch_scores = self.model.predict(
+                    [(query, fragments[position].get("content", "")) for position in batch],
+                    batch_size=self.batch_size,
+                    show_progress_bar=False
+                )
+                with self._cache_lock:
+                    for position, score in zip(batch, batch_scores):
+                        scores[position] = float(score)
+                        self._scores[keys[position]] = float(score)
+                    while len(self._scores) > self.cache_entries:
+                        self._scores.popitem(last=False)
+        except Exception as e:
+            status = "error"
+            metadata["error"] = str(e)
+
+        metadata["scored"] = len(scores)
+        if status == "reranked":
+            order = sorted(range(len(fragments)), key=lambda position: scores[position], reverse=True)
+            reranked = []
+            for position in order[:top_n]:
+                fragment = dict(fragments[position])
+                fragment["rerank_score"] = round(scores[position], 4)
+                reranked.append(fragment)
+            self.reranked_queries += 1
+        else:
+            # Puntuaciones incompletas no son comparables: se mantiene el orden de la búsqueda
+            reranked = fragments[:top_n]
+            self.fallbacks += 1
+
+        metadata.update(status=status, latency_ms=round((time.perf_counter() - started) * 1000, 2))
+        return reranked, metadata
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene la configuración y contadores del reordenador.
+
+        Returns:
+            Dict[str, Any]: Estado del modelo, caché y consultas reordenadas
+        """
+        with self._cache_lock:
+            cached_pairs = len(self._scores)
+        return {
+            "enabled": self.enabled,
+            "model": self.model_name,
+            "model_loaded": self.is_loaded(),
+            "candidates": self.candidates,
+            "time_budget_ms": self.time_budget_ms,
+            "cached_pairs": cached_pairs,
+            "reranked_queries": self.reranked_queries,
+            "fallbacks": self.fallbacks
+        }
+
+
+# Instancia global del reordenador
+cross_encoder_reranker = CrossEncoderReranker(
+    model_name=os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+    enabled=os.getenv("RERANK_ENABLED", "false").lower() == "true",
+    candidates=int(os.getenv("RERANK_CANDIDATES", "50")),
+    batch_size=int(os.getenv("RERANK_BATCH_SIZE", "16")),
+    time_budget_ms=float(os.getenv("RERANK_TIME_BUDGET_MS", "300")),
+    cache_entries=int(os.getenv("RERANK_CACHE_ENTRIES", "10000"))
+)
@@ -1,58 +1,164 @@
 # retrieval.py
 # Servicio especializado para recuperación de información contextual
+import os
+import time
 from typing import List, Dict, Any, Optional
+import numpy as np
 from .embeddings import document_embedding_manager
-from .vector_store import vector_db
+from .query_batcher import query_embedding_batcher
+from .vector_store import vector_db, build_metadata_filter
+from .lexical_index import lexical_index
+from .document_catalog import document_catalog
+from .reranker import cross_encoder_reranker
+from .diversification import mmr_select, merge_adjacent_fragments
+
+# vector: solo embeddings; lexical: solo BM25 (sin modelo de embeddings); hybrid: fusión RRF de ambos
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
 
 class ContextualRetriever:
-    def __init__(self):
+    def __init__(self, default_mode: str = "vector", rrf_k: int = 60, hybrid_candidate_multiplier: int = 3,
+                 diversify: bool = False, mmr_lambda: float = 0.7, mmr_candidate_multiplier: int = 4,
+                 merge_adjacent: bool = True):
         """
         Inicializa el sistema de recuperación contextual.
+        
+        Con el reordenamiento activo se recuperan más candidatos (RERANK_CANDIDATES)
+        y el cross-encoder elige los max_results mejores. Con la diversificación
+        activa, MMR elige los max_results entre los candidatos penalizando los
+        casi duplicados, y los fragmentos contiguos elegidos se fusionan.
+        
+        Args:
+            default_mode (str): Modo de recuperación por defecto (vector, hybrid o lexical)
+            rrf_k (int): Constante de la fusión por rango recíproco (RRF)
+            hybrid_candidate_multiplier (int): Candidatos por lista en modo híbrido, como
+                múltiplo de max_results
+            diversify (bool): Diversificar con MMR por defecto
+            mmr_lambda (float): Peso de la relevancia frente a la diversidad (0-1)
+            mmr_candidate_multiplier (int): Candidatos para MMR, como múltiplo de max_results
+            merge_adjacent (bool): Fusionar fragmentos contiguos del mismo documento
         """
+        if default_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Modo de recuperación desconocido: {default_mode}")
         self.embedding_manager = document_embedding_manager
+        self.query_embedder = query_embedding_batcher
         self.vector_database = vector_db
+        self.lexical_index = lexical_index
+        self.reranker = cross_encoder_reranker
+        self.default_mode = default_mode
+        self.rrf_k = rrf_k
+        self.hybrid_candidate_multiplier = hybrid_candidate_multiplier
+        self.diversify = diversify
+        self.mmr_lambda = mmr_lambda
+        self.mmr_candidate_multiplier = mmr_candidate_multiplier
+        self.merge_adjacent = merge_adjacent
     
     def search_relevant_context(self, query: str, max_results: int = 5, 
-                               similarity_threshold: float = 0.5) -> Dict[str, Any]:
+                               similarity_threshold: float = 0.5,
+                               query_embedding: Optional[np.ndarray] = None,
+                               retrieval_mode: Optional[str] = None,
+                               filters: Optional[Dict[str, Any]] = None,
+                               rerank: Optional[bool] = None,
+                               diversify: Optional[bool] = None) -> Dict[str, Any]:
         """
-        Busca contexto relevante en ChromaDB basado en una consulta.
+        Busca contexto relevante basado en una consulta.
         
         Args:
             query (str): Consulta del usuario
             max_results (int): Número máximo de resultados
-            similarity_threshold (float): Umbral mínimo de similitud
+            similarity_threshold (float): Umbral mínimo de similitud (resultados vectoriales)
+            query_embedding (np.ndarray): Embedding de la consulta ya calculado (opcional)
+            retrieval_mode (str): vector, hybrid o lexical (por defecto el configurado)
+            filters (Dict[str, Any]): Argumentos de build_metadata_filter (filenames,
+                document_ids, page_from, page_to, uploaded_after, uploaded_before);
+                se aplican dentro de la consulta, antes de elegir el top-k
+            rerank (bool): Reordenar los candidatos con el cross-encoder (por
+                defecto RERANK_ENABLED)
+            diversify (bool): Diversificar con MMR y fusionar fragmentos contiguos
+                (por defecto DIVERSIFY_RESULTS)
             
         Returns:
             Dict[str, Any]: Contexto encontrado con metadatos
         """
         try:
-            # STEP 1: Generar embedding de la consulta
-            query_embedding = self.embedding_manager.create_single_embedding(query)
+            retrieval_mode = retrieval_mode or self.default_mode
+            if retrieval_mode not in RETRIEVAL_MODES:
+                raise ValueError(f"Modo de recuperación desconocido: {retrieval_mode} "
+                                 f"(opciones: {', '.join(RETRIEVAL_MODES)})")
+            where = build_metadata_filter(**(filters or {}))
+            rerank = self.reranker.enabled if rerank is None else rerank
+            diversify = self.diversify if diversify is None else diversify
+            search_metadata = {
+                "retrieval_mode": retrieval_mode,
+                "filters": where,
+                "similarity_threshold": similarity_threshold,
+                "max_results_requested": max_results
+            }
+            requested_results = max_results
+            if rerank:
+                max_results = max(max_results, self.reranker.candidates)
+            if diversify:
+                max_results = max(max_results, requested_results * self.mmr_candidate_multiplier)
+            fragment_vectors: Dict[str, np.ndarray] = {}
             
-            # STEP 2: Buscar en la base de datos vectorial
-            search_results = self.vector_database.find_similar_content(
-                query_vector=query_embedding,
-                max_results=max_results
-            )
+            if retrieval_mode == "lexical":
+                # Sin embedding ni base vectorial: el índice invertido guarda los textos
+                started = time.perf_counter()
+                lexical_hits = self.lexical_index.search(query, max_results=max_results, where=where)
+                search_metadata["lexical_seconds"] = round(time.perf_counter() - started, 6)
+                processed_context = self._process_lexical_results(lexical_hits)
+            else:
+                # STEP 1: Generar embedding de la consulta (agrupado con consultas concurrentes)
+                if query_embedding is None:
+                    query_embedding = self.query_embedder.embed(query)
+                search_metadata["embedding_dimension"] = int(query_embedding.shape[-1])
+                candidates = max_results if retrieval_mode == "vector" else max_results * self.hybrid_candidate_multiplier
+                
+                # STEP 2: Buscar en la base de datos vectorial
+                search_results = self.vector_database.find_similar_content(
+                    query_vector=query_embedding,
+                    max_results=candidates,
+                    where=where,
+                    include_embeddings=diversify
+                )
+                if diversify and search_results.get('embeddings') is not None and search_results['ids']:
+                    # Los vectores ya devueltos por la consulta sirven para MMR sin otra lectura
+                    fragment_vectors.update(zip(search_results['ids'][0], search_results['embeddings'][0]))
+                
+                # STEP 3: Procesar y filtrar resultados
+                processed_context = self._process_search_results(
+                    search_results, 
+                    similarity_threshold
+                )
+                
+                if retrieval_mode == "hybrid":
+                    started = time.perf_counter()
+                    lexical_hits = self.lexical_index.search(query, max_results=candidates, where=where)
+                    search_metadata["lexical_seconds"] = round(time.perf_counter() - started, 6)
+                    processed_context = self._fuse_results(
+                        processed_context, self._process_lexical_results(lexical_hits), max_results
+                    )
+                    search_metadata["fusion"] = {"method": "rrf", "k": self.rrf_k, "candidates_per_list": candidates}
             
-            # STEP 3: Procesar y filtrar resultados
-            processed_context = self._process_search_results(
-                search_results, 
-                similarity_threshold
-            )
+            if rerank:
+                processed_context, search_metadata["rerank"] = self.reranker.rerank(
+                    query, processed_context, len(processed_context) if diversify else requested_results
+                )
+            if diversify:
+                processed_context, search_metadata["diversification"] = self._diversify_results(
+                    processed_context, requested_results, query_embedding, fragment_vectors
+                )
+            if rerank or diversify:
+                for rank, fragment in enumerate(processed_context, start=1):
+                    fragment["relevance_rank"] = rank
             
             # STEP 4: Generar respuesta estructurada
+            search_metadata["total_results"] = len(processed_context)
             return {
                 "success": True,
                 "query": query,
                 "context_found": len(processed_context) > 0,
                 "relevant_fragments": processed_context,
-                "search_metadata": {
-                    "total_results": len(processed_context),
-                    "similarity_threshold": similarity_threshold,
-                    "max_results_requested": max_results,
-                    "embedding_dimension": len(query_embedding)
-                }
+                "search_metadata": search_metadata
             }
             
         except Exception as e:
@@ -83,6 +189,7 @@ class ContextualRetriever:
             return processed_fragments
         
         documents = search_results['documents'][0]
+        ids = search_results.get('ids', [[]])[0]
         metadatas = search_results.get('metadatas', [[]])[0]
         distances = search_results.get('distances', [[]])[0]
         
@@ -97,20 +204,9 @@ class ContextualRetriever:
             # Filtrar por umbral de similitud
             if similarity_score >= threshold:
                 metadata = metadatas[i] if i < len(metadatas) else {}
-                
-                fragment_info = {
-                    "content": document,
-                    "similarity_score": round(similarity_score, 4),
-                    "metadata": {
-                        "filename": metadata.get('filename', 'Desconocido'),
-                        "fragment_index": metadata.get('fragment_index', 0),
-                        "fragment_length": metadata.get('fragment_length', len(document)),
-                        "document_title": metadata.get('document_title', ''),
-                        "processing_timestamp": metadata.get('processing_timestamp', ''),
-                        "content_preview": metadata.get('content_preview', '')
-                    },
-                    "relevance_rank": i + 1
-                }
+                fragment_info = self._build_fragment(
+                    ids[i] if i < len(ids) else None, document, metadata, similarity_score, i + 1
+                )
                 processed_fragments.append(fragment_info)
         
         # Ordenar por similitud descendente
@@ -118,28 +214,193 @@ class ContextualRetriever:
         
         return processed_fragments
     
+    def _process_lexical_results(self, lexical_hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Convierte resultados BM25 al formato de fragmento de la búsqueda vectorial.
+        
+        La puntuación BM25 no está acotada; como similarity_score se usa la
+        puntuación relativa al mejor resultado (el primero vale 1.0).
+        
+        Args:
+            lexical_hits: Resultados de BM25Index.search
+            
+        Returns:
+            List[Dict]: Fragmentos procesados
+        """
+        if not lexical_hits:
+            return []
+        best_score = lexical_hits[0]["bm25_score"] or 1.0
+        fragments = []
+        for rank, hit in enumerate(lexical_hits, start=1):
+            fragment_info = self._build_fragment(
+                hit["fragment_id"], hit["content"], hit["metadata"], hit["bm25_score"] / best_score, rank
+            )
+            fragment_info["lexical_score"] = round(hit["bm25_score"], 4)
+            fragments.append(fragment_info)
+        return fragments
+    
+    def _fuse_results(self, vector_fragments: List[Dict[str, Any]], lexical_fragments: List[Dict[str, Any]],
+                      max_results: int) -> List[Dict[str, Any]]:
+        """
+        Combina las listas vectorial y léxica con fusión por rango recíproco (RRF).
+        
+        Cada fragmento suma 1 / (k + rango) por cada lista en la que aparece. Se
+        conserva la similitud vectorial cuando existe.
+        
+        Args:
+            vector_fragments: Fragmentos de la búsqueda vectorial (ordenados)
+            lexical_fragments: Fragmentos de la búsqueda BM25 (ordenados)
+            max_results: Número de fragmentos a devolver
+            
+        Returns:
+            List[Dict]: Fragmentos fusionados con fusion_score y retrieval_sources
+        """
+        fused: Dict[str, Dict[str, Any]] = {}
+        for source, fragments in (("vector", vector_fragments), ("lexical", lexical_fragments)):
+            for rank, fragment in enumerate(fragments, start=1):
+                entry = fused.get(fragment["fragment_id"])
+                if entry is None:
+                    entry = fused[fragment["fragment_id"]] = {**fragment, "fusion_score": 0.0, "retrieval_sources": []}
+                elif "lexical_score" in fragment:
+                    entry["lexical_score"] = fragment["lexical_score"]
+                entry["fusion_score"] += 1.0 / (self.rrf_k + rank)
+                entry["retrieval_sources"].append(source)
+        
+        ranked = sorted(fused.values(), key=lambda fragment: fragment["fusion_score"], reverse=True)[:max_results]
+        for rank, fragment in enumerate(ranked, start=1):
+            fragment["fusion_score"] = round(fragment["fusion_score"], 6)
+            fragment["relevance_rank"] = rank
+        return ranked
+    
+    def _diversify_results(self, fragments: List[Dict[str, Any]], max_results: int,
+                           query_embedding: Optional[np.ndarray],
+                           fragment_vectors: Dict[str, np.ndarray]) -> tuple:
+        """
+        Elige max_results fragmentos con MMR y fusiona los contiguos.
+        
+        La relevancia es la puntuación del cross-encoder si se reordenó, la
+        similitud coseno con la consulta si hay embedding de consulta, o la
+        similarity_score del fragmento; se normaliza a [0, 1] para que sea
+        comparable con la similitud entre fragmentos.
+        
+        Args:
+            fragments: Candidatos en orden de relevancia
+            max_results: Fragmentos a elegir
+            query_embedding: Embedding de la consulta (None en modo léxico)
+            fragment_vectors: Embeddings ya disponibles por fragment_id
+            
+        Returns:
+            tuple: (fragmentos elegidos, metadatos de la diversificación)
+        """
+        started = time.perf_counter()
+        metadata = {"method": "mmr", "lambda": self.mmr_lambda, "candidates": len(fragments)}
+        missing_ids = [f["fragment_id"] for f in fragments if f["fragment_id"] not in fragment_vectors]
+        if missing_ids:
+            fragment_vectors = {**fragment_vectors, **self.vector_database.get_embeddings_by_ids(missing_ids)}
+        candidates = [f for f in fragments if f["fragment_id"] in fragment_vectors]
+        
+        if len(candidates) > max_results:
+            embeddings = np.stack([np.asarray(fragment_vectors[f["fragment_id"]], dtype=np.float32) for f in candidates])
+            if all("rerank_score" in f for f in candidates):
+                relevance = np.array([f["rerank_score"] for f in candidates], dtype=np.float32)
+            elif query_embedding is not None:
+                query_vector = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+                norms = np.linalg.norm(embeddings, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+                relevance = embeddings @ query_vector / np.where(norms == 0, 1.0, norms)
+            else:
+                relevance = np.array([f["similarity_score"] for f in candidates], dtype=np.float32)
+            spread = float(relevance.max() - relevance.min())
+            relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones_like(relevance)
+            selected = [candidates[position] for position in
+                        mmr_select(relevance, embeddings, max_results, self.mmr_lambda)]
+        else:
+            selected = candidates[:max_results]
+        
+        selected_length = sum(len(f["content"]) for f in selected)
+        if self.merge_adjacent:
+            selected = merge_adjacent_fragments(selected)
+        metadata.update({
+            "selected": sum(len(f.get("merged_fragment_ids", [f["fragment_id"]])) for f in selected),
+            "merged_groups": sum(1 for f in selected if "merged_fragment_ids" in f),
+            "duplicate_chars_removed": selected_length - sum(len(f["content"]) for f in selected),
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2)
+        })
+        return selected, metadata
+    
+    @staticmethod
+    def _build_fragment(fragment_id: Optional[str], document: str, metadata: Dict[str, Any],
+                        similarity_score: float, rank: int) -> Dict[str, Any]:
+        """Estructura común de un fragmento recuperado (datos del documento desde el catálogo)."""
+        metadata = metadata or {}
+        document_info = document_catalog.get_document(metadata.get('filename', '')) or {}
+        return {
+            "fragment_id": fragment_id,
+            "content": document,
+            "similarity_score": round(similarity_score, 4),
+            "metadata": {
+                "filename": metadata.get('filename', 'Desconocido'),
+                "fragment_index": metadata.get('fragment_index', 0),
+                "fragment_length": metadata.get('fragment_length', len(document)),
+                "document_title": metadata.get('document_title') or document_info.get('title') or '',
+                "page_start": metadata.get('page_start'),
+                "page_end": metadata.get('page_end'),
+                "processing_timestamp": metadata.get('processing_timestamp') or document_info.get('upload_date') or '',
+                "content_preview": metadata.get('content_preview') or (document[:100] + "..." if len(document) > 100 else document)
+            },
+            "relevance_rank": rank
+        }
+    
     def search_by_document(self, document_filename: str, 
-                          max_results: int = 10) -> Dict[str, Any]:
+                          max_results: int = 10, query: Optional[str] = None,
+                          page_from: Optional[int] = None, page_to: Optional[int] = None) -> Dict[str, Any]:
         """
-        Busca todos los fragmentos de un documento específico.
+        Busca fragmentos de un documento específico.
+        
+        Sin consulta devuelve los fragmentos en orden de lectura; con consulta, los
+        más similares dentro del documento (el filtro se aplica en la búsqueda
+        vectorial, no después).
         
         Args:
             document_filename (str): Nombre del documento
             max_results (int): Número máximo de fragmentos
+            query (str): Consulta opcional para ordenar por relevancia
+            page_from (int): Primera página del rango (opcional)
+            page_to (int): Última página del rango (opcional)
             
         Returns:
             Dict[str, Any]: Fragmentos del documento
         """
         try:
-            # NOTE: Búsqueda directa por metadatos en lugar de similitud semántica
-            # Esta funcionalidad requiere implementación específica en ChromaDB
-            # Por ahora retornamos un placeholder
+            filters = {"filenames": [document_filename], "page_from": page_from, "page_to": page_to}
+            if query:
+                search_result = self.search_relevant_context(
+                    query, max_results=max_results, similarity_threshold=0.0, filters=filters
+                )
+                if not search_result["success"]:
+                    raise Exception(search_result["error"])
+                fragments = search_result["relevant_fragments"]
+            else:
+                self.vector_database.ensure_connection()
+                document_chunks = self.vector_database.doc_collection.get(
+                    where=build_metadata_filter(**filters),
+                    include=["documents", "metadatas"]
+                )
+                fragments = [
+                    self._build_fragment(fragment_id, document, metadata, 1.0, 0)
+                    for fragment_id, document, metadata in zip(
+                        document_chunks["ids"], document_chunks["documents"], document_chunks["metadatas"]
+                    )
+                ]
+                fragments.sort(key=lambda fragment: fragment["metadata"]["fragment_index"])
+                fragments = fragments[:max_results]
+                for rank, fragment in enumerate(fragments, start=1):
+                    fragment["relevance_rank"] = rank
             
             return {
                 "document_filename": document_filename,
-                "fragments_found": [],
-                "total_fragments": 0,
-                "status": "Funcionalidad en desarrollo - búsqueda por documento específico"
+                "fragments_found": fragments,
+                "total_fragments": len(fragments),
+                "status": "ok"
             }
             
         except Exception as e:
@@ -179,4 +440,12 @@ class ContextualRetriever:
         return summary.strip()
 
 # Instancia global del recuperador contextual
-contextual_retriever = ContextualRetriever()
+contextual_retriever = ContextualRetriever(
+    default_mode=os.getenv("RETRIEVAL_MODE", "vector").lower(),
+    rrf_k=int(os.getenv("RRF_K", "60")),
+    hybrid_candidate_multiplier=int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "3")),
+    diversify=os.getenv("DIVERSIFY_RESULTS", "false").lower() == "true",
+    mmr_lambda=float(os.getenv("MMR_LAMBDA", "0.7")),
+    mmr_candidate_multiplier=int(os.getenv("MMR_CANDIDATE_MULTIPLIER", "4")),
+    merge_adjacent=os.getenv("MERGE_ADJACENT_FRAGMENTS", "true").lower() == "true"
+)
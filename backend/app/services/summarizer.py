@@ -5,20 +5,28 @@ import json
 from typing import List, Dict, Any, Optional
 from .vector_store import vector_db
 from .llm_service import local_llm_service
+from .context_packer import context_packer
 
 class DocumentSummarizer:
     def __init__(self):
         """Inicializa el servicio de resumen de documentos."""
-        self.ollama_available = False
-        self.check_ollama_availability()
+        # La disponibilidad de Ollama se comprueba en el primer uso, no al importar
+        self._ollama_available = None
+    
+    @property
+    def ollama_available(self) -> bool:
+        """Indica si Ollama está disponible (verificación perezosa)."""
+        if self._ollama_available is None:
+            self.check_ollama_availability()
+        return self._ollama_available
     
     def check_ollama_availability(self):
         """Verifica si Ollama está disponible."""
         try:
             status = local_llm_service.get_llm_status()
-            self.ollama_available = status.get("ollama_connected", False)
+            self._ollama_available = status.get("ollama_connected", False)
         except Exception:
-            self.ollama_available = False
+            self._ollama_available = False
     
     def generate_document_summary(self, document_content: str, summary_type: str = "comprehensive") -> Dict[str, Any]:
         """
@@ -107,13 +115,17 @@ class DocumentSummarizer:
             Dict[str, Any]: Resumen comparativo
         """
         try:
+            # Cada documento recibe la mitad del presupuesto de comparación
+            share = context_packer.get_budget("comparison") // 2
+            doc1_content, _ = context_packer.fit_text(doc1_content, "comparison", share)
+            doc2_content, _ = context_packer.fit_text(doc2_content, "comparison", share)
             prompt = f"""Analiza y compara los siguientes dos documentos, generando un resumen comparativo estructurado:
 
 DOCUMENTO 1:
-{doc1_content[:2000]}{'...' if len(doc1_content) > 2000 else ''}
+{doc1_content}
 
 DOCUMENTO 2:
-{doc2_content[:2000]}{'...' if len(doc2_content) > 2000 else ''}
+{doc2_content}
 
 Genera un análisis comparativo que incluya:
 
@@ -154,7 +166,7 @@ ANÁLISIS COMPARATIVO:"""
     
     def _get_summary_prompt(self, content: str, summary_type: str) -> str:
         """Genera prompt especializado según el tipo de resumen."""
-        base_content = content[:3000] + ('...' if len(content) > 3000 else '')
+        base_content, _ = context_packer.fit_text(content, "summary")
         
         prompts = {
             "comprehensive": f"""Analiza el siguiente documento y genera un resumen completo y estructurado:
@@ -260,9 +272,12 @@ RESUMEN CONSOLIDADO:"""
     def _prepare_multi_document_content(self, documents_content: List[str]) -> str:
         """Prepara contenido de múltiples documentos para resumen."""
         prepared_content = []
+        documents_content = documents_content[:10]  # Máximo 10 documentos
         
-        for i, content in enumerate(documents_content[:10]):  # Máximo 10 documentos
-            doc_preview = content[:800] + ('...' if len(content) > 800 else '')
+        # Reparto equitativo del presupuesto para que todos los documentos estén representados
+        share = context_packer.get_budget("multi_summary") // max(len(documents_content), 1)
+        for i, content in enumerate(documents_content):
+            doc_preview, _ = context_packer.fit_text(content, "multi_summary", share)
             prepared_content.append(f"DOCUMENTO {i+1}:\n{doc_preview}\n---")
         
         return "\n\n".join(prepared_content)
@@ -271,10 +286,12 @@ RESUMEN CONSOLIDADO:"""
         """Genera resumen usando Ollama/Llama."""
         try:
             # Usar el servicio LLM local
+            # El prompt ya está ajustado a su presupuesto: no debe recortarse de nuevo
             response = local_llm_service.generate_contextual_response(
                 question="Genera el resumen solicitado",
                 context_fragments=[{"content": prompt}],
-                max_tokens=800
+                max_tokens=800,
+                context_budget_tokens=context_packer.count_tokens(prompt) + 64
             )
             
             if response.get("success", False):
@@ -284,7 +301,8 @@ RESUMEN CONSOLIDADO:"""
                     "method": "llama_local",
                     "summary_type": summary_type,
                     "model_used": response.get("model_used", "unknown"),
-                    "tokens_used": response.get("tokens_used", 0)
+                    "tokens_used": response.get("tokens_used", 0),
+                    "context_packing": response.get("context_packing")
                 }
             else:
                 return {
@@ -5,6 +5,7 @@ import json
 from typing import List, Dict, Any, Optional
 from .vector_store import vector_db
 from .llm_service import local_llm_service
+from .context_packer import context_packer
 
 class TopicClassifier:
     def __init__(self):
@@ -236,10 +237,11 @@ class TopicClassifier:
         try:
             # Preparar prompt de clasificación
             labels_str = ", ".join(labels)
+            prompt_content, _ = context_packer.fit_text(content, "classification")
             prompt = f"""Clasifica el siguiente texto en una de estas categorías: {labels_str}
 
 TEXTO A CLASIFICAR:
-{content[:1500]}
+{prompt_content}
 
 Instrucciones:
 1. Lee el texto cuidadosamente
@@ -258,7 +260,8 @@ CLASIFICACIÓN:"""
             llm_response = local_llm_service.generate_contextual_response(
                 question="Clasifica este contenido según las categorías proporcionadas",
                 context_fragments=[{"content": prompt}],
-                max_tokens=200
+                max_tokens=200,
+                context_budget_tokens=context_packer.count_tokens(prompt) + 64
             )
             
             if llm_response.get("success", False):
@@ -0,0 +1,774 @@
+# vector_backends.py
+# Backends de almacenamiento vectorial intercambiables detrás de VectorDatabase
+#
+# VectorDatabase trabaja contra la interfaz de colección de ChromaDB (upsert, get,
+# query, delete, count). Este módulo crea el cliente configurado: ChromaDB por HTTP,
+# ChromaDB embebido en el proceso (PersistentClient) o una implementación propia
+# de esa misma interfaz: vectores float32 en un archivo mapeado en memoria, textos
+# y metadatos en SQLite y, para corpus grandes, un índice HNSW persistido junto a ellos.
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+
+try:
+    import hnswlib
+    HNSW_AVAILABLE = True
+except ImportError:
+    HNSW_AVAILABLE = False
+
+VECTOR_BACKENDS = ("chromadb", "chromadb_embedded", "local")
+
+# Campos incluidos por defecto, igual que en ChromaDB
+DEFAULT_GET_INCLUDE = ["documents", "metadatas"]
+DEFAULT_QUERY_INCLUDE = ["documents", "metadatas", "distances"]
+
+# Capacidad inicial (filas) del archivo de vectores; se duplica al llenarse
+INITIAL_CAPACITY = 1024
+
+
+def matches_where(metadata: Optional[Dict[str, Any]], where: Optional[Dict[str, Any]]) -> bool:
+    """
+    Evalúa un filtro de metadatos con la sintaxis de ChromaDB.
+
+    Soporta igualdad directa, $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin, $and y $or.
+
+    Args:
+        metadata (Dict[str, Any]): Metadatos de un fragmento
+        where (Dict[str, Any]): Filtro
+
+    Returns:
+        bool: True si los metadatos cumplen el filtro
+    """
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if not _compare(value, operator, operand, key in metadata):
+                    return False
+        elif metadata.get(key) != condition or key not in metadata:
+            return False
+    return True
+
+
+def _compare(value: Any, operator: str, operand: Any, present: bool) -> bool:
+    """Aplica un operador de comparación de ChromaDB."""
+    if operator == "$eq":
+        return present and value == operand
+    if operator == "$ne":
+        return value != operand
+    if operator == "$in":
+        return present and value in operand
+    if operator == "$nin":
+        return value not in operand
+    if not present or value is None:
+        return False
+    try:
+        if operator == "$gt":
+            return value > operand
+        if operator == "$gte":
+            return value >= operand
+        if operator == "$lt":
+            return value < operand
+        if operator == "$lte":
+            return value <= operand
+    except TypeError:
+        return False
+    raise ValueError(f"Operador de filtro no soportado: {operator}")
+
+
+class LocalVectorCollection:
+    def __init__(self, name: str, directory: str, metadata: Optional[Dict[str, Any]] = None,
+                 hnsw_threshold: int = 50000, hnsw_m: int = 16, hnsw_ef_construction: int = 200,
+                 hnsw_ef_search: int = 64, hnsw_save_interval: float = 60.0):
+        """
+        Colección vectorial en proceso con la misma interfaz que una colección de ChromaDB.
+
+        La búsqueda es exacta (producto matricial sobre el archivo mapeado) hasta
+        hnsw_threshold fragmentos; a partir de ahí se construye un índice HNSW que
+        se mantiene incrementalmente. Las distancias son L2 al cuadrado, como la
+        métrica por defecto de ChromaDB.
+
+        Args:
+            name (str): Nombre de la colección
+            directory (str): Directorio donde se guardan sus archivos
+            metadata (Dict[str, Any]): Metadatos de la colección
+            hnsw_threshold (int): Fragmentos a partir de los cuales se usa HNSW
+            hnsw_m (int): Conexiones por nodo del grafo HNSW
+            hnsw_ef_construction (int): Amplitud de búsqueda al construir el grafo
+            hnsw_ef_search (int): Amplitud de búsqueda en las consultas
+            hnsw_save_interval (float): Segundos mínimos entre guardados del índice HNSW
+        """
+        self.name = name
+        self.directory = directory
+        self.hnsw_threshold = hnsw_threshold
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+        self.hnsw_save_interval = hnsw_save_interval
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._hnsw_path = os.path.join(directory, "hnsw.bin")
+        self._hnsw_state_path = os.path.join(directory, "hnsw.json")
+        self._connection = sqlite3.connect(os.path.join(directory, "records.sqlite3"), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS records (
+                row INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                document TEXT,
+                metadata TEXT
+            )"""
+        )
+        self._connection.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._connection.commit()
+
+        info = dict(self._connection.execute("SELECT key, value FROM info").fetchall())
+        self.metadata = json.loads(info["metadata"]) if "metadata" in info else (metadata or {})
+        self.dimension: Optional[int] = int(info["dimension"]) if "dimension" in info else None
+        self._capacity = int(info.get("capacity", 0))
+        self._write_counter = int(info.get("write_counter", 0))
+        if "metadata" not in info:
+            self._set_info("metadata", json.dumps(self.metadata))
+
+        # Índices en memoria: fila <-> id, metadatos por fila y filas vivas
+        self._vectors: Optional[np.memmap] = None
+        self._id_to_row: Dict[str, int] = {}
+        self._row_ids: List[Optional[str]] = [None] * self._capacity
+        self._row_metadatas: List[Optional[Dict[str, Any]]] = [None] * self._capacity
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        self._sq_norms = np.zeros(self._capacity, dtype=np.float32)
+        self._field_indexes: Dict[str, Dict[Any, Set[int]]] = {}
+        self._hnsw = None
+        self._hnsw_dirty = False
+        self._hnsw_saved_at = 0.0
+
+        if self.dimension is not None and self._capacity:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                      shape=(self._capacity, self.dimension))
+            for row, fragment_id, metadata_json in self._connection.execute("SELECT row, id, metadata FROM records"):
+                self._id_to_row[fragment_id] = row
+                self._row_ids[row] = fragment_id
+                self._row_metadatas[row] = json.loads(metadata_json) if metadata_json else {}
+                self._alive[row] = True
+            alive_rows = np.flatnonzero(self._alive)
+            if len(alive_rows):
+                self._sq_norms[alive_rows] = np.einsum("ij,ij->i", self._vectors[alive_rows], self._vectors[alive_rows])
+        self._free_rows = [row for row in range(self._capacity - 1, -1, -1) if not self._alive[row]]
+        if self.dimension is not None:
+            self._maybe_build_hnsw()
+
+    # ------------------------------------------------------------------
+    # Interfaz de colección (compatible con ChromaDB)
+    # ------------------------------------------------------------------
+
+    def count(self) -> int:
+        """Número de fragmentos almacenados."""
+        with self._lock:
+            return len(self._id_to_row)
+
+    def upsert(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict[str, Any]]] = None):
+        """
+        Inserta o actualiza fragmentos.
+
+        Args:
+            ids (List[str]): Identificadores
+            embeddings: Matriz (n, dim) o lista de vectores
+            documents (List[str]): Textos
+            metadatas (List[Dict]): Metadatos
+        """
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        if len(ids) != len(vectors):
+            raise ValueError("ids y embeddings deben tener la misma longitud")
+        documents = documents if documents is not None else [None] * len(ids)
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+
+        with self._lock:
+            self._ensure_dimension(vectors.shape[1])
+            rows = []
+            for fragment_id in ids:
+                row = self._id_to_row.get(fragment_id)
+                if row is None:
+                    row = self._allocate_row()
+                    self._id_to_row[fragment_id] = row
+                    self._row_ids[row] = fragment_id
+                    self._alive[row] = True
+                else:
+                    self._unindex_fields(row)
+                rows.append(row)
+
+            rows_array = np.asarray(rows, dtype=np.int64)
+            self._vectors[rows_array] = vectors
+            self._vectors.flush()
+            self._sq_norms[rows_array] = np.einsum("ij,ij->i", vectors, vectors)
+            for row, metadata in zip(rows, metadatas):
+                self._row_metadatas[row] = dict(metadata or {})
+                self._index_fields(row)
+
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO records (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (row, fragment_id, document, json.dumps(metadata or {}, ensure_ascii=False))
+                    for row, fragment_id, document, metadata in zip(rows, ids, documents, metadatas)
+                ]
+            )
+            self._bump_write_counter()
+
+            if self._hnsw is not None:
+                self._resize_hnsw()
+                self._hnsw.add_items(vectors, rows_array)
+                self._mark_hnsw_dirty()
+            else:
+                self._maybe_build_hnsw()
+
+    def add(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+            metadatas: Optional[List[Dict[str, Any]]] = None):
+        """Alias de upsert (los IDs existentes se sobrescriben)."""
+        self.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None,
+            include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Obtiene fragmentos por IDs y/o filtro de metadatos.
+
+        Returns:
+            Dict[str, Any]: ids, documents, metadatas y embeddings según include
+        """
+        include = DEFAULT_GET_INCLUDE if include is None else include
+        with self._lock:
+            rows = self._select_rows(ids, where)
+            rows = rows[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+            return self._build_result(rows, include)
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+              include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Busca los n_results fragmentos más cercanos a cada vector de consulta.
+
+        Returns:
+            Dict[str, Any]: Listas anidadas (una por consulta) de ids, documents,
+            metadatas y distances según include
+        """
+        include = DEFAULT_QUERY_INCLUDE if include is None else include
+        queries = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+
+        result = {"ids": [], "distances": [] if "distances" in include else None}
+        for field in ("documents", "metadatas", "embeddings"):
+            result[field] = [] if field in include else None
+
+        with self._lock:
+            if self.dimension is not None and queries.shape[1] != self.dimension:
+                raise ValueError(f"Dimensión de consulta {queries.shape[1]} distinta de la colección ({self.dimension})")
+            candidate_rows = None if where is None else np.asarray(self._select_rows(None, where), dtype=np.int64)
+
+            for query_vector in queries:
+                rows, distances = self._nearest_rows(query_vector, n_results, candidate_rows)
+                row_result = self._build_result(rows, [field for field in include if field != "distances"])
+                result["ids"].append(row_result["ids"])
+                if result["distances"] is not None:
+                    result["distances"].append([float(distance) for distance in distances])
+                for field in ("documents", "metadatas", "embeddings"):
+                    if result[field] is not None:
+                        result[field].append(row_result[field])
+        return result
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        """
+        Elimina fragmentos por IDs y/o filtro de metadatos.
+
+        Args:
+            ids (List[str]): Identificadores a eliminar
+            where (Dict[str, Any]): Filtro de metadatos
+        """
+        with self._lock:
+            rows = self._select_rows(ids, where)
+            if not rows:
+                return
+            for row in rows:
+                self._unindex_fields(row)
+                del self._id_to_row[self._row_ids[row]]
+                self._row_ids[row] = None
+                self._row_metadatas[row] = None
+                self._alive[row] = False
+                self._free_rows.append(row)
+                if self._hnsw is not None:
+                    self._hnsw.mark_deleted(row)
+            self._connection.executemany("DELETE FROM records WHERE row = ?", [(row,) for row in rows])
+            self._bump_write_counter()
+            if self._hnsw is not None:
+                self._mark_hnsw_dirty()
+
+    def persist(self):
+        """Vuelca a disco el archivo de vectores y el índice HNSW pendiente."""
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            if self._hnsw is not None and self._hnsw_dirty:
+                self._save_hnsw()
+
+    def get_backend_info(self) -> Dict[str, Any]:
+        """Estado del motor de búsqueda de la colección."""
+        with self._lock:
+            return {
+                "engine": "hnsw" if self._hnsw is not None else "exact",
+                "hnsw_available": HNSW_AVAILABLE,
+                "hnsw_threshold": self.hnsw_threshold,
+                "dimension": self.dimension,
+                "capacity": self._capacity,
+                "fragments": len(self._id_to_row),
+                "directory": self.directory
+            }
+
+    # ------------------------------------------------------------------
+    # Búsqueda
+    # ------------------------------------------------------------------
+
+    def _nearest_rows(self, query_vector: np.ndarray, n_results: int, candidate_rows: Optional[np.ndarray]):
+        """Filas más cercanas y sus distancias L2 al cuadrado (requiere el lock)."""
+        alive_count = len(self._id_to_row)
+        if self._vectors is None or alive_count == 0 or n_results <= 0:
+            return [], []
+
+        query_sq_norm = float(query_vector @ query_vector)
+        use_hnsw = self._hnsw is not None and (candidate_rows is None or len(candidate_rows) > self.hnsw_threshold)
+
+        if use_hnsw:
+            if candidate_rows is None:
+                k = min(n_results, alive_count)
+                labels, distances = self._hnsw.knn_query(query_vector, k=k)
+            else:
+                allowed = set(candidate_rows.tolist())
+                k = min(n_results, len(allowed))
+                if k == 0:
+                    return [], []
+                labels, distances = self._hnsw.knn_query(query_vector, k=k, filter=lambda label: label in allowed)
+            return [int(label) for label in labels[0]], [float(distance) for distance in distances[0]]
+
+        if candidate_rows is None:
+            # Producto matricial sobre todas las filas; las eliminadas quedan a distancia infinita
+            used_rows = self._used_rows()
+            distances = self._sq_norms[:used_rows] + query_sq_norm - 2.0 * (self._vectors[:used_rows] @ query_vector)
+            distances[~self._alive[:used_rows]] = np.inf
+            rows = np.arange(used_rows)
+        else:
+            if len(candidate_rows) == 0:
+                return [], []
+            rows = candidate_rows
+            distances = self._sq_norms[rows] + query_sq_norm - 2.0 * (self._vectors[rows] @ query_vector)
+
+        k = min(n_results, alive_count, len(rows))
+        if k < len(distances):
+            top = np.argpartition(distances, k - 1)[:k]
+        else:
+            top = np.arange(len(distances))
+        top = top[np.argsort(distances[top], kind="stable")]
+        top = top[np.isfinite(distances[top])]
+        return rows[top].tolist(), np.maximum(distances[top], 0.0).tolist()
+
+    def _maybe_build_hnsw(self):
+        """Construye (o carga) el índice HNSW cuando el corpus supera el umbral."""
+        if not HNSW_AVAILABLE or self._hnsw is not None or len(self._id_to_row) < self.hnsw_threshold:
+            return
+
+        index = hnswlib.Index(space="l2", dim=self.dimension)
+        if self._load_saved_hnsw(index):
+            self._hnsw = index
+        else:
+            index.init_index(max_elements=self._capacity, M=self.hnsw_m, ef_construction=self.hnsw_ef_construction)
+            alive_rows = np.flatnonzero(self._alive)
+            for start in range(0, len(alive_rows), 10000):
+                batch_rows = alive_rows[start:start + 10000]
+                index.add_items(np.asarray(self._vectors[batch_rows]), batch_rows)
+            self._hnsw = index
+            self._save_hnsw()
+        self._hnsw.set_ef(self.hnsw_ef_search)
+
+    def _load_saved_hnsw(self, index) -> bool:
+        """Carga el índice guardado si corresponde al estado actual de la colección."""
+        try:
+            with open(self._hnsw_state_path, "r", encoding="utf-8") as state_file:
+                state = json.load(state_file)
+            if state.get("write_counter") != self._write_counter or not os.path.exists(self._hnsw_path):
+                return False
+            index.load_index(self._hnsw_path, max_elements=self._capacity)
+            return True
+        except Exception:
+            return False
+
+    def _save_hnsw(self):
+        """Guarda el índice HNSW junto con el contador de escrituras que refleja."""
+        self._hnsw.save_index(self._hnsw_path)
+        with open(self._hnsw_state_path, "w", encoding="utf-8") as state_file:
+            json.dump({"write_counter": self._write_counter}, state_file)
+        self._hnsw_dirty = False
+        self._hnsw_saved_at = time.monotonic()
+
+    def _mark_hnsw_dirty(self):
+        """Marca el índice como modificado y lo guarda como mucho una vez por intervalo."""
+        self._hnsw_dirty = True
+        if time.monotonic() - self._hnsw_saved_at >= self.hnsw_save_interval:
+            self._save_hnsw()
+
+    def _resize_hnsw(self):
+        if self._hnsw.get_max_elements() < self._capacity:
+            self._hnsw.resize_index(self._capacity)
+
+    # ------------------------------------------------------------------
+    # Almacenamiento
+    # ------------------------------------------------------------------
+
+    def _ensure_dimension(self, dimension: int):
+        """Fija la dimensión en la primera inserción y valida las siguientes."""
+        if self.dimension is None:
+            self.dimension = dimension
+            self._set_info("dimension", str(dimension))
+            self._grow(INITIAL_CAPACITY)
+        elif dimension != self.dimension:
+            raise ValueError(f"Dimensión {dimension} distinta de la colección ({self.dimension})")
+
+    def _allocate_row(self) -> int:
+        if not self._free_rows:
+            self._grow(max(INITIAL_CAPACITY, self._capacity * 2))
+        return self._free_rows.pop()
+
+    def _grow(self, new_capacity: int):
+        """Amplía el archivo de vectores y las estructuras por fila."""
+        old_capacity = self._capacity
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self._vectors_path, "ab") as vectors_file:
+            vectors_file.truncate(new_capacity * self.dimension * 4)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                  shape=(new_capacity, self.dimension))
+
+        extra = new_capacity - old_capacity
+        self._row_ids.extend([None] * extra)
+        self._row_metadatas.extend([None] * extra)
+        self._alive = np.concatenate([self._alive, np.zeros(extra, dtype=bool)])
+        self._sq_norms = np.concatenate([self._sq_norms, np.zeros(extra, dtype=np.float32)])
+        self._free_rows.extend(range(new_capacity - 1, old_capacity - 1, -1))
+        self._capacity = new_capacity
+        self._set_info("capacity", str(new_capacity))
+        if self._hnsw is not None:
+            self._resize_hnsw()
+
+    def _used_rows(self) -> int:
+        """Número de filas hasta la última viva (acota el producto matricial)."""
+        alive_rows = np.flatnonzero(self._alive)
+        return int(alive_rows[-1]) + 1 if len(alive_rows) else 0
+
+    def _set_info(self, key: str, value: str):
+        self._connection.execute("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", (key, value))
+        self._connection.commit()
+
+    def _bump_write_counter(self):
+        self._write_counter += 1
+        self._connection.execute(
+            "INSERT OR REPLACE INTO info (key, value) VALUES ('write_counter', ?)", (str(self._write_counter),)
+        )
+        self._connection.commit()
+
+    # ------------------------------------------------------------------
+    # Filtros y resultados
+    # ------------------------------------------------------------------
+
+    def _select_rows(self, ids: Optional[List[str]], where: Optional[Dict[str, Any]]) -> List[int]:
+        """Filas que cumplen los IDs y el filtro, en orden de fila (requiere el lock)."""
+        if ids is not None:
+            rows = [self._id_to_row[fragment_id] for fragment_id in dict.fromkeys(ids) if fragment_id in self._id_to_row]
+        else:
+            indexed = self._indexed_candidates(where)
+            rows = sorted(indexed) if indexed is not None else np.flatnonzero(self._alive).tolist()
+        if where:
+            rows = [row for row in rows if matches_where(self._row_metadatas[row], where)]
+        return rows
+
+    def _indexed_candidates(self, where: Optional[Dict[str, Any]]) -> Optional[Set[int]]:
+        """Usa un índice por campo para acotar filtros de igualdad o $in."""
+        if not where:
+            return None
+        clauses = where["$and"] if set(where) == {"$and"} else [where]
+        for clause in clauses:
+            if len(clause) != 1:
+                continue
+            field, condition = next(iter(clause.items()))
+            if field.startswith("$"):
+                continue
+            if isinstance(condition, dict):
+                if set(condition) == {"$eq"}:
+                    values = [condition["$eq"]]
+                elif set(condition) == {"$in"}:
+                    values = list(condition["$in"])
+                else:
+                    continue
+            else:
+                values = [condition]
+            field_index = self._get_field_index(field)
+            candidates: Set[int] = set()
+            for value in values:
+                if isinstance(value, (str, int, float, bool)):
+                    candidates.update(field_index.get(value, ()))
+            return candidates
+        return None
+
+    def _get_field_index(self, field: str) -> Dict[Any, Set[int]]:
+        """Índice valor -> filas de un campo de metadatos, creado en el primer uso."""
+        field_index = self._field_indexes.get(field)
+        if field_index is None:
+            field_index = {}
+            for row in np.flatnonzero(self._alive).tolist():
+                value = self._row_metadatas[row].get(field)
+                if isinstance(value, (str, int, float, bool)):
+                    field_index.setdefault(value, set()).add(row)
+            self._field_indexes[field] = field_index
+        return field_index
+
+    def _index_fields(self, row: int):
+        metadata = self._row_metadatas[row] or {}
+        for field, field_index in self._field_indexes.items():
+            value = metadata.get(field)
+            if isinstance(value, (str, int, float, bool)):
+                field_index.setdefault(value, set()).add(row)
+
+    def _unindex_fields(self, row: int):
+        metadata = self._row_metadatas[row] or {}
+        for field, field_index in self._field_indexes.items():
+            value = metadata.get(field)
+            if isinstance(value, (str, int, float, bool)) and value in field_index:
+                field_index[value].discard(row)
+                if not field_index[value]:
+                    del field_index[value]
+
+    def _build_result(self, rows: List[int], include: List[str]) -> Dict[str, Any]:
+        """Construye un resultado tipo ChromaDB para las filas dadas."""
+        result: Dict[str, Any] = {
+            "ids": [self._row_ids[row] for row in rows],
+            "documents": None,
+            "metadatas": None,
+            "embeddings": None,
+            "include": list(include)
+        }
+        if "documents" in include:
+            documents_by_row = {}
+            for offset in range(0, len(rows), 500):
+                row_slice = rows[offset:offset + 500]
+                placeholders = ",".join("?" * len(row_slice))
+                documents_by_row.update(self._connection.execute(
+                    f"SELECT row, document FROM records WHERE row IN ({placeholders})", row_slice
+                ).fetchall())
+            result["documents"] = [documents_by_row.get(row) for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [dict(self._row_metadatas[row]) for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = np.array(self._vectors[rows], dtype=np.float32) if rows else np.empty((0, self.dimension or 0), dtype=np.float32)
+        return result
+
+
+class LocalVectorClient:
+    def __init__(self, path: str, **collection_options):
+        """
+        Cliente del backend vectorial en proceso (subconjunto de la API de ChromaDB).
+
+        Args:
+            path (str): Directorio raíz donde se guarda cada colección
+            **collection_options: Opciones de LocalVectorCollection (umbral y parámetros HNSW)
+        """
+        self.path = path
+        self.collection_options = collection_options
+        self._collections: Dict[str, LocalVectorCollection] = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> LocalVectorCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = LocalVectorCollection(
+                    name, os.path.join(self.path, name), metadata=metadata, **self.collection_options
+                )
+            return self._collections[name]
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            collection = self._collections.pop(name, None)
+            if collection is not None:
+                collection._connection.close()
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def list_collections(self) -> List[str]:
+        return sorted(entry for entry in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, entry)))
+
+    def heartbeat(self) -> int:
+        return time.time_ns()
+
+    def persist(self):
+        """Vuelca a disco todas las colecciones abiertas."""
+        with self._lock:
+            collections = list(self._collections.values())
+        for collection in collections:
+            collection.persist()
+
+
+class SerializedCollection:
+    # Métodos que modifican la colección y se ejecutan de uno en uno
+    WRITE_METHODS = ("add", "upsert", "update", "delete", "modify")
+
+    def __init__(self, collection, write_lock: threading.RLock):
+        """
+        Envuelve una colección de ChromaDB embebido serializando las escrituras.
+
+        Las lecturas (get, query, count) se delegan sin bloqueo; las escrituras
+        de varios hilos (ingesta en segundo plano, borrados desde la API) comparten
+        un único lock para no competir por el SQLite subyacente.
+
+        Args:
+            collection: Colección de chromadb.PersistentClient
+            write_lock (threading.RLock): Lock compartido por todas las colecciones del cliente
+        """
+        self._collection = collection
+        self._write_lock = write_lock
+
+    def __getattr__(self, attribute: str):
+        value = getattr(self._collection, attribute)
+        if attribute in self.WRITE_METHODS:
+            def serialized(*args, **kwargs):
+                with self._write_lock:
+                    return value(*args, **kwargs)
+            return serialized
+        return value
+
+
+class EmbeddedChromaClient:
+    def __init__(self, path: str):
+        """
+        ChromaDB embebido en el proceso (sin servidor HTTP ni serialización).
+
+        Se crea un único PersistentClient por proceso y ruta; las colecciones que
+        devuelve serializan las escrituras entre hilos.
+
+        Args:
+            path (str): Directorio de datos de ChromaDB
+        """
+        import chromadb
+        from chromadb.config import Settings
+
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._client = chromadb.PersistentClient(
+            path=path,
+            settings=Settings(allow_reset=True, anonymized_telemetry=False)
+        )
+        self._write_lock = threading.RLock()
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> SerializedCollection:
+        collection = self._client.get_or_create_collection(name=name, metadata=metadata)
+        return SerializedCollection(collection, self._write_lock)
+
+    def delete_collection(self, name: str):
+        with self._write_lock:
+            self._client.delete_collection(name)
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._client, attribute)
+
+
+def migrate_collection(source_collection, target_collection, batch_size: int = 1000) -> Dict[str, Any]:
+    """
+    Copia todos los fragmentos (IDs, embeddings, textos y metadatos) entre colecciones.
+
+    Se lee por páginas y se escribe con upsert, por lo que se puede repetir sin
+    duplicar fragmentos si una migración anterior quedó a medias.
+
+    Args:
+        source_collection: Colección de origen (p. ej. la del servidor ChromaDB)
+        target_collection: Colección de destino
+        batch_size (int): Fragmentos por página
+
+    Returns:
+        Dict[str, Any]: Fragmentos copiados, documentos (filename) migrados y duración
+    """
+    started = time.perf_counter()
+    total = source_collection.count()
+    copied = 0
+    filenames = set()
+    for offset in range(0, total, batch_size):
+        page = source_collection.get(
+            limit=batch_size,
+            offset=offset,
+            include=["embeddings", "documents", "metadatas"]
+        )
+        if not page["ids"]:
+            break
+        target_collection.upsert(
+            ids=page["ids"],
+            embeddings=np.asarray(page["embeddings"], dtype=np.float32),
+            documents=page["documents"],
+            metadatas=page["metadatas"]
+        )
+        copied += len(page["ids"])
+        filenames.update((metadata or {}).get("filename") for metadata in page["metadatas"] or [])
+    filenames.discard(None)
+    return {
+        "fragments_copied": copied,
+        "documents": sorted(filenames),
+        "source_count": total,
+        "target_count": target_collection.count(),
+        "duration_seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def create_vector_client(backend: str, db_host: str, db_port: int, local_store_path: str,
+                         chroma_persist_path: str = "data/chroma"):
+    """
+    Crea el cliente del backend vectorial configurado.
+
+    Args:
+        backend (str): "chromadb" (servidor HTTP), "chromadb_embedded" (ChromaDB en
+            el proceso) o "local" (NumPy/HNSW en proceso)
+        db_host (str): Host del servidor ChromaDB
+        db_port (int): Puerto del servidor ChromaDB
+        local_store_path (str): Directorio del backend local
+        chroma_persist_path (str): Directorio de datos de ChromaDB embebido
+
+    Returns:
+        Cliente con get_or_create_collection
+    """
+    if backend == "local":
+        return LocalVectorClient(
+            local_store_path,
+            hnsw_threshold=int(os.getenv("LOCAL_VECTOR_HNSW_THRESHOLD", "50000")),
+            hnsw_m=int(os.getenv("LOCAL_VECTOR_HNSW_M", "16")),
+            hnsw_ef_construction=int(os.getenv("LOCAL_VECTOR_HNSW_EF_CONSTRUCTION", "200")),
+            hnsw_ef_search=int(os.getenv("LOCAL_VECTOR_HNSW_EF_SEARCH", "64"))
+        )
+    if backend == "chromadb_embedded":
+        return EmbeddedChromaClient(chroma_persist_path)
+    if backend == "chromadb":
+        import chromadb
+        from chromadb.config import Settings
+        return chromadb.HttpClient(host=db_host, port=db_port, settings=Settings(allow_reset=True))
+    raise ValueError(f"Backend vectorial desconocido: {backend} (opciones: {', '.join(VECTOR_BACKENDS)})")
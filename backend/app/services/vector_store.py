@@ -1,101 +1,488 @@
 # vector_store.py
-# Gestor de base de datos vectorial con ChromaDB
-import chromadb
-from chromadb.config import Settings
-from typing import List, Dict, Any
-import uuid
+# Gestor de base de datos vectorial (ChromaDB o backend local en proceso)
+import base64
+import json
+import numpy as np
+import os
+import threading
+from bisect import bisect_right
+from collections import deque
+from typing import List, Dict, Any, Optional, Callable
 from datetime import datetime
+from .hashing import hash_text, build_fragment_id
+from .vector_backends import VECTOR_BACKENDS, create_vector_client, migrate_collection
+
+def to_client_embeddings(vectors) -> List[List[float]]:
+    """
+    Convierte vectores float32 al formato del cliente ChromaDB.
+    
+    Es el único punto donde los embeddings dejan de ser arrays NumPy contiguos;
+    el resto del pipeline (modelo, ingesta, recuperación) trabaja con float32.
+    
+    Args:
+        vectors: Matriz (n, dim), vector (dim,) o secuencia de vectores
+        
+    Returns:
+        List[List[float]]: Vectores como listas para el cliente
+    """
+    vector_matrix = np.asarray(vectors, dtype=np.float32)
+    if vector_matrix.ndim == 1:
+        vector_matrix = vector_matrix.reshape(1, -1)
+    return vector_matrix.tolist()
+
+# Campos seleccionables al paginar fragmentos (el ID y fragment_index siempre se incluyen)
+FRAGMENT_FIELDS = ("preview", "content", "metadata", "embedding")
+DEFAULT_FRAGMENT_FIELDS = ("preview", "metadata")
+MAX_FRAGMENT_PAGE_SIZE = 500
+
+# IDs por petición al eliminar fragmentos por lotes
+FRAGMENT_DELETE_BATCH_SIZE = int(os.getenv("FRAGMENT_DELETE_BATCH_SIZE", "1000"))
+
+def encode_fragment_cursor(fragment_index: int, fragment_id: str) -> str:
+    """Cursor opaco con la posición del último fragmento devuelto."""
+    return base64.urlsafe_b64encode(json.dumps([fragment_index, fragment_id]).encode()).decode()
+
+def decode_fragment_cursor(cursor: str):
+    """
+    Decodifica un cursor de paginación de fragmentos.
+    
+    Args:
+        cursor (str): Cursor devuelto en una página anterior
+        
+    Returns:
+        tuple: (fragment_index, fragment_id) del último fragmento devuelto
+    """
+    try:
+        fragment_index, fragment_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(fragment_index), str(fragment_id)
+    except Exception:
+        raise ValueError("Cursor de paginación no válido")
+
+def build_metadata_filter(filenames: Optional[List[str]] = None, document_ids: Optional[List[str]] = None,
+                          page_from: Optional[int] = None, page_to: Optional[int] = None,
+                          uploaded_after: Optional[float] = None,
+                          uploaded_before: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Construye el filtro `where` de ChromaDB para acotar una búsqueda.
+    
+    Un fragmento cumple el rango de páginas si se solapa con él; las fechas se
+    comparan con upload_timestamp (segundos epoch de la ingesta).
+    
+    Args:
+        filenames (List[str]): Documentos por nombre de archivo
+        document_ids (List[str]): Documentos por identificador (document_hash)
+        page_from (int): Primera página del rango
+        page_to (int): Última página del rango
+        uploaded_after (float): Ingeridos desde este instante (epoch)
+        uploaded_before (float): Ingeridos hasta este instante (epoch)
+        
+    Returns:
+        Optional[Dict[str, Any]]: Filtro where o None si no hay condiciones
+    """
+    clauses = []
+    for field, values in (("filename", filenames), ("document_hash", document_ids)):
+        if values:
+            clauses.append({field: values[0]} if len(values) == 1 else {field: {"$in": list(values)}})
+    if page_from is not None:
+        clauses.append({"page_end": {"$gte": int(page_from)}})
+    if page_to is not None:
+        clauses.append({"page_start": {"$lte": int(page_to)}})
+    if uploaded_after is not None:
+        clauses.append({"upload_timestamp": {"$gte": float(uploaded_after)}})
+    if uploaded_before is not None:
+        clauses.append({"upload_timestamp": {"$lte": float(uploaded_before)}})
+    
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
 
 class VectorDatabase:
-    def __init__(self, db_host: str = "chromadb", db_port: int = 8000):
+    def __init__(self, db_host: str = "chromadb", db_port: int = 8000, backend: str = "chromadb",
+                 local_store_path: str = "data/vector_store", chroma_persist_path: str = "data/chroma",
+                 migrate_from_http: bool = False):
         """
-        Inicializa la conexión con la base de datos vectorial.
+        Configura la base de datos vectorial.
+        
+        La conexión se establece de forma perezosa y thread-safe en la primera
+        operación (o durante el warm-up), para no bloquear el arranque de la API.
         
         Args:
             db_host (str): Host del servidor ChromaDB
             db_port (int): Puerto del servidor ChromaDB
+            backend (str): "chromadb" (servidor HTTP), "chromadb_embedded" (ChromaDB
+                en el proceso) o "local" (NumPy/HNSW en proceso)
+            local_store_path (str): Directorio de datos del backend local
+            chroma_persist_path (str): Directorio de datos de ChromaDB embebido
+            migrate_from_http (bool): Copiar la colección del servidor ChromaDB al
+                conectar si el backend en proceso está vacío
         """
-        try:
-            #Agregar retry logic para conexión
-            self.chroma_client = chromadb.HttpClient(
-                host=db_host,
-                port=db_port,
-                settings=Settings(allow_reset=True)
-            )
-            
-            #Usando colección específica para documentos PDF
-            self.document_collection_name = "processed_documents"
-            self.doc_collection = self.chroma_client.get_or_create_collection(
-                name=self.document_collection_name,
-                metadata={"description": "Documentos PDF procesados y vectorizados"}
-            )
-            self.connected = True
-            print(f"✅ Conectado exitosamente a ChromaDB en {db_host}:{db_port}")
-        except Exception as e:
-            self.connected = False
-            self.chroma_client = None
-            self.doc_collection = None
-            print(f"⚠️ No se pudo conectar a ChromaDB: {str(e)}")
-            print("🔄 La conexión se intentará automáticamente en las operaciones")
+        if backend not in VECTOR_BACKENDS:
+            raise ValueError(f"Backend vectorial desconocido: {backend} (opciones: {', '.join(VECTOR_BACKENDS)})")
+        self.db_host = db_host
+        self.db_port = db_port
+        self.backend = backend
+        self.local_store_path = local_store_path
+        self.chroma_persist_path = chroma_persist_path
+        self.migrate_from_http_on_connect = migrate_from_http
+        #Usando colección específica para documentos PDF
+        self.document_collection_name = "processed_documents"
+        self.chroma_client = None
+        self.doc_collection = None
+        self.connected = False
+        self._connection_lock = threading.Lock()
+        # Generación de la colección y versión por documento: aumentan con cada
+        # escritura o borrado hecho a través de esta instancia
+        self.collection_generation = 0
+        self.document_versions: Dict[str, int] = {}
+        self._cleared_at_generation = 0
+        self._recent_changes = deque(maxlen=200)
+        self._change_subscribers: List[Callable[[Dict[str, Any]], None]] = []
+        self._version_lock = threading.Lock()
+        # Orden de lectura por documento: nombre -> (versión del documento, [(fragment_index, id)])
+        self._fragment_order_cache: Dict[str, tuple] = {}
     
-    def ensure_connection(self):
+    def ensure_connection(self) -> bool:
         """Asegura que hay conexión antes de realizar operaciones."""
-        if not self.connected:
+        if self.connected:
+            return True
+        with self._connection_lock:
+            if self.connected:
+                return True
             try:
-                self.chroma_client = chromadb.HttpClient(
-                    host="chromadb",
-                    port=8000,
-                    settings=Settings(allow_reset=True)
+                self.chroma_client = create_vector_client(
+                    self.backend, self.db_host, self.db_port, self.local_store_path, self.chroma_persist_path
                 )
                 
                 self.doc_collection = self.chroma_client.get_or_create_collection(
                     name=self.document_collection_name,
                     metadata={"description": "Documentos PDF procesados y vectorizados"}
                 )
+                if self.backend == "local":
+                    print(f"✅ Backend vectorial local abierto en {self.local_store_path}")
+                elif self.backend == "chromadb_embedded":
+                    print(f"✅ ChromaDB embebido abierto en {self.chroma_persist_path}")
+                else:
+                    print(f"✅ Conectado exitosamente a ChromaDB en {self.db_host}:{self.db_port}")
+                
+                if self.migrate_from_http_on_connect and self.backend != "chromadb" and self.doc_collection.count() == 0:
+                    try:
+                        self._migrate_from_http()
+                    except Exception as e:
+                        # La migración se puede reintentar después con migrate_from_http()
+                        print(f"⚠️ No se pudo migrar desde ChromaDB: {str(e)}")
                 self.connected = True
-                print("✅ Reconectado a ChromaDB exitosamente")
+                return True
             except Exception as e:
-                raise Exception(f"ChromaDB no está disponible: {str(e)}")
+                self.chroma_client = None
+                self.doc_collection = None
+                backend_name = "Backend vectorial local" if self.backend == "local" else "ChromaDB"
+                raise Exception(f"{backend_name} no está disponible: {str(e)}")
     
-    def store_document_chunks(self, text_fragments: List[str], embedding_vectors: List[List[float]], 
-                             chunk_metadata: List[Dict[str, Any]]) -> List[str]:
+    def migrate_from_http(self, source_host: Optional[str] = None, source_port: Optional[int] = None,
+                          batch_size: int = 1000) -> Dict[str, Any]:
         """
-        Almacena fragmentos de documento con sus vectores y metadatos.
+        Copia la colección de un servidor ChromaDB al backend en proceso configurado.
+        
+        Args:
+            source_host (str): Host del servidor de origen (por defecto CHROMADB_HOST)
+            source_port (int): Puerto del servidor de origen (por defecto CHROMADB_PORT)
+            batch_size (int): Fragmentos copiados por lote
+            
+        Returns:
+            Dict[str, Any]: Resultado de la migración
+        """
+        try:
+            if self.backend == "chromadb":
+                return {"success": False, "error": "El backend configurado ya es el servidor ChromaDB"}
+            self.ensure_connection()
+            return self._migrate_from_http(source_host, source_port, batch_size)
+        except Exception as e:
+            return {"success": False, "error": f"Error migrando desde ChromaDB: {str(e)}"}
+    
+    def _migrate_from_http(self, source_host: Optional[str] = None, source_port: Optional[int] = None,
+                           batch_size: int = 1000) -> Dict[str, Any]:
+        """Copia la colección remota en la local y registra el cambio (requiere doc_collection)."""
+        source_client = create_vector_client(
+            "chromadb", source_host or self.db_host, source_port or self.db_port, self.local_store_path
+        )
+        source_collection = source_client.get_or_create_collection(name=self.document_collection_name)
+        print(f"🔄 Migrando colección desde ChromaDB en {source_host or self.db_host}:{source_port or self.db_port}...")
+        migration = migrate_collection(source_collection, self.doc_collection, batch_size=batch_size)
+        
+        # Notificar la llegada de documentos para invalidar cachés dependientes
+        if migration["fragments_copied"]:
+            self._record_change("store", migration["documents"])
+        print(f"✅ Migrados {migration['fragments_copied']} fragmentos en {migration['duration_seconds']}s")
+        return {"success": True, **migration}
+    
+    def close(self):
+        """Vuelca a disco los datos pendientes del backend local (sin efecto con ChromaDB)."""
+        if self.connected and hasattr(self.chroma_client, "persist"):
+            self.chroma_client.persist()
+    
+    def get_collection_generation(self) -> int:
+        """Generación actual de la colección (aumenta con cada modificación)."""
+        return self.collection_generation
+    
+    def get_document_version(self, document_name: str) -> int:
+        """
+        Versión de un documento: generación de su última modificación (0 si no cambió).
+        
+        Args:
+            document_name (str): Nombre del documento
+            
+        Returns:
+            int: Versión del documento
+        """
+        return max(self.document_versions.get(document_name, 0), self._cleared_at_generation)
+    
+    def get_change_feed(self, since_generation: int = 0) -> Dict[str, Any]:
+        """
+        Obtiene la generación actual y los cambios posteriores a una generación dada.
+        
+        Args:
+            since_generation (int): Generación conocida por el llamador
+            
+        Returns:
+            Dict[str, Any]: Generación, versiones por documento y cambios recientes
+        """
+        with self._version_lock:
+            changes = [change for change in self._recent_changes if change["generation"] > since_generation]
+            oldest_retained = self._recent_changes[0]["generation"] if self._recent_changes else self.collection_generation + 1
+            return {
+                "generation": self.collection_generation,
+                "document_versions": dict(self.document_versions),
+                "cleared_at_generation": self._cleared_at_generation,
+                "changes": changes,
+                # Si el llamador está demasiado atrasado, el historial no basta y debe invalidar todo
+                "complete": since_generation >= oldest_retained - 1
+            }
+    
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]) -> Callable[[], None]:
+        """
+        Registra una función que recibe cada cambio de la colección.
+        
+        Args:
+            callback (Callable): Recibe el evento de cambio (generation, operation,
+                documents, fragment_ids)
+            
+        Returns:
+            Callable: Función para cancelar la suscripción
+        """
+        with self._version_lock:
+            self._change_subscribers.append(callback)
+        
+        def unsubscribe():
+            with self._version_lock:
+                if callback in self._change_subscribers:
+                    self._change_subscribers.remove(callback)
+        return unsubscribe
+    
+    def _record_change(self, operation: str, documents: List[str], fragment_ids: Optional[List[str]] = None,
+                       fragments: Optional[Dict[str, List[Any]]] = None):
+        """
+        Aumenta la generación, versiona los documentos afectados y notifica a los suscriptores.
+        
+        Args:
+            operation (str): store, remove_document, delete_fragments o clear
+            documents (List[str]): Documentos afectados
+            fragment_ids (List[str]): IDs de los fragmentos afectados
+            fragments (Dict[str, List]): Textos y metadatos almacenados ("documents",
+                "metadatas"), o metadatos de los eliminados en delete_fragments; solo se
+                entregan a los suscriptores, no al historial de cambios
+        """
+        with self._version_lock:
+            self.collection_generation += 1
+            generation = self.collection_generation
+            if operation == "clear":
+                self._cleared_at_generation = generation
+                documents = sorted(self.document_versions)
+            for document_name in set(documents):
+                self.document_versions[document_name] = generation
+            change = {
+                "generation": generation,
+                "operation": operation,
+                "documents": sorted(set(documents)),
+                "fragment_ids": list(fragment_ids or []),
+                "timestamp": datetime.now().isoformat()
+            }
+            self._recent_changes.append(change)
+            subscribers = list(self._change_subscribers)
+        
+        notification = {**change, "fragments": fragments} if fragments is not None else change
+        for callback in subscribers:
+            try:
+                callback(notification)
+            except Exception as e:
+                print(f"⚠️ Error notificando cambio de colección: {str(e)}")
+    
+    def is_available(self) -> bool:
+        """Intenta conectar si hace falta y devuelve si ChromaDB está disponible."""
+        try:
+            return self.ensure_connection()
+        except Exception as e:
+            print(f"⚠️ No se pudo conectar a ChromaDB: {str(e)}")
+            return False
+    
+    def store_document_chunks(self, text_fragments: List[str], embedding_vectors: np.ndarray, 
+                             chunk_metadata: List[Dict[str, Any]],
+                             chunk_ids: Optional[List[str]] = None) -> List[str]:
+        """
+        Almacena (upsert) fragmentos de documento con sus vectores y metadatos.
         
         Args:
             text_fragments (List[str]): Fragmentos de texto del documento
-            embedding_vectors (List[List[float]]): Vectores embedding correspondientes
+            embedding_vectors (np.ndarray): Matriz float32 (n, dim) de embeddings correspondientes
             chunk_metadata (List[Dict[str, Any]]): Metadatos de cada fragmento
+            chunk_ids (List[str]): Identificadores deterministas; si se omiten se derivan
+                del nombre del documento, el contenido y la posición de cada fragmento
             
         Returns:
-            List[str]: Identificadores únicos generados
+            List[str]: Identificadores de los fragmentos almacenados
         """
         try:
             # Asegurar conexión antes de la operación
             self.ensure_connection()
             
-            #Generación de IDs únicos para cada fragmento
-            chunk_ids = [str(uuid.uuid4()) for _ in text_fragments]
+            #IDs derivados del contenido: re-ingerir el mismo texto sobrescribe en lugar de duplicar
+            if chunk_ids is None:
+                chunk_ids = [
+                    build_fragment_id(
+                        metadata.get("filename", ""),
+                        metadata.get("chunk_hash") or hash_text(fragment),
+                        metadata.get("fragment_index", 0)
+                    )
+                    for fragment, metadata in zip(text_fragments, chunk_metadata)
+                ]
             
             # Almacenar en la colección vectorial
-            self.doc_collection.add(
+            self.doc_collection.upsert(
                 documents=text_fragments,
-                embeddings=embedding_vectors,
+                embeddings=to_client_embeddings(embedding_vectors),
                 metadatas=chunk_metadata,
                 ids=chunk_ids
             )
+            self._record_change(
+                "store",
+                [metadata.get("filename", "") for metadata in chunk_metadata],
+                chunk_ids,
+                fragments={"documents": text_fragments, "metadatas": chunk_metadata}
+            )
             
             return chunk_ids
         except Exception as e:
             raise Exception(f"Error almacenando en base vectorial: {str(e)}")
     
-    def find_similar_content(self, query_vector: List[float], max_results: int = 5) -> Dict[str, Any]:
+    def get_embeddings_by_chunk_hashes(self, chunk_hashes: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Recupera embeddings ya almacenados para fragmentos con contenido idéntico.
+        
+        Args:
+            chunk_hashes (List[str]): Hashes de contenido de los fragmentos
+            
+        Returns:
+            Dict[str, np.ndarray]: Embedding float32 almacenado por hash de fragmento
+        """
+        if not chunk_hashes:
+            return {}
+        try:
+            self.ensure_connection()
+            
+            stored_chunks = self.doc_collection.get(
+                where={"chunk_hash": {"$in": list(set(chunk_hashes))}},
+                include=["embeddings", "metadatas"]
+            )
+            
+            embeddings_by_hash = {}
+            stored_embeddings = stored_chunks.get("embeddings")
+            if stored_embeddings is None:
+                return embeddings_by_hash
+            for metadata, embedding in zip(stored_chunks.get("metadatas") or [], stored_embeddings):
+                chunk_hash = (metadata or {}).get("chunk_hash")
+                if chunk_hash and chunk_hash not in embeddings_by_hash:
+                    embeddings_by_hash[chunk_hash] = np.asarray(embedding, dtype=np.float32)
+            return embeddings_by_hash
+        except Exception as e:
+            raise Exception(f"Error recuperando embeddings existentes: {str(e)}")
+    
+    def get_embeddings_by_ids(self, fragment_ids: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Recupera los embeddings almacenados de fragmentos concretos.
+        
+        Args:
+            fragment_ids (List[str]): IDs de los fragmentos
+            
+        Returns:
+            Dict[str, np.ndarray]: Embedding float32 por ID (solo los que existen)
+        """
+        if not fragment_ids:
+            return {}
+        try:
+            self.ensure_connection()
+            
+            stored_chunks = self.doc_collection.get(ids=list(fragment_ids), include=["embeddings"])
+            stored_embeddings = stored_chunks.get("embeddings")
+            if stored_embeddings is None:
+                return {}
+            return {
+                fragment_id: np.asarray(embedding, dtype=np.float32)
+                for fragment_id, embedding in zip(stored_chunks["ids"], stored_embeddings)
+            }
+        except Exception as e:
+            raise Exception(f"Error recuperando embeddings de fragmentos: {str(e)}")
+    
+    def get_document_fragment_ids(self, document_name: str) -> List[str]:
+        """
+        Obtiene solo los IDs de los fragmentos de un documento (sin contenido ni vectores).
+        
+        Args:
+            document_name (str): Nombre del documento
+            
+        Returns:
+            List[str]: IDs de los fragmentos almacenados
+        """
+        try:
+            self.ensure_connection()
+            
+            document_chunks = self.doc_collection.get(where={"filename": document_name}, include=[])
+            return document_chunks["ids"]
+        except Exception as e:
+            raise Exception(f"Error obteniendo IDs del documento: {str(e)}")
+    
+    def iter_fragment_pages(self, batch_size: int = 1000, include: Optional[List[str]] = None):
+        """
+        Recorre todos los fragmentos de la colección por páginas.
+        
+        Args:
+            batch_size (int): Fragmentos por página
+            include (List[str]): Campos a incluir (por defecto textos y metadatos)
+            
+        Yields:
+            Dict[str, Any]: Página con ids y los campos solicitados
+        """
+        self.ensure_connection()
+        include = include or ["documents", "metadatas"]
+        offset = 0
+        while True:
+            page = self.doc_collection.get(limit=batch_size, offset=offset, include=include)
+            if not page["ids"]:
+                return
+            yield page
+            offset += len(page["ids"])
+    
+    def find_similar_content(self, query_vector: np.ndarray, max_results: int = 5,
+                             where: Optional[Dict[str, Any]] = None,
+                             include_embeddings: bool = False) -> Dict[str, Any]:
         """
         Busca contenido similar usando búsqueda vectorial.
         
         Args:
-            query_vector (List[float]): Vector de consulta
+            query_vector (np.ndarray): Vector float32 de consulta
             max_results (int): Número máximo de resultados
+            where (Dict[str, Any]): Filtro de metadatos aplicado dentro de la consulta
+                (ver build_metadata_filter), de modo que el top-k sale solo de los
+                fragmentos que lo cumplen
+            include_embeddings (bool): Devolver también los vectores de los resultados
             
         Returns:
             Dict[str, Any]: Resultados de similitud
@@ -104,9 +491,14 @@ class VectorDatabase:
             # Asegurar conexión antes de la operación
             self.ensure_connection()
             
+            include = ["documents", "metadatas", "distances"]
+            if include_embeddings:
+                include.append("embeddings")
             similarity_results = self.doc_collection.query(
-                query_embeddings=[query_vector],
-                n_results=max_results
+                query_embeddings=to_client_embeddings(query_vector),
+                n_results=max_results,
+                where=where,
+                include=include
             )
             return similarity_results
         except Exception as e:
@@ -120,21 +512,26 @@ class VectorDatabase:
             Dict[str, Any]: Estado de la base de datos
         """
         try:
-            if not self.connected:
+            if not self.is_available():
                 return {
                     "connected": False,
+                    "backend": self.backend,
                     "collection_name": self.document_collection_name,
                     "total_chunks": 0,
                     "error": "No conectado a ChromaDB"
                 }
             
             total_documents = self.doc_collection.count()
-            return {
+            status = {
                 "connected": True,
+                "backend": self.backend,
                 "collection_name": self.document_collection_name,
                 "total_chunks": total_documents,
                 "collection_metadata": self.doc_collection.metadata
             }
+            if hasattr(self.doc_collection, "get_backend_info"):
+                status["backend_info"] = self.doc_collection.get_backend_info()
+            return status
         except Exception as e:
             return {
                 "connected": False,
@@ -154,6 +551,9 @@ class VectorDatabase:
         """
         Elimina todos los fragmentos de un documento específico.
         
+        El borrado se resuelve en el servidor con un filtro `where`; antes solo se
+        leen los IDs (sin textos, metadatos ni vectores) para el evento de cambio.
+        
         Args:
             document_name (str): Nombre del documento a eliminar
             
@@ -161,32 +561,42 @@ class VectorDatabase:
             bool: True si se eliminaron fragmentos
         """
         try:
-            # Buscar fragmentos por nombre de documento
-            document_chunks = self.doc_collection.get(
-                where={"filename": document_name}
-            )
+            self.ensure_connection()
             
-            if document_chunks["ids"]:
-                self.doc_collection.delete(ids=document_chunks["ids"])
-                return True
-            return False
+            fragment_ids = self.get_document_fragment_ids(document_name)
+            if not fragment_ids:
+                return False
+            self.doc_collection.delete(where={"filename": document_name})
+            self._record_change("remove_document", [document_name], fragment_ids)
+            return True
         except Exception as e:
             raise Exception(f"Error eliminando documento: {str(e)}")
     
+    def _reset_collection(self):
+        """Elimina la colección y la vuelve a crear vacía (sin leer sus fragmentos)."""
+        with self._connection_lock:
+            self.chroma_client.delete_collection(self.document_collection_name)
+            self.doc_collection = self.chroma_client.get_or_create_collection(
+                name=self.document_collection_name,
+                metadata={"description": "Documentos PDF procesados y vectorizados"}
+            )
+    
     def clear_all_documents(self) -> Dict[str, Any]:
         """
         Elimina todos los documentos de la base de datos.
         
+        La colección se elimina y se vuelve a crear, de modo que el coste no
+        depende del número de fragmentos. Si el servidor no permite eliminarla,
+        se borran los fragmentos por lotes de IDs.
+        
         Returns:
             Dict[str, Any]: Resultado de la operación
         """
         try:
-            if not self.connected:
+            if not self.is_available():
                 return {"success": False, "error": "No conectado a la base de datos"}
             
-            # Obtener estadísticas antes de eliminar
-            status_before = self.get_database_status()
-            total_before = status_before.get("total_chunks", 0)
+            total_before = self.doc_collection.count()
             
             if total_before == 0:
                 return {
@@ -196,23 +606,29 @@ class VectorDatabase:
                     "fragments_deleted": 0
                 }
             
-            # Obtener todos los IDs
-            all_data = self.doc_collection.get()
-            all_ids = all_data.get("ids", [])
-            
-            if all_ids:
-                # Eliminar todos los documentos
-                self.doc_collection.delete(ids=all_ids)
-            
-            # Verificar que se eliminaron
-            status_after = self.get_database_status()
-            total_after = status_after.get("total_chunks", 0)
+            try:
+                self._reset_collection()
+                method = "drop_and_recreate"
+            except Exception as e:
+                print(f"⚠️ No se pudo recrear la colección ({str(e)}), borrando por lotes")
+                self.doc_collection = self.chroma_client.get_or_create_collection(
+                    name=self.document_collection_name,
+                    metadata={"description": "Documentos PDF procesados y vectorizados"}
+                )
+                while True:
+                    batch = self.doc_collection.get(limit=FRAGMENT_DELETE_BATCH_SIZE, include=[])
+                    if not batch["ids"]:
+                        break
+                    self.doc_collection.delete(ids=batch["ids"])
+                method = "batched"
+            self._record_change("clear", [])
             
             return {
                 "success": True,
                 "message": f"Base de datos limpiada exitosamente",
                 "documents_deleted": "all",
-                "fragments_deleted": total_before - total_after
+                "fragments_deleted": total_before - self.doc_collection.count(),
+                "method": method
             }
             
         except Exception as e:
@@ -221,6 +637,49 @@ class VectorDatabase:
                 "error": f"Error limpiando base de datos: {str(e)}"
             }
     
+    def delete_fragments_in_batches(self, fragment_ids: List[str], batch_size: int = None,
+                                    progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """
+        Elimina fragmentos por IDs en lotes acotados.
+        
+        Cada lote lee solo los metadatos de sus IDs (para saber a qué documentos
+        afecta), los elimina y emite su evento de cambio, así que la memoria y el
+        tamaño de cada petición no dependen del total.
+        
+        Args:
+            fragment_ids (List[str]): IDs a eliminar
+            batch_size (int): IDs por lote (por defecto FRAGMENT_DELETE_BATCH_SIZE)
+            progress_callback (Callable): Recibe (IDs procesados, fragmentos eliminados) tras cada lote
+            
+        Returns:
+            Dict[str, Any]: Fragmentos eliminados e IDs que existían
+        """
+        self.ensure_connection()
+        batch_size = batch_size or FRAGMENT_DELETE_BATCH_SIZE
+        unique_ids = list(dict.fromkeys(fragment_ids))
+        deleted_ids: List[str] = []
+        for start in range(0, len(unique_ids), batch_size):
+            batch = unique_ids[start:start + batch_size]
+            existing_data = self.doc_collection.get(ids=batch, include=["metadatas"])
+            existing_ids = existing_data.get("ids", [])
+            if existing_ids:
+                self.doc_collection.delete(ids=existing_ids)
+                existing_metadatas = existing_data.get("metadatas") or []
+                self._record_change(
+                    "delete_fragments",
+                    [(metadata or {}).get("filename", "") for metadata in existing_metadatas],
+                    existing_ids,
+                    fragments={"metadatas": existing_metadatas}
+                )
+                deleted_ids.extend(existing_ids)
+            if progress_callback:
+                progress_callback(start + len(batch), len(deleted_ids))
+        return {
+            "requested": len(unique_ids),
+            "fragments_deleted": len(deleted_ids),
+            "ids_deleted": deleted_ids
+        }
+    
     def delete_fragments_by_ids(self, fragment_ids: List[str]) -> Dict[str, Any]:
         """
         Elimina fragmentos específicos por sus IDs.
@@ -232,30 +691,25 @@ class VectorDatabase:
             Dict[str, Any]: Resultado de la operación
         """
         try:
-            if not self.connected:
+            if not self.is_available():
                 return {"success": False, "error": "No conectado a la base de datos"}
             
             if not fragment_ids:
                 return {"success": False, "error": "No se proporcionaron IDs para eliminar"}
             
-            # Verificar que existen los IDs
-            existing_data = self.doc_collection.get(ids=fragment_ids)
-            existing_ids = existing_data.get("ids", [])
+            result = self.delete_fragments_in_batches(fragment_ids)
             
-            if not existing_ids:
+            if not result["fragments_deleted"]:
                 return {
                     "success": False,
                     "error": "Ninguno de los IDs proporcionados existe"
                 }
             
-            # Eliminar los fragmentos
-            self.doc_collection.delete(ids=existing_ids)
-            
             return {
                 "success": True,
-                "message": f"Eliminados {len(existing_ids)} fragmentos",
-                "fragments_deleted": len(existing_ids),
-                "ids_deleted": existing_ids
+                "message": f"Eliminados {result['fragments_deleted']} fragmentos",
+                "fragments_deleted": result["fragments_deleted"],
+                "ids_deleted": result["ids_deleted"]
             }
             
         except Exception as e:
@@ -264,49 +718,108 @@ class VectorDatabase:
                 "error": f"Error eliminando fragmentos: {str(e)}"
             }
     
-    def get_document_fragments_info(self, document_name: str) -> Dict[str, Any]:
+    def _get_fragment_order(self, document_name: str) -> List[tuple]:
+        """
+        Claves (fragment_index, id) de un documento en orden de lectura.
+        
+        Se calculan con una lectura de solo metadatos y se reutilizan mientras la
+        versión del documento no cambie, de modo que cada página cuesta una lectura
+        por IDs en lugar de recorrer el documento entero.
+        """
+        version = self.get_document_version(document_name)
+        cached = self._fragment_order_cache.get(document_name)
+        if cached and cached[0] == version:
+            return cached[1]
+        
+        document_chunks = self.doc_collection.get(where={"filename": document_name}, include=["metadatas"])
+        order = sorted(
+            ((metadata or {}).get("fragment_index", 0), fragment_id)
+            for fragment_id, metadata in zip(document_chunks["ids"], document_chunks["metadatas"])
+        )
+        if len(self._fragment_order_cache) >= 32:
+            self._fragment_order_cache.pop(next(iter(self._fragment_order_cache)))
+        self._fragment_order_cache[document_name] = (version, order)
+        return order
+
+    def get_document_fragments_info(self, document_name: str, limit: int = 50, cursor: Optional[str] = None,
+                                    fields: Optional[List[str]] = None) -> Dict[str, Any]:
         """
-        Obtiene información detallada de fragmentos de un documento específico.
+        Obtiene una página de fragmentos de un documento, ordenados por fragment_index.
         
         Args:
             document_name (str): Nombre del documento
+            limit (int): Fragmentos por página (máximo MAX_FRAGMENT_PAGE_SIZE)
+            cursor (str): Cursor opaco devuelto en la página anterior (None = inicio)
+            fields (List[str]): Campos a incluir: preview, content, metadata, embedding
+                (por defecto preview y metadata; el ID siempre se incluye)
             
         Returns:
-            Dict[str, Any]: Información de fragmentos del documento
+            Dict[str, Any]: Fragmentos de la página, total del documento y next_cursor
+                (None en la última página)
         """
+        fields = list(DEFAULT_FRAGMENT_FIELDS if fields is None else fields)
+        unknown_fields = [field for field in fields if field not in FRAGMENT_FIELDS]
+        if unknown_fields:
+            raise ValueError(f"Campos no válidos: {', '.join(unknown_fields)} (opciones: {', '.join(FRAGMENT_FIELDS)})")
+        limit = max(1, min(int(limit), MAX_FRAGMENT_PAGE_SIZE))
+        after = decode_fragment_cursor(cursor) if cursor else None
+        
         try:
-            if not self.connected:
+            if not self.is_available():
                 return {"success": False, "error": "No conectado a la base de datos"}
             
-            # Buscar fragmentos por nombre de documento
-            document_chunks = self.doc_collection.get(
-                where={"filename": document_name},
-                include=["documents", "metadatas"]
-            )
-            
-            if not document_chunks["ids"]:
+            order = self._get_fragment_order(document_name)
+            if not order:
                 return {
                     "success": False,
                     "error": f"No se encontraron fragmentos para el documento '{document_name}'"
                 }
             
-            fragments_info = []
-            for i, fragment_id in enumerate(document_chunks["ids"]):
-                content = document_chunks.get("documents", [""])[i] if i < len(document_chunks.get("documents", [])) else ""
-                metadata = document_chunks.get("metadatas", [{}])[i] if i < len(document_chunks.get("metadatas", [])) else {}
-                
-                fragments_info.append({
-                    "id": fragment_id,
-                    "content_preview": content[:100] + "..." if len(content) > 100 else content,
-                    "content_length": len(content),
-                    "metadata": metadata
-                })
+            # Posición por clave, no por desplazamiento: estable aunque se borren fragmentos entre páginas
+            start = bisect_right(order, after) if after else 0
+            page_keys = order[start:start + limit]
+            
+            include = []
+            if "preview" in fields or "content" in fields:
+                include.append("documents")
+            if "metadata" in fields:
+                include.append("metadatas")
+            if "embedding" in fields:
+                include.append("embeddings")
+            records: Dict[str, Dict[str, Any]] = {}
+            if include and page_keys:
+                page = self.doc_collection.get(ids=[fragment_id for _, fragment_id in page_keys], include=include)
+                for position, fragment_id in enumerate(page["ids"]):
+                    records[fragment_id] = {field: page[field][position] for field in include}
             
+            fragments_info = []
+            for fragment_index, fragment_id in page_keys:
+                record = records.get(fragment_id, {})
+                fragment = {"id": fragment_id, "fragment_index": fragment_index}
+                content = record.get("documents") or ""
+                if "preview" in fields:
+                    fragment["content_preview"] = content[:100] + "..." if len(content) > 100 else content
+                if "content" in fields:
+                    fragment["content"] = content
+                if "preview" in fields or "content" in fields:
+                    fragment["content_length"] = len(content)
+                if "metadata" in fields:
+                    fragment["metadata"] = record.get("metadatas") or {}
+                if "embedding" in fields:
+                    embedding = record.get("embeddings")
+                    fragment["embedding"] = np.asarray(embedding, dtype=np.float32).tolist() if embedding is not None else None
+                fragments_info.append(fragment)
+            
+            has_more = start + len(page_keys) < len(order)
             return {
                 "success": True,
                 "document_name": document_name,
-                "total_fragments": len(fragments_info),
-                "fragments": fragments_info
+                "total_fragments": len(order),
+                "returned_fragments": len(fragments_info),
+                "fields": fields,
+                "limit": limit,
+                "fragments": fragments_info,
+                "next_cursor": encode_fragment_cursor(*page_keys[-1]) if has_more else None
             }
             
         except Exception as e:
@@ -326,7 +839,7 @@ class VectorDatabase:
             List[Dict[str, Any]]: Lista de documentos con contenido y metadatos
         """
         try:
-            if not self.connected:
+            if not self.is_available():
                 return []
             
             # Obtener documentos de la colección
@@ -351,36 +864,13 @@ class VectorDatabase:
         except Exception as e:
             print(f"⚠️ Error obteniendo muestra de documentos: {str(e)}")
             return []
-    
-    def get_unique_documents_metadata(self) -> List[Dict[str, Any]]:
-        """
-        Obtiene metadatos únicos de documentos (sin duplicar por fragmentos).
-        
-        Returns:
-            List[Dict[str, Any]]: Lista de metadatos únicos de documentos
-        """
-        try:
-            if not self.ensure_connection():
-                return []
-            
-            # Obtener todos los metadatos
-            results = self.doc_collection.get(include=["metadatas"])
-            
-            if not results or not results.get("metadatas"):
-                return []
-            
-            # Extraer documentos únicos por filename
-            unique_docs = {}
-            for metadata in results["metadatas"]:
-                filename = metadata.get("filename", "unknown")
-                if filename not in unique_docs:
-                    unique_docs[filename] = metadata
-            
-            return list(unique_docs.values())
-            
-        except Exception as e:
-            print(f"⚠️ Error obteniendo metadatos únicos: {str(e)}")
-            return []
 
-# Instancia global de la base de datos vectorial
-vector_db = VectorDatabase()
+# Instancia global de la base de datos vectorial (conexión perezosa)
+vector_db = VectorDatabase(
+    db_host=os.getenv("CHROMADB_HOST", "chromadb"),
+    db_port=int(os.getenv("CHROMADB_PORT", "8000")),
+    backend=os.getenv("VECTOR_BACKEND", "chromadb").lower(),
+    local_store_path=os.getenv("LOCAL_VECTOR_STORE_PATH", "data/vector_store"),
+    chroma_persist_path=os.getenv("CHROMADB_PERSIST_PATH", "data/chroma"),
+    migrate_from_http=os.getenv("VECTOR_MIGRATE_FROM_HTTP", "false").lower() == "true"
+)
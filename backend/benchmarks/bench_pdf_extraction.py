@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de extracción de texto PDF: ruta serial vs pool de procesos.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_pdf_extraction --pages 600 --repeat 3
+    python -m benchmarks.bench_pdf_extraction --pdf ruta/al/documento.pdf
+    python -m benchmarks.bench_pdf_extraction --sweep 16,32,64,128,256,512
+
+Si la selección automática elige extracción serial (una CPU o menos de
+PDF_PARALLEL_MIN_PAGES páginas), la variante paralela se fuerza con 2 procesos:
+con una sola CPU ese resultado mide solo el coste añadido del pool.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+from app.services.pdf_processing import (
+    available_cpu_count,
+    choose_extraction_workers,
+    extract_content_by_pages,
+    extract_pages_parallel,
+    get_extraction_pool,
+    shutdown_extraction_pool,
+)
+
+
+def build_synthetic_pdf(page_count: int, lines_per_page: int = 60) -> str:
+    """Genera un PDF temporal con texto denso en cada página."""
+    pdf_document = fitz.open()
+    line = "Copiloto conversacional benchmark de extracción de texto página {page} línea {line}"
+    for page_number in range(page_count):
+        page = pdf_document.new_page()
+        text = "\n".join(line.format(page=page_number, line=i) for i in range(lines_per_page))
+        page.insert_text((36, 36), text, fontsize=7)
+    handle, pdf_path = tempfile.mkstemp(suffix=".pdf")
+    os.close(handle)
+    pdf_document.save(pdf_path)
+    pdf_document.close()
+    return pdf_path
+
+
+def time_extraction(label: str, extract, page_count: int, repeat: int) -> float:
+    """Ejecuta una función de extracción varias veces y reporta el mejor pages/sec."""
+    best_seconds = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        pages = extract()
+        best_seconds = min(best_seconds, time.perf_counter() - started)
+        assert len(pages) == page_count
+    pages_per_second = page_count / best_seconds
+    print(f"{label:<28} {best_seconds:8.3f} s   {pages_per_second:10.1f} pages/sec")
+    return pages_per_second
+
+
+def benchmark_pdf(pdf_path: str, repeat: int, workers: int = None):
+    """Compara la extracción serial y la paralela de un PDF."""
+    pdf_document = fitz.open(pdf_path)
+    page_count = len(pdf_document)
+    pdf_document.close()
+    auto_workers = choose_extraction_workers(page_count)
+    workers = workers or max(auto_workers, 2)
+
+    print(f"PDF: {pdf_path} ({page_count} páginas, {available_cpu_count()} CPUs, "
+          f"automático: {'serial' if auto_workers <= 1 else f'{auto_workers} workers'})")
+    serial = time_extraction("serial", lambda: extract_content_by_pages(pdf_path), page_count, repeat)
+    parallel = time_extraction(
+        f"parallel ({workers} workers)",
+        lambda: extract_pages_parallel(pdf_path, max_workers=workers),
+        page_count,
+        repeat,
+    )
+    print(f"speedup: {parallel / serial:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", help="PDF a medir (por defecto se genera uno sintético)")
+    parser.add_argument("--pages", type=int, default=400, help="Páginas del PDF sintético")
+    parser.add_argument("--sweep", help="Lista de tamaños sintéticos a medir (p. ej. 16,64,256)")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por variante")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos (automático por defecto)")
+    args = parser.parse_args()
+
+    # El pool es de larga duración en la API: su arranque no entra en la medida
+    get_extraction_pool().submit(int).result()
+    try:
+        if args.pdf:
+            benchmark_pdf(args.pdf, args.repeat, args.workers)
+            return
+        page_counts = [int(pages) for pages in args.sweep.split(",")] if args.sweep else [args.pages]
+        for page_count in page_counts:
+            pdf_path = build_synthetic_pdf(page_count)
+            try:
+                benchmark_pdf(pdf_path, args.repeat, args.workers)
+            finally:
+                os.unlink(pdf_path)
+    finally:
+        shutdown_extraction_pool()
+
+
+if __name__ == "__main__":
+    main()
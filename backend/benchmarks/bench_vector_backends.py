@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de backends vectoriales: ChromaDB vs backend local (exacto y HNSW).
+
+Mide la latencia por consulta (p50/p95) sobre vectores normalizados agrupados por tema
+y el recall@k del índice HNSW respecto a la búsqueda exacta.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_vector_backends --vectors 100000 --queries 200
+    python -m benchmarks.bench_vector_backends --chroma-host localhost --chroma-port 8001
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.vector_backends import HNSW_AVAILABLE, LocalVectorClient
+
+BATCH_SIZE = 5000
+
+
+def build_vectors(count: int, dimension: int, rng: np.random.Generator, centers: np.ndarray) -> np.ndarray:
+    """
+    Genera vectores float32 normalizados agrupados alrededor de centros.
+
+    Los embeddings reales de documentos forman grupos por tema; vectores
+    uniformes serían el peor caso posible para un índice aproximado.
+    """
+    assignments = rng.integers(0, len(centers), size=count)
+    vectors = centers[assignments] + 0.5 / np.sqrt(dimension) * rng.standard_normal((count, dimension), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def load_collection(collection, vectors: np.ndarray, to_list: bool) -> float:
+    """Inserta los vectores por lotes y devuelve los segundos empleados."""
+    started = time.perf_counter()
+    for start in range(0, len(vectors), BATCH_SIZE):
+        batch = vectors[start:start + BATCH_SIZE]
+        collection.upsert(
+            ids=[f"v{i}" for i in range(start, start + len(batch))],
+            embeddings=batch.tolist() if to_list else batch,
+            documents=[f"fragmento {i}" for i in range(start, start + len(batch))],
+            metadatas=[{"filename": f"doc{i % 50}.pdf"} for i in range(start, start + len(batch))],
+        )
+    return time.perf_counter() - started
+
+
+def time_queries(label: str, collection, queries: np.ndarray, top_k: int, to_list: bool):
+    """Ejecuta las consultas una a una e imprime p50/p95; devuelve los IDs obtenidos."""
+    latencies = []
+    results = []
+    for query in queries:
+        started = time.perf_counter()
+        response = collection.query(
+            query_embeddings=[query.tolist()] if to_list else query.reshape(1, -1),
+            n_results=top_k,
+            include=["metadatas", "distances"],
+        )
+        latencies.append(time.perf_counter() - started)
+        results.append(response["ids"][0])
+    p50, p95 = np.percentile(np.array(latencies) * 1000, [50, 95])
+    print(f"{label:<28} p50 {p50:8.2f} ms   p95 {p95:8.2f} ms   {len(queries) / sum(latencies):8.1f} q/s")
+    return results
+
+
+def recall_at_k(results, reference) -> float:
+    """Fracción de los IDs exactos recuperados por la variante aproximada."""
+    hits = sum(len(set(found) & set(expected)) for found, expected in zip(results, reference))
+    return hits / sum(len(expected) for expected in reference)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50000, help="Vectores en la colección")
+    parser.add_argument("--dimension", type=int, default=384, help="Dimensión de los vectores")
+    parser.add_argument("--queries", type=int, default=200, help="Consultas a medir")
+    parser.add_argument("--top-k", type=int, default=5, help="Resultados por consulta")
+    parser.add_argument("--clusters", type=int, default=200, help="Grupos temáticos de los vectores")
+    parser.add_argument("--ef-search", type=int, default=64, help="Amplitud de búsqueda HNSW")
+    parser.add_argument("--chroma-host", help="Servidor ChromaDB (por defecto cliente efímero en proceso)")
+    parser.add_argument("--chroma-port", type=int, default=8000, help="Puerto del servidor ChromaDB")
+    parser.add_argument("--skip-chroma", action="store_true", help="Medir solo el backend local")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centers = rng.standard_normal((args.clusters, args.dimension), dtype=np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    vectors = build_vectors(args.vectors, args.dimension, rng, centers)
+    queries = build_vectors(args.queries, args.dimension, rng, centers)
+    store_path = tempfile.mkdtemp(prefix="bench_vectors_")
+    print(f"{args.vectors} vectores x {args.dimension} dims, {args.queries} consultas, top-{args.top_k}")
+
+    try:
+        exact_collection = LocalVectorClient(store_path, hnsw_threshold=args.vectors + 1) \
+            .get_or_create_collection("exact")
+        seconds = load_collection(exact_collection, vectors, to_list=False)
+        print(f"{'carga local':<28} {seconds:8.2f} s")
+        reference = time_queries("local exacto (NumPy)", exact_collection, queries, args.top_k, to_list=False)
+
+        if HNSW_AVAILABLE:
+            hnsw_collection = LocalVectorClient(store_path, hnsw_threshold=1, hnsw_ef_search=args.ef_search) \
+                .get_or_create_collection("hnsw")
+            seconds = load_collection(hnsw_collection, vectors, to_list=False)
+            print(f"{'carga local + HNSW':<28} {seconds:8.2f} s")
+            results = time_queries("local HNSW", hnsw_collection, queries, args.top_k, to_list=False)
+            print(f"{'recall@' + str(args.top_k) + ' HNSW':<28} {recall_at_k(results, reference):8.4f}")
+        else:
+            print("hnswlib no instalado: se omite la variante HNSW")
+
+        if not args.skip_chroma:
+            import chromadb
+
+            if args.chroma_host:
+                chroma_client = chromadb.HttpClient(host=args.chroma_host, port=args.chroma_port)
+            else:
+                chroma_client = chromadb.EphemeralClient()
+            try:
+                chroma_client.delete_collection("bench_vectors")
+            except Exception:
+                pass
+            chroma_collection = chroma_client.get_or_create_collection("bench_vectors")
+            seconds = load_collection(chroma_collection, vectors, to_list=True)
+            print(f"{'carga ChromaDB':<28} {seconds:8.2f} s")
+            results = time_queries("ChromaDB", chroma_collection, queries, args.top_k, to_list=True)
+            print(f"{'recall@' + str(args.top_k) + ' ChromaDB':<28} {recall_at_k(results, reference):8.4f}")
+            chroma_client.delete_collection("bench_vectors")
+    finally:
+        shutil.rmtree(store_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
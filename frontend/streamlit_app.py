@@ -16,6 +16,8 @@ Contacto: https://github.com/Cristian-Soto
 import streamlit as st
 import requests
 import json
+import time
+import uuid
 from typing import Optional
 
 # Configuración de página - DEBE ser lo primero
@@ -344,6 +346,8 @@ st.markdown("""
 
 # Configuración de la API
 API_BASE_URL = "http://backend:8000"
+UPLOAD_JOB_POLL_INTERVAL = 1.0  # segundos entre consultas del trabajo de ingesta
+UPLOAD_JOB_TIMEOUT = 600  # segundos máximos de espera por documento
 
 def send_document_to_api(uploaded_file) -> Optional[dict]:
     """
@@ -359,11 +363,32 @@ def send_document_to_api(uploaded_file) -> Optional[dict]:
         files = {"uploaded_file": (uploaded_file.name, uploaded_file, "application/pdf")}
         response = requests.post(f"{API_BASE_URL}/upload", files=files)
         
-        if response.status_code == 200:
-            return response.json()
-        else:
+        if response.status_code not in (200, 202):
             st.error(f"Error del servidor: {response.status_code}")
             return None
+        
+        # La ingesta se ejecuta en segundo plano: consultar el trabajo hasta que termine
+        job_id = response.json().get("job_id")
+        deadline = time.time() + UPLOAD_JOB_TIMEOUT
+        while time.time() < deadline:
+            job_response = requests.get(f"{API_BASE_URL}/upload/jobs/{job_id}", timeout=5)
+            if job_response.status_code != 200:
+                st.error(f"Error consultando el trabajo de ingesta: {job_response.status_code}")
+                return None
+            
+            job = job_response.json()
+            if job.get("status") == "completed":
+                result = job.get("result") or {}
+                if result.get("unchanged"):
+                    st.info("ℹ️ Este documento ya estaba cargado sin cambios; no se volvió a procesar.")
+                return result
+            if job.get("status") == "failed":
+                st.error(job.get("error", "Error procesando documento"))
+                return None
+            time.sleep(UPLOAD_JOB_POLL_INTERVAL)
+        
+        st.error("⏰ El procesamiento del documento está tomando más tiempo del esperado")
+        return None
     except requests.exceptions.ConnectionError:
         st.error("No se puede conectar al backend. Verifica que los servicios estén ejecutándose.")
         return None
@@ -525,12 +550,21 @@ def modern_chat_page():
             "content": user_input
         })
         
-        # Procesar respuesta
-        with st.spinner("🤔 IA está pensando..."):
-            ai_response = process_chat_query(user_input, max_results, similarity_threshold)
-            
-            if ai_response:
-                st.session_state.modern_chat_history.append(ai_response)
+        # Procesar respuesta mostrando los tokens a medida que llegan
+        with chat_history_container:
+            st.markdown(f"""
+            <div class="user-message">
+                <strong>🙋‍♂️ Tú:</strong><br>
+                {user_input}
+            </div>
+            """, unsafe_allow_html=True)
+            response_placeholder = st.empty()
+            response_placeholder.markdown("🤔 IA está pensando...")
+        
+        ai_response = stream_chat_query(user_input, max_results, similarity_threshold, response_placeholder)
+        
+        if ai_response:
+            st.session_state.modern_chat_history.append(ai_response)
         
         st.rerun()
     
@@ -540,6 +574,7 @@ def modern_chat_page():
     with col_action1:
         if st.button("🗑️ Limpiar Chat", use_container_width=True):
             st.session_state.modern_chat_history = []
+            clear_chat_session()
             st.rerun()
     
     with col_action2:
@@ -628,6 +663,24 @@ def process_uploaded_document(uploaded_file):
     except Exception as e:
         st.error(f"❌ Error: {str(e)}")
 
+def get_chat_session_id():
+    """Identificador de sesión de chat (memoria de conversación en el backend)"""
+    if "chat_session_id" not in st.session_state:
+        st.session_state.chat_session_id = uuid.uuid4().hex
+    return st.session_state.chat_session_id
+
+def clear_chat_session():
+    """Limpia la memoria de la sesión en el backend y empieza una nueva"""
+    try:
+        requests.delete(
+            f"{API_BASE_URL}/api/chat/conversation/clear",
+            params={"session_id": get_chat_session_id()},
+            timeout=5
+        )
+    except Exception:
+        pass
+    st.session_state.chat_session_id = uuid.uuid4().hex
+
 def process_chat_query(question, max_results, similarity_threshold):
     """Procesa una consulta de chat y retorna la respuesta"""
     try:
@@ -636,7 +689,8 @@ def process_chat_query(question, max_results, similarity_threshold):
             json={
                 "question": question,
                 "max_results": max_results,
-                "similarity_threshold": similarity_threshold
+                "similarity_threshold": similarity_threshold,
+                "session_id": get_chat_session_id()
             },
             timeout=30
         )
@@ -676,6 +730,78 @@ def process_chat_query(question, max_results, similarity_threshold):
             "llm_used": "error"
         }
 
+def iter_sse_events(response):
+    """Recorre los eventos server-sent events de una respuesta en streaming"""
+    event_name, data_lines = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if event_name and data_lines:
+                yield event_name, json.loads("\n".join(data_lines))
+            event_name, data_lines = None, []
+        elif line.startswith("event:"):
+            event_name = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+def stream_chat_query(question, max_results, similarity_threshold, placeholder):
+    """Procesa una consulta de chat mostrando los tokens en `placeholder` según llegan"""
+    try:
+        with requests.post(
+            f"{API_BASE_URL}/api/chat/chat/stream",
+            json={
+                "question": question,
+                "max_results": max_results,
+                "similarity_threshold": similarity_threshold,
+                "session_id": get_chat_session_id()
+            },
+            stream=True,
+            timeout=(5, 90)  # conexión, espera máxima entre tokens
+        ) as response:
+            if response.status_code != 200:
+                # Backend sin streaming: usar el endpoint clásico
+                return process_chat_query(question, max_results, similarity_threshold)
+            
+            message = {"role": "assistant", "content": "", "documents": [], "confidence": 0, "llm_used": "unknown"}
+            for event_name, data in iter_sse_events(response):
+                if event_name == "sources":
+                    message["documents"] = data.get("relevant_documents", [])
+                    message["confidence"] = data.get("confidence_score", 0)
+                elif event_name == "token":
+                    message["content"] += data.get("content", "")
+                    placeholder.markdown(f"""
+                    <div class="ai-message">
+                        <strong>🤖 IA:</strong><br>
+                        {message['content']}▌
+                    </div>
+                    """, unsafe_allow_html=True)
+                elif event_name == "done":
+                    message["llm_used"] = data.get("llm_used", "unknown")
+                    message["timing"] = data
+                elif event_name == "error":
+                    message["content"] = f"❌ Error: {data.get('error', 'desconocido')}"
+                    message["llm_used"] = "error"
+            
+            if not message["content"]:
+                message["content"] = "No pude generar una respuesta."
+            return message
+            
+    except requests.exceptions.Timeout:
+        return {
+            "role": "assistant", 
+            "content": "⏰ La consulta está tomando más tiempo del esperado",
+            "documents": [],
+            "confidence": 0,
+            "llm_used": "timeout"
+        }
+    except Exception as e:
+        return {
+            "role": "assistant",
+            "content": f"❌ Error: {str(e)}",
+            "documents": [],
+            "confidence": 0,
+            "llm_used": "error"
+        }
+
 def generate_conversation_summary():
     """Genera un resumen de la conversación"""
     if not st.session_state.modern_chat_history:
@@ -1058,7 +1184,8 @@ def process_chat_message(question: str, max_results: int, similarity_threshold:
                 json={
                     "question": question,
                     "max_results": max_results,
-                    "similarity_threshold": similarity_threshold
+                    "similarity_threshold": similarity_threshold,
+                    "session_id": get_chat_session_id()
                 },
                 timeout=30
             )
@@ -1324,68 +1451,98 @@ def documents_page():
                         key="fragment_view_selector"
                     )
                     
+                    page_size = st.select_slider(
+                        "Fragmentos por página:", options=[20, 50, 100, 200], value=50,
+                        key="fragment_page_size"
+                    )
+                    
                     if st.button("🔍 Ver fragmentos"):
+                        # Cursores de las páginas visitadas (None = primera página)
+                        st.session_state['fragments_doc'] = selected_doc
+                        st.session_state['fragments_cursors'] = [None]
+                    
+                    if st.session_state.get('fragments_doc') == selected_doc:
+                        if st.session_state.get('fragments_page_size') != page_size:
+                            # Las páginas visitadas dependen del tamaño de página
+                            st.session_state['fragments_page_size'] = page_size
+                            st.session_state['fragments_cursors'] = [None]
+                        cursors = st.session_state.get('fragments_cursors', [None])
                         with st.spinner(f"📚 Cargando fragmentos de '{selected_doc}'..."):
                             try:
+                                params = {"limit": page_size, "fields": "preview,metadata"}
+                                if cursors[-1]:
+                                    params["cursor"] = cursors[-1]
                                 response = requests.get(
                                     f"{API_BASE_URL}/api/chat/documents/{selected_doc}/fragments",
+                                    params=params,
                                     timeout=30
                                 )
-                                
-                                if response.status_code == 200:
-                                    result = response.json()
-                                    if result.get('success', False):
-                                        fragments = result.get('fragments', [])
-                                        total_fragments = result.get('total_fragments', 0)
-                                        
-                                        st.success(f"📊 {total_fragments} fragmentos encontrados en '{selected_doc}'")
-                                        
-                                        for j, fragment in enumerate(fragments):
-                                            with st.expander(f"Fragmento {j+1} (ID: {fragment.get('id', 'N/A')[:8]}...)", expanded=False):
-                                                st.write(f"**Longitud:** {fragment.get('content_length', 0)} caracteres")
-                                                st.text_area(
-                                                    "Contenido:",
-                                                    fragment.get('content_preview', ''),
-                                                    height=100,
-                                                    disabled=True,
-                                                    key=f"fragment_content_{j}"
-                                                )
-                                                
-                                                # Metadatos del fragmento
-                                                metadata = fragment.get('metadata', {})
-                                                if metadata:
-                                                    st.json(metadata)
-                                                
-                                                # Botón para eliminar fragmento individual
-                                                if st.button(f"🗑️ Eliminar fragmento", key=f"delete_fragment_{j}"):
-                                                    fragment_id = fragment.get('id')
-                                                    if fragment_id:
-                                                        with st.spinner("Eliminando fragmento..."):
-                                                            try:
-                                                                del_response = requests.delete(
-                                                                    f"{API_BASE_URL}/api/chat/fragments",
-                                                                    json=[fragment_id],
-                                                                    timeout=30
-                                                                )
-                                                                
-                                                                if del_response.status_code == 200:
-                                                                    del_result = del_response.json()
-                                                                    if del_result.get('success', False):
-                                                                        st.success("✅ Fragmento eliminado")
-                                                                        st.rerun()
-                                                                    else:
-                                                                        st.error(f"❌ Error: {del_result.get('error')}")
-                                                                else:
-                                                                    st.error(f"❌ Error del servidor: {del_response.status_code}")
-                                                            except Exception as e:
-                                                                st.error(f"❌ Error: {str(e)}")
-                                    else:
-                                        st.error(f"❌ Error: {result.get('error', 'Error desconocido')}")
-                                else:
-                                    st.error(f"❌ Error del servidor: {response.status_code}")
-                                    
+                                result = response.json() if response.status_code in (200, 400, 404) else {}
                             except Exception as e:
+                                response, result = None, {}
                                 st.error(f"❌ Error: {str(e)}")
+                        
+                        if response is not None and response.status_code == 200 and result.get('success', False):
+                            fragments = result.get('fragments', [])
+                            total_fragments = result.get('total_fragments', 0)
+                            page_start = (len(cursors) - 1) * page_size
+                            
+                            st.success(
+                                f"📊 {total_fragments} fragmentos en '{selected_doc}' · "
+                                f"mostrando {page_start + 1}-{page_start + len(fragments)}"
+                            )
+                            
+                            for j, fragment in enumerate(fragments, start=page_start):
+                                with st.expander(f"Fragmento {fragment.get('fragment_index', j) + 1} (ID: {fragment.get('id', 'N/A')[:8]}...)", expanded=False):
+                                    st.write(f"**Longitud:** {fragment.get('content_length', 0)} caracteres")
+                                    st.text_area(
+                                        "Contenido:",
+                                        fragment.get('content_preview', ''),
+                                        height=100,
+                                        disabled=True,
+                                        key=f"fragment_content_{j}"
+                                    )
+                                    
+                                    # Metadatos del fragmento
+                                    metadata = fragment.get('metadata', {})
+                                    if metadata:
+                                        st.json(metadata)
+                                    
+                                    # Botón para eliminar fragmento individual
+                                    if st.button(f"🗑️ Eliminar fragmento", key=f"delete_fragment_{j}"):
+                                        fragment_id = fragment.get('id')
+                                        if fragment_id:
+                                            with st.spinner("Eliminando fragmento..."):
+                                                try:
+                                                    del_response = requests.delete(
+                                                        f"{API_BASE_URL}/api/chat/fragments",
+                                                        json=[fragment_id],
+                                                        timeout=30
+                                                    )
+                                                    
+                                                    if del_response.status_code == 200:
+                                                        del_result = del_response.json()
+                                                        if del_result.get('success', False):
+                                                            st.success("✅ Fragmento eliminado")
+                                                            st.rerun()
+                                                        else:
+                                                            st.error(f"❌ Error: {del_result.get('error')}")
+                                                    else:
+                                                        st.error(f"❌ Error del servidor: {del_response.status_code}")
+                                                except Exception as e:
+                                                    st.error(f"❌ Error: {str(e)}")
+                            
+                            col_pages = st.columns(2)
+                            with col_pages[0]:
+                                if len(cursors) > 1 and st.button("⬅️ Página anterior"):
+                                    st.session_state['fragments_cursors'] = cursors[:-1]
+                                    st.rerun()
+                            with col_pages[1]:
+                                if result.get('next_cursor') and st.button("Página siguiente ➡️"):
+                                    st.session_state['fragments_cursors'] = cursors + [result['next_cursor']]
+                                    st.rerun()
+                        elif response is not None:
+                            st.error(f"❌ Error: {result.get('error', f'Error del servidor: {response.status_code}')}")
                 
                 if st.button("❌ Cerrar vista de fragmentos"):
                     st.session_state['show_fragments_view'] = False
@@ -1679,10 +1836,10 @@ def chat_page():
                     st.error("❌ Ollama Desconectado")
             
             with col2:
-                if llm_status.get("langchain_available", False):
-                    st.success("🔗 LangChain Activo")
+                if llm_status.get("model_available", False):
+                    st.success(f"🧠 Modelo {llm_status.get('model_name', '')} disponible")
                 else:
-                    st.warning("⚠️ LangChain No Disponible")
+                    st.warning("⚠️ Modelo No Disponible")
             
             with col3:
                 vector_db = status_data.get("vector_database", {})
@@ -1742,8 +1899,8 @@ def chat_page():
                                 st.write(f"**Método:** {metadata.get('method', 'N/A')}")
                                 st.write(f"**Fragmentos usados:** {metadata.get('relevant_documents', 0)}")
                             with col2:
-                                if metadata.get('langchain_used'):
-                                    st.success("🔗 LangChain utilizado")
+                                if metadata.get('method') == 'fallback':
+                                    st.warning("⚠️ Respuesta de respaldo")
                                 else:
                                     st.info("🤖 Ollama directo")
     
@@ -1783,7 +1940,8 @@ def chat_page():
                 chat_request = {
                     "question": user_question,
                     "max_results": max_results,
-                    "similarity_threshold": similarity_threshold
+                    "similarity_threshold": similarity_threshold,
+                    "session_id": get_chat_session_id()
                 }
                 
                 response = requests.post(
@@ -1802,8 +1960,7 @@ def chat_page():
                         answer = chat_response.get("response", "No se recibió respuesta")
                         metadata = {
                             "method": chat_response.get("method", "unknown"),
-                            "relevant_documents": chat_response.get("relevant_documents", 0),
-                            "langchain_used": chat_response.get("langchain_used", False)
+                            "relevant_documents": chat_response.get("relevant_documents", 0)
                         }
                     
                     # Agregar respuesta al historial
@@ -1824,8 +1981,8 @@ def chat_page():
                                     st.write(f"**Método:** {metadata.get('method', 'N/A')}")
                                     st.write(f"**Fragmentos usados:** {metadata.get('relevant_documents', 0)}")
                                 with col2:
-                                    if metadata.get('langchain_used'):
-                                        st.success("🔗 LangChain utilizado")
+                                    if metadata.get('method') == 'fallback':
+                                        st.warning("⚠️ Respuesta de respaldo")
                                     else:
                                         st.info("🤖 Ollama directo")
                 else:
@@ -1868,6 +2025,7 @@ def chat_page():
     # Procesar limpieza de chat
     if clear_button:
         st.session_state.chat_history = []
+        clear_chat_session()
         st.session_state.chat_input_key += 1
         st.success("🗑️ Chat limpiado exitosamente")
         st.rerun()
@@ -1935,7 +2093,7 @@ def chat_page():
         
         **Estado del sistema:**
         - Backend: {API_BASE_URL}
-        - LLM: {"Ollama + LangChain" if llm_status.get("langchain_available") else "Ollama directo"}
+        - LLM: Ollama ({llm_status.get("model_name", "N/A")})
         - Base vectorial: ChromaDB
         """)
 